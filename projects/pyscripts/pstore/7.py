@@ -1,281 +1,863 @@
+from __future__ import annotations
+
 import time
 import logging
 from datetime import datetime, timezone, timedelta
-from google.cloud import monitoring_v3
-from google.cloud.monitoring_v3.services.metric_service import pagers
 import argparse
-import subprocess
-import yaml  # Added import for YAML parsing
+import json
+import functools
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import TYPE_CHECKING
+# Keep this import block light: numpy, the Monitoring client, google.auth and requests are imported
+# where they are first needed, so --help, argument errors and --offline runs start fast (see psstartup.py).
+import psapi
+import psbackend
+import psclient
+import pscache
+import psexport
+import psheatmap
+import pshistory
+import psinstances
+import psinstrument
+import pslogging
+import psquota
+import psrefine
+import psregistry
+import psseries
+import psshard
+import pssketch
+
+if TYPE_CHECKING:
+    from google.cloud.monitoring_v3.services.metric_service import pagers
 
 # --- Configuration Section ---
 CONFIG = {
     "parallelstore": {
         "region": "us-central1"
+    },
+    # Shared Monitoring client/channel settings (see psclient.CLIENT_CONFIG for what each one does).
+    "monitoring_client": {
+        "keepalive_time_ms": 30000,
+        "keepalive_timeout_ms": 10000,
+        "max_message_mb": -1,
+        "per_project": False
     }
 }
 
 # --- Logging Setup ---
+# Handlers are attached to the root logger in __main__ by pslogging.setup_logging(), so records from the
+# ps* module loggers (retries, shards, cache) reach the same outputs: a queue feeds a background listener
+# that writes the size-rotated human log, a JSON-lines log and the console, so logging never blocks fetches.
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
-file_handler = logging.FileHandler('parallelstore_metrics_over_time.log', mode='a')
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-file_handler.setFormatter(formatter)
-logger.addHandler(file_handler)
-stream_handler = logging.StreamHandler()
-stream_handler.setFormatter(formatter)
-logger.addHandler(stream_handler)
 # --- End Logging Setup ---
 
-def fetch_metric(
+def fetch_metric_stats(
     metric_type: str,
     project_id_str: str,
     instance_id_str: str,
     query_start_time: datetime,
     query_end_time: datetime
-) -> float | None:
+) -> psseries.RateStats:
     """
     Queries the Google Cloud Monitoring API for a specific Parallelstore metric.
-    It calculates the rate of the metric over 60-second intervals and returns the maximum
-    rate observed within the specified query_start_time and query_end_time.
-    """
-    client = monitoring_v3.MetricServiceClient()
-    project_name = f"projects/{project_id_str}"
-    start_time_seconds = int(query_start_time.timestamp())
-    end_time_seconds = int(query_end_time.timestamp())
-    interval = monitoring_v3.types.TimeInterval(
-        end_time={"seconds": end_time_seconds},
-        start_time={"seconds": start_time_seconds}
-    )
-    aggregation = monitoring_v3.types.Aggregation(
-        alignment_period={"seconds": 60},
-        per_series_aligner=monitoring_v3.types.Aggregation.Aligner.ALIGN_RATE,
-        cross_series_reducer=monitoring_v3.types.Aggregation.Reducer.REDUCE_MAX
-    )
-    filter_str = f'metric.type="{metric_type}" AND resource.type = "parallelstore.googleapis.com/Instance" AND resource.label.instance_id="{instance_id_str}"'
-    request = monitoring_v3.types.ListTimeSeriesRequest(
-        name=project_name,
-        filter=filter_str,
-        interval=interval,
-        view=monitoring_v3.types.ListTimeSeriesRequest.TimeSeriesView.FULL,
-        aggregation=aggregation
-    )
+    It calculates the rate of the metric over 60-second intervals and reduces the result pages
+    as they stream in to running max/min/sum/count plus the timestamp of the peak, in constant memory.
+    """
+    client = psclient.get_metric_client(project_id_str)
+    request = psseries.build_rate_request(metric_type, project_id_str, instance_id_str, query_start_time, query_end_time)
     logger.debug(f"Fetching metric: {metric_type} for instance: {instance_id_str} in project: {project_id_str}")
     logger.debug(f"Query Window: {query_start_time.isoformat()} to {query_end_time.isoformat()}")
-    logger.debug(f"Filter: {filter_str}")
+    logger.debug(f"Filter: {request.filter}")
     logger.debug(f"Aggregation: Aligner=ALIGN_RATE, Alignment Period=60s, Reducer=REDUCE_MAX")
 
     try:
         results: pagers.ListTimeSeriesPager = client.list_time_series(request=request)
-        values = []
-        for page in results.pages:
-            for ts in page.time_series:
-                for point in ts.points:
-                    if point.value.double_value is not None:
-                        values.append(point.value.double_value)
-                    elif point.value.int64_value is not None:
-                         values.append(float(point.value.int64_value))
-        logger.debug(f"Rate values for {metric_type} (from {query_start_time.strftime('%Y-%m-%d')} to {query_end_time.strftime('%Y-%m-%d')}): {values}")
-        return max(values) if values else None
+        stats = psseries.reduce_rate_pages(results.pages)
+        logger.debug(f"Rate stats for {metric_type} (from {query_start_time.strftime('%Y-%m-%d')} to {query_end_time.strftime('%Y-%m-%d')}): {stats}")
+        return stats
     except Exception as e:
         logger.error(f"Error fetching metric {metric_type} for {instance_id_str} over window {query_start_time.isoformat()} to {query_end_time.isoformat()}: {e}", exc_info=True)
         raise
 
-def get_instance_details(project_id: str, instance_id: str) -> dict | None:
+
+def fetch_metric(
+    metric_type: str,
+    project_id_str: str,
+    instance_id_str: str,
+    query_start_time: datetime,
+    query_end_time: datetime
+) -> float | None:
+    """
+    Returns the maximum 60-second rate of the metric within query_start_time and query_end_time
+    (None when there are no points). Use fetch_metric_stats for the peak timestamp and other aggregates.
+    """
+    return fetch_metric_stats(metric_type, project_id_str, instance_id_str, query_start_time, query_end_time).maximum
+
+
+def fetch_metrics_stats(
+    metric_types: list[str],
+    project_id_str: str,
+    instance_id_str: str,
+    query_start_time: datetime,
+    query_end_time: datetime,
+    point_sink=None
+) -> dict[str, psseries.RateStats]:
+    """
+    fetch_metric_stats for several metrics with a single ListTimeSeries call (metric.type = one_of(...)),
+    split by metric type as the pages stream in. Metrics without points get an empty RateStats.
+    point_sink (e.g. psexport.ReportExporter.write_points) also receives the raw points of every series.
+    """
+    logger.debug(f"Fetching metrics: {', '.join(metric_types)} for instance: {instance_id_str} in project: {project_id_str}")
+    logger.debug(f"Query Window: {query_start_time.isoformat()} to {query_end_time.isoformat()}")
+
+    try:
+        return psseries.fetch_metrics_stats(metric_types, project_id_str, instance_id_str, query_start_time, query_end_time, point_sink)
+    except Exception as e:
+        logger.error(f"Error fetching metrics {', '.join(metric_types)} for {instance_id_str} over window {query_start_time.isoformat()} to {query_end_time.isoformat()}: {e}", exc_info=True)
+        raise
+
+
+def get_instance_details(project_id: str, instance_id: str, cache: psinstances.InstanceMetadataCache | None = None, refresh: bool = False) -> dict | None:
     """
-    Retrieves details of a Parallelstore instance using gcloud.
+    Retrieves details of a Parallelstore instance from the Parallelstore API in-process
+    (one instances.list call across all locations, no gcloud process), reusing `cache` while it is fresh.
     """
+    import requests
+
     logger.info(f"Fetching details for Parallelstore Instance: {instance_id} in project: {project_id}")
     try:
-        command = [
-            "gcloud", "beta", "parallelstore", "instances", "describe",
-            instance_id,
-            "--project", project_id,
-            "--format", "yaml"  # Request YAML output
-        ]
-        result = subprocess.run(command, capture_output=True, text=True, check=True)
-        instance_data = yaml.safe_load(result.stdout)
+        instance_data = psinstances.get_instance(project_id, instance_id, cache, refresh)
         if instance_data:
             logger.debug(f"Instance details: {instance_data}")
             return instance_data
         else:
            logger.warning(f"No instance data found for {instance_id} in {project_id}")
            return None
-    except subprocess.CalledProcessError as e:
-        logger.error(f"Error getting instance details for {instance_id} in {project_id}: {e}. stderr: {e.stderr}", exc_info=True)
-        return None
-    except yaml.YAMLError as e:
-        logger.error(f"Error parsing YAML output for {instance_id} in {project_id}: {e}", exc_info=True)
+    except requests.exceptions.HTTPError as e:
+        logger.error(f"Error getting instance details for {instance_id} in {project_id}: {e}. response: {e.response.text if e.response is not None else ''}", exc_info=True)
         return None
     except Exception as e:
         logger.error(f"An unexpected error occurred getting instance details for {instance_id} in {project_id}: {e}", exc_info=True)
         return None
 
 
-def log_daily_performance_over_period(start_date_overall: datetime, end_date_overall: datetime, project_id: str, instance_id: str):
+EXPECTED_IOPS_PER_SECOND = 30000
+EXPECTED_THROUGHPUT_MBPS = 1150
+
+READ_IOPS_METRIC = psregistry.METRICS["read_ops"].metric_type
+WRITE_OPS_METRIC = psregistry.METRICS["write_ops"].metric_type
+# Fetched together in one one_of request per window; --extra_metrics adds to the same request.
+REPORT_METRICS = [READ_IOPS_METRIC, WRITE_OPS_METRIC]
+# Cloud Monitoring publishes Parallelstore points a few minutes late, so every --watch poll asks again for
+# this much before the previous poll's end; points already seen are skipped by RollingPeak.
+WATCH_INGEST_LAG_SECONDS = 5 * 60
+# Removed throughput_metric = "parallelstore.googleapis.com/instance/transferred_byte_count"
+
+
+def summarize_daily_peaks(date_label: str, daily_peak_read_iops: float | None, daily_peak_write_iops: float | None, log_results: bool = True, extra_peaks: dict[str, float | None] | None = None) -> dict:
+    """
+    Derives the throughput figures for one reporting window from its peak read/write rates,
+    logs them with the benchmark verdict (unless log_results is False) and returns the summary dict for the window.
+    extra_peaks ({metric_type: peak rate}, from --extra_metrics) are logged in their registry unit and
+    added to the dict as peak_<registry name>.
+    """
+    daily_peak_read_throughput_mbps = None
+    daily_peak_write_throughput_mbps = None
+    daily_peak_total_throughput_mbps = None
+    day_met_iops_benchmark = None
+    day_met_throughput_benchmark = None
+
+    # Fetching read and write throughput (bytes/second)
+    # Assuming 1 operation = 1 byte for this example (the conversion is declared in psregistry).
+    daily_peak_read_throughput_mbps = psregistry.METRICS["read_ops"].to_mbps(daily_peak_read_iops)
+    daily_peak_write_throughput_mbps = psregistry.METRICS["write_ops"].to_mbps(daily_peak_write_iops)
+
+    # Calculate total throughput
+    if daily_peak_read_throughput_mbps is not None and daily_peak_write_throughput_mbps is not None:
+        daily_peak_total_throughput_mbps = daily_peak_read_throughput_mbps + daily_peak_write_throughput_mbps
+    elif daily_peak_read_throughput_mbps is not None:
+        daily_peak_total_throughput_mbps = daily_peak_read_throughput_mbps
+    elif daily_peak_write_throughput_mbps is not None:
+        daily_peak_total_throughput_mbps = daily_peak_write_throughput_mbps
+
+    if daily_peak_total_throughput_mbps is not None:
+        day_met_throughput_benchmark = daily_peak_total_throughput_mbps >= EXPECTED_THROUGHPUT_MBPS
+
+    summary = {
+        "date": date_label,
+        "peak_read_iops_ops_sec": daily_peak_read_iops,
+        "peak_write_iops_ops_sec": daily_peak_write_iops,
+        "peak_total_throughput_mbps": daily_peak_total_throughput_mbps,
+        "peak_read_throughput_mbps": daily_peak_read_throughput_mbps,
+        "peak_write_throughput_mbps": daily_peak_write_throughput_mbps,
+        "met_iops_benchmark": day_met_iops_benchmark,
+        "met_throughput_benchmark": day_met_throughput_benchmark
+    }
+    for metric_type, peak in (extra_peaks or {}).items():
+        summary[f"peak_{psregistry.get(metric_type).name}"] = peak
+
+    if log_results:
+        # A copy of the summary dict rides along on each window's first line for the JSON-lines log
+        # (copied because fleet callers add fields to it while the record may still be queued).
+        if daily_peak_read_iops is None and daily_peak_write_iops is None and daily_peak_total_throughput_mbps is None:
+            logger.info(f"No significant performance metrics (IOPS or Throughput) found for {date_label}.", extra={"summary": dict(summary)})
+        else:
+            logger.info(f"Results for {date_label}:", extra={"summary": dict(summary)})
+            if daily_peak_read_iops is not None:
+                logger.info(f"  Peak Read IOPS (rate): {daily_peak_read_iops:.2f} ops/sec")
+            else:
+                logger.info(f"  Peak Read IOPS (rate): No data")
+            if daily_peak_write_iops is not None:
+               logger.info(f"  Peak Write IOPS (rate): {daily_peak_write_iops:.2f} ops/sec")
+            else:
+               logger.info(f"  Peak Write IOPS (rate): No data")
+
+            if daily_peak_total_throughput_mbps is not None:
+              logger.info(f"  Peak Total Throughput (rate): {daily_peak_total_throughput_mbps:.2f} MBps")
+              if day_met_throughput_benchmark:
+                    logger.info(f"    Throughput Benchmark (Expected >= {EXPECTED_THROUGHPUT_MBPS} MBps): PASSED")
+              else:
+                    logger.warning(f"    Throughput Benchmark (Expected >= {EXPECTED_THROUGHPUT_MBPS} MBps): FAILED or BELOW THRESHOLD")
+            else:
+              logger.info(f"  Peak Total Throughput (rate): No data")
+              logger.warning(f"    Throughput Benchmark: NO DATA for {date_label}")
+
+            if daily_peak_read_throughput_mbps is not None:
+                logger.info(f"  Peak Read Throughput (rate): {daily_peak_read_throughput_mbps:.2f} MBps")
+            else:
+                logger.info(f"  Peak Read Throughput (rate): No data")
+            if daily_peak_write_throughput_mbps is not None:
+                logger.info(f"  Peak Write Throughput (rate): {daily_peak_write_throughput_mbps:.2f} MBps")
+            else:
+               logger.info(f"  Peak Write Throughput (rate): No data")
+            for metric_type, peak in (extra_peaks or {}).items():
+                spec = psregistry.get(metric_type)
+                if peak is not None:
+                    logger.info(f"  Peak {spec.label} (rate): {peak:.2f} {spec.unit} ({spec.to_mbps(peak):.2f} MBps)")
+                else:
+                    logger.info(f"  Peak {spec.label} (rate): No data")
+
+    return summary
+
+
+def combine_point_sinks(*point_sinks):
+    """One point sink that feeds each of the given ones (None entries are skipped); None if there are none."""
+    point_sinks = [point_sink for point_sink in point_sinks if point_sink is not None]
+    if len(point_sinks) <= 1:
+        return point_sinks[0] if point_sinks else None
+
+    def _sink(*args):
+        for point_sink in point_sinks:
+            point_sink(*args)
+    return _sink
+
+
+def log_daily_performance_over_period(start_date_overall: datetime, end_date_overall: datetime, project_id: str, instance_id: str, concurrency: int = 1, extra_metrics: list[str] | None = None, exporter: psexport.ReportExporter | None = None, point_sink=None, fetch_stats=None):
     """
     Fetches and logs daily peak performance metrics (Read IOPS and Throughput)
     for the configured Parallelstore instance over a specified date range.
-    It iterates day by day, queries metrics for each day, and logs the results.
+    Each day is one batched query for REPORT_METRICS plus extra_metrics, streamed from psapi.iter_daily_peaks
+    on `concurrency` workers sharing the one Monitoring client; results are logged day by day in date order as they complete.
     If no significant metrics are found for a day, detailed printing is skipped.
+    exporter, if given, receives each day's summary as it is logged (and the raw points, if it exports them).
+    point_sink, if given, also receives every fetched point (e.g. pssketch.SketchRecorder.add_points).
+    fetch_stats replaces fetch_metrics_stats for the per-day query (e.g. pshistory.StoredPeakFetcher).
     """
+    logger.info(f"===================================================================================")
+    logger.info(f"Fetching Daily Peak Performance for Parallelstore Instance: {instance_id}")
+    logger.info(f"Project: {project_id}")
+    logger.info(f"Period: {start_date_overall.strftime('%Y-%m-%d')} to {end_date_overall.strftime('%Y-%m-%d')} (UTC)")
+    logger.info(f"===================================================================================")
+
+    all_daily_results_summary = []
+    extra_metrics = extra_metrics or []
+    metric_types = REPORT_METRICS + [metric for metric in extra_metrics if metric not in REPORT_METRICS]
+    point_sink = combine_point_sinks(exporter.point_sink if exporter else None, point_sink)
 
-    EXPECTED_IOPS_PER_SECOND = 30000
-    EXPECTED_THROUGHPUT_MBPS = 1150
+    # Read + write ops (and extra_metrics) in one call per day; closing the generator on an abort
+    # (e.g. Ctrl-C) drops the queued days instead of draining the whole range.
+    daily_records = psapi.iter_daily_peaks(project_id, instance_id, start_date_overall, end_date_overall, metric_types, concurrency, point_sink=point_sink, fetch_stats=fetch_stats or fetch_metrics_stats)
+    try:
+        for record in daily_records:
+            logger.info(f"--- Querying data for: {record.date} ---")
 
-    read_iops_metric = "parallelstore.googleapis.com/instance/read_ops_count"
-    write_ops_metric = "parallelstore.googleapis.com/instance/write_ops_count" # Added write ops metric
-    # Removed throughput_metric = "parallelstore.googleapis.com/instance/transferred_byte_count"
+            if record.error is not None:
+                logger.error(f"Error retrieving or processing metrics for {record.date}: {record.error}", exc_info=record.error)
+            daily_peaks = record.peaks
 
+            daily_summary = summarize_daily_peaks(
+                record.date, daily_peaks.get(READ_IOPS_METRIC), daily_peaks.get(WRITE_OPS_METRIC),
+                extra_peaks={metric: daily_peaks.get(metric) for metric in extra_metrics}
+            )
+            all_daily_results_summary.append(daily_summary)
+            if exporter:
+                exporter.write_summary(project_id, instance_id, daily_summary)
+            logger.info("-----------------------------------------------------------------------------------")
+    finally:
+        daily_records.close()
+
+    logger.info("===================================================================================")
+    logger.info("Daily performance fetching completed for the specified period.")
+    logger.info("===================================================================================")
+    return all_daily_results_summary
+
+
+def log_bucketed_performance_over_period(start_date_overall: datetime, end_date_overall: datetime, project_id: str, instance_id: str, granularity: str = "day", backend=None, extra_metrics: list[str] | None = None, exporter: psexport.ReportExporter | None = None):
+    """
+    Whole-period variant of log_daily_performance_over_period.
+    Each metric is fetched with a single paginated query covering the entire date range, and the
+    60-second rate points are bucketed client-side (hour, day or week) with a vectorized group-by-max.
+    Produces the same summary dicts, one per bucket, with "date" holding the bucket label.
+    backend selects how bucket peaks are computed (see psbackend): raw points reduced locally (default,
+    optionally cache-backed) or a server-side PromQL rollup. With the raw backend all metrics, including
+    extra_metrics, come from a single batched request.
+    exporter receives the bucket summaries; give the raw backend exporter.point_sink to export the points too.
+    """
+    backend = backend or psbackend.RawPointsBackend()
+    extra_metrics = extra_metrics or []
     logger.info(f"===================================================================================")
-    logger.info(f"Fetching Daily Peak Performance for Parallelstore Instance: {instance_id}")
+    logger.info(f"Fetching Peak Performance ({granularity} buckets, whole-period query, {backend.name} backend) for Parallelstore Instance: {instance_id}")
     logger.info(f"Project: {project_id}")
     logger.info(f"Period: {start_date_overall.strftime('%Y-%m-%d')} to {end_date_overall.strftime('%Y-%m-%d')} (UTC)")
     logger.info(f"===================================================================================")
 
-    all_daily_results_summary = []
+    windows = psseries.bucket_windows(start_date_overall, end_date_overall, granularity)
+    metric_types = REPORT_METRICS + [metric for metric in extra_metrics if metric not in REPORT_METRICS]
+    no_data = [None] * len(windows)
+    peaks_by_metric = {}
+    try:
+        peaks_by_metric = backend.bucket_peaks_many(metric_types, project_id, instance_id, windows, granularity)
+    except Exception as e:
+        logger.error(f"Error retrieving or processing metrics for {start_date_overall.strftime('%Y-%m-%d')} to {end_date_overall.strftime('%Y-%m-%d')}: {e}", exc_info=True)
+
+    all_results_summary = []
+    for window_index, (bucket_start, _) in enumerate(windows):
+        bucket_summary = summarize_daily_peaks(
+            psseries.bucket_label(bucket_start, granularity),
+            peaks_by_metric.get(READ_IOPS_METRIC, no_data)[window_index],
+            peaks_by_metric.get(WRITE_OPS_METRIC, no_data)[window_index],
+            extra_peaks={metric: peaks_by_metric.get(metric, no_data)[window_index] for metric in extra_metrics}
+        )
+        all_results_summary.append(bucket_summary)
+        if exporter:
+            exporter.write_summary(project_id, instance_id, bucket_summary)
+        logger.info("-----------------------------------------------------------------------------------")
 
-    current_day_iterator = start_date_overall
-    while current_day_iterator <= end_date_overall:
-        day_start_time = datetime(current_day_iterator.year, current_day_iterator.month, current_day_iterator.day, 0, 0, 0, tzinfo=timezone.utc)
-        day_end_time = datetime(current_day_iterator.year, current_day_iterator.month, current_day_iterator.day, 23, 59, 59, tzinfo=timezone.utc)
+    logger.info("===================================================================================")
+    logger.info("Performance fetching completed for the specified period.")
+    logger.info("===================================================================================")
+    return all_results_summary
 
-        logger.info(f"--- Querying data for: {current_day_iterator.strftime('%Y-%m-%d')} ---")
 
-        daily_peak_read_iops = None
-        daily_peak_write_iops = None  # Added write iops
-        daily_peak_read_throughput_mbps = None
-        daily_peak_write_throughput_mbps = None # Added write throughput
-        daily_peak_total_throughput_mbps = None # Added total throughput
-        day_met_iops_benchmark = None
-        day_met_throughput_benchmark = None
+def validate_performance_window(project_id: str, instance_id: str, window_start: datetime, window_end: datetime, client_results: dict | None = None) -> dict:
+    """
+    The archived validate_parallelstore_metrics check for an exact test window (e.g. the one psload.py
+    just drove): the peak 60-second read/write IOPS and transferred-bytes throughput Cloud Monitoring saw
+    between window_start and window_end, checked against EXPECTED_IOPS_PER_SECOND (higher of read and write)
+    and EXPECTED_THROUGHPUT_MBPS (real bytes, 10^6 bytes per MB). client_results ({"read_iops", "write_iops",
+    "throughput_mbps"} as measured by the load generator) are logged alongside. Returns the verdict dict.
+    """
+    throughput_metric = psregistry.METRICS["transferred_bytes"]
+    logger.info(f"===================================================================================")
+    logger.info(f"Validating Parallelstore Instance: {instance_id} (project {project_id})")
+    logger.info(f"Window: {window_start.isoformat()} to {window_end.isoformat()} (UTC)")
+    logger.info(f"===================================================================================")
+    stats = fetch_metrics_stats([READ_IOPS_METRIC, WRITE_OPS_METRIC, throughput_metric.metric_type], project_id, instance_id, window_start, window_end)
+    read_iops = stats[READ_IOPS_METRIC].maximum
+    write_iops = stats[WRITE_OPS_METRIC].maximum
+    throughput_mbps = throughput_metric.to_mbps(stats[throughput_metric.metric_type].maximum)
+    peak_iops = max((iops for iops in (read_iops, write_iops) if iops is not None), default=None)
+    result = {
+        "window_start": window_start.isoformat(),
+        "window_end": window_end.isoformat(),
+        "peak_read_iops_ops_sec": read_iops,
+        "peak_write_iops_ops_sec": write_iops,
+        "peak_throughput_mbps": throughput_mbps,
+        "met_iops_benchmark": peak_iops is not None and peak_iops >= EXPECTED_IOPS_PER_SECOND,
+        "met_throughput_benchmark": throughput_mbps is not None and throughput_mbps >= EXPECTED_THROUGHPUT_MBPS,
+    }
+    client_results = client_results or {}
 
-        try:
-            daily_peak_read_iops = fetch_metric(
-                read_iops_metric, project_id, instance_id, day_start_time, day_end_time
-            )
-            daily_peak_write_iops = fetch_metric( # Fetch write ops
-                write_ops_metric, project_id, instance_id, day_start_time, day_end_time
-            )
+    def _fmt(value: float | None) -> str:
+        return f"{value:.2f}" if value is not None else "No data"
+    logger.info(f"  Peak Read IOPS (rate): {_fmt(read_iops)} ops/sec (client average: {_fmt(client_results.get('read_iops'))})")
+    logger.info(f"  Peak Write IOPS (rate): {_fmt(write_iops)} ops/sec (client average: {_fmt(client_results.get('write_iops'))})")
+    logger.info(f"  Peak Throughput (rate): {_fmt(throughput_mbps)} MBps (client average: {_fmt(client_results.get('throughput_mbps'))})")
+    if result["met_iops_benchmark"]:
+        logger.info(f"    IOPS Benchmark (Expected >= {EXPECTED_IOPS_PER_SECOND} ops/sec): PASSED")
+    else:
+        logger.warning(f"    IOPS Benchmark (Expected >= {EXPECTED_IOPS_PER_SECOND} ops/sec): FAILED or BELOW THRESHOLD")
+    if result["met_throughput_benchmark"]:
+        logger.info(f"    Throughput Benchmark (Expected >= {EXPECTED_THROUGHPUT_MBPS} MBps): PASSED")
+    else:
+        logger.warning(f"    Throughput Benchmark (Expected >= {EXPECTED_THROUGHPUT_MBPS} MBps): FAILED or BELOW THRESHOLD")
+    logger.info("===================================================================================")
+    return result
 
-            # Fetching read and write throughput (bytes/second)
-            # Assuming 1 operation = 1 byte for this example, adjust if it's different for your case.
-            if daily_peak_read_iops is not None:
-                daily_peak_read_throughput_mbps = daily_peak_read_iops / (1000**2)
-            if daily_peak_write_iops is not None:
-                daily_peak_write_throughput_mbps = daily_peak_write_iops / (1000**2)
-
-            # Calculate total throughput
-            if daily_peak_read_throughput_mbps is not None and daily_peak_write_throughput_mbps is not None:
-                daily_peak_total_throughput_mbps = daily_peak_read_throughput_mbps + daily_peak_write_throughput_mbps
-            elif daily_peak_read_throughput_mbps is not None:
-                daily_peak_total_throughput_mbps = daily_peak_read_throughput_mbps
-            elif daily_peak_write_throughput_mbps is not None:
-                daily_peak_total_throughput_mbps = daily_peak_write_throughput_mbps
-
-            if daily_peak_read_iops is None and daily_peak_write_iops is None and daily_peak_total_throughput_mbps is None:
-                logger.info(f"No significant performance metrics (IOPS or Throughput) found for {current_day_iterator.strftime('%Y-%m-%d')}.")
-            else:
-                logger.info(f"Results for {current_day_iterator.strftime('%Y-%m-%d')}:")
-                if daily_peak_read_iops is not None:
-                    logger.info(f"  Peak Read IOPS (rate): {daily_peak_read_iops:.2f} ops/sec")
-                else:
-                    logger.info(f"  Peak Read IOPS (rate): No data")
-                if daily_peak_write_iops is not None:
-                   logger.info(f"  Peak Write IOPS (rate): {daily_peak_write_iops:.2f} ops/sec")
-                else:
-                   logger.info(f"  Peak Write IOPS (rate): No data")
-
-                if daily_peak_total_throughput_mbps is not None:
-                  logger.info(f"  Peak Total Throughput (rate): {daily_peak_total_throughput_mbps:.2f} MBps")
-                  day_met_throughput_benchmark = daily_peak_total_throughput_mbps >= EXPECTED_THROUGHPUT_MBPS
-                  if day_met_throughput_benchmark:
-                        logger.info(f"    Throughput Benchmark (Expected >= {EXPECTED_THROUGHPUT_MBPS} MBps): PASSED")
-                  else:
-                        logger.warning(f"    Throughput Benchmark (Expected >= {EXPECTED_THROUGHPUT_MBPS} MBps): FAILED or BELOW THRESHOLD")
-                else:
-                  logger.info(f"  Peak Total Throughput (rate): No data")
-                  logger.warning(f"    Throughput Benchmark: NO DATA for {current_day_iterator.strftime('%Y-%m-%d')}")
 
-                if daily_peak_read_throughput_mbps is not None:
-                    logger.info(f"  Peak Read Throughput (rate): {daily_peak_read_throughput_mbps:.2f} MBps")
-                else:
-                    logger.info(f"  Peak Read Throughput (rate): No data")
-                if daily_peak_write_throughput_mbps is not None:
-                    logger.info(f"  Peak Write Throughput (rate): {daily_peak_write_throughput_mbps:.2f} MBps")
-                else:
-                   logger.info(f"  Peak Write Throughput (rate): No data")
-
-
-        except Exception as e:
-            logger.error(f"Error retrieving or processing metrics for {current_day_iterator.strftime('%Y-%m-%d')}: {e}", exc_info=True)
-        
-        all_daily_results_summary.append({
-            "date": current_day_iterator.strftime('%Y-%m-%d'),
-            "peak_read_iops_ops_sec": daily_peak_read_iops,
-            "peak_write_iops_ops_sec": daily_peak_write_iops,
-            "peak_total_throughput_mbps": daily_peak_total_throughput_mbps,
-            "peak_read_throughput_mbps": daily_peak_read_throughput_mbps,
-            "peak_write_throughput_mbps": daily_peak_write_throughput_mbps,
-            "met_iops_benchmark": day_met_iops_benchmark,
-            "met_throughput_benchmark": day_met_throughput_benchmark
-        })
-
-        current_day_iterator += timedelta(days=1)
+def log_heatmaps(recorder: psheatmap.HeatmapRecorder, path: str) -> list[str]:
+    """
+    Logs when during the day each instance/metric peaked (the day's peak minute and the busiest minute of
+    day across the period, from the heatmap's row and column maxima) and writes the heatmaps to path.
+    """
+    heatmaps = recorder.heatmaps()
+    for (_, instance_id, metric_type), matrix in heatmaps.items():
+        spec = psregistry.get(metric_type)
+        cell = psheatmap.peak_cell(matrix)
+        if cell is None:
+            logger.info(f"Heatmap {instance_id} {spec.label}: No data")
+            continue
+        day_index, minute = cell
+        minute_peaks = psheatmap.column_maxima(matrix)
+        busiest_minute = psheatmap.busiest_minutes(minute_peaks, 1)[0]
+        peak_date = (recorder.first_day + timedelta(days=day_index)).strftime('%Y-%m-%d')
+        logger.info(
+            f"Heatmap {instance_id} {spec.label}: peak {matrix[day_index, minute]:.2f} {spec.unit} on {peak_date} at {psheatmap.minute_label(minute)} UTC; "
+            f"busiest minute of day {psheatmap.minute_label(busiest_minute)} UTC (up to {minute_peaks[busiest_minute]:.2f} {spec.unit})"
+        )
+    paths = psheatmap.write_heatmaps(path, heatmaps, recorder.first_day)
+    logger.info(f"Wrote {len(heatmaps)} heatmap(s) to {', '.join(paths) if paths else path}")
+    return paths
+
+
+def log_sketch_percentiles(store: pssketch.SketchStore, start_date_overall: datetime, end_date_overall: datetime, project_id: str, instance_ids: list[str], metric_types: list[str], quantiles: list[float]) -> dict[str, dict[str, dict]]:
+    """
+    Logs percentiles of the 60-second rates over the whole period for each instance and metric, merged
+    from the per-day sketches in store (written by this or earlier runs), so no points are fetched.
+    Returns {instance_id: {metric_type: {"days": days with a sketch, "points": n, "p50": ..., ...}}}.
+    """
+    days = pssketch.day_labels(start_date_overall, end_date_overall)
+    logger.info(f"===================================================================================")
+    logger.info(f"Percentiles of 60-second rates from stored daily sketches ({store.path})")
+    logger.info(f"Period: {days[0]} to {days[-1]} (UTC), {len(days)} day(s)")
+    logger.info(f"===================================================================================")
+    results = {}
+    for instance_id in instance_ids:
+        logger.info(f"Instance: {instance_id}")
+        results[instance_id] = {}
+        for metric_type in metric_types:
+            spec = psregistry.get(metric_type)
+            sketch, sketch_days = store.merged(project_id, instance_id, metric_type, days[0], days[-1])
+            result = {"days": len(sketch_days), "points": sketch.count, "max": sketch.maximum}
+            for quantile in quantiles:
+                result[f"p{quantile * 100:g}"] = sketch.quantile(quantile)
+            results[instance_id][metric_type] = result
+            if not sketch.count:
+                logger.info(f"  {spec.label}: No data ({len(sketch_days)} of {len(days)} day(s) sketched)")
+                continue
+            percentiles = ", ".join(f"p{quantile * 100:g} {sketch.quantile(quantile):.2f}" for quantile in quantiles)
+            logger.info(f"  {spec.label}: {percentiles}, max {sketch.maximum:.2f} {spec.unit} over {sketch.count} point(s), {len(sketch_days)} of {len(days)} day(s) sketched")
+    logger.info("===================================================================================")
+    return results
+
+
+def log_sustained_performance_over_period(start_date_overall: datetime, end_date_overall: datetime, project_id: str, instance_id: str, window_minutes: int = 30, fetch_series=None) -> dict[str, dict]:
+    """
+    Sustained-performance check over the whole period, instead of a single peak minute: for read IOPS,
+    write IOPS (against EXPECTED_IOPS_PER_SECOND) and total throughput (against EXPECTED_THROUGHPUT_MBPS)
+    reports the longest unbroken run of minutes at or above the threshold, the fraction of minutes
+    meeting it and the best rolling window_minutes mean. Both metrics come from one batched request unless
+    fetch_series swaps the point source (e.g. the cache), which is then called per metric.
+    """
+    query_start = start_date_overall.replace(hour=0, minute=0, second=0, microsecond=0)
+    query_end = end_date_overall.replace(hour=23, minute=59, second=59, microsecond=0)
+    logger.info(f"===================================================================================")
+    logger.info(f"Sustained Performance ({window_minutes}-minute windows) for Parallelstore Instance: {instance_id}")
+    logger.info(f"Project: {project_id}")
+    logger.info(f"Period: {start_date_overall.strftime('%Y-%m-%d')} to {end_date_overall.strftime('%Y-%m-%d')} (UTC)")
+    logger.info(f"===================================================================================")
+
+    results = {}
+    try:
+        series = psseries.fetch_metrics_series(REPORT_METRICS, project_id, instance_id, query_start, query_end, fetch_series)
+        read_series = series[READ_IOPS_METRIC]
+        write_series = series[WRITE_OPS_METRIC]
+    except Exception as e:
+        logger.error(f"Error retrieving metrics for {start_date_overall.strftime('%Y-%m-%d')} to {end_date_overall.strftime('%Y-%m-%d')}: {e}", exc_info=True)
+        return results
+
+    import pssustain
+
+    # Total throughput uses the same ops -> MBps conversion as summarize_daily_peaks.
+    first_timestamp, total_grid = pssustain.sum_minute_grids([read_series, write_series])
+    checks = [
+        ("Read IOPS", "ops/sec", pssustain.sustained_stats(*read_series, EXPECTED_IOPS_PER_SECOND, window_minutes)),
+        ("Write IOPS", "ops/sec", pssustain.sustained_stats(*write_series, EXPECTED_IOPS_PER_SECOND, window_minutes)),
+        ("Total Throughput", "MBps", pssustain.sustained_stats_from_grid(first_timestamp, total_grid / (1000**2), EXPECTED_THROUGHPUT_MBPS, window_minutes)),
+    ]
+    for name, unit, stats in checks:
+        results[name] = stats.as_dict()
+        if not stats.minutes_with_data:
+            logger.info(f"{name}: No data")
+            continue
+        logger.info(f"{name} (threshold {stats.threshold} {unit}):")
+        logger.info(f"  Minutes at or above threshold: {stats.minutes_meeting} of {stats.minutes_with_data} ({stats.fraction_meeting:.1%})")
+        if stats.longest_run_minutes:
+            logger.info(f"  Longest sustained run: {stats.longest_run_minutes} minute(s) starting {stats.longest_run_start.isoformat()}")
+        else:
+            logger.info(f"  Longest sustained run: none")
+        if stats.best_window_mean is not None:
+            logger.info(f"  Best {window_minutes}-minute mean: {stats.best_window_mean:.2f} {unit} starting {stats.best_window_start.isoformat()}")
+        else:
+            logger.info(f"  Best {window_minutes}-minute mean: no complete {window_minutes}-minute window")
+        if stats.sustained:
+            logger.info(f"    Sustained Benchmark ({window_minutes} min at >= {stats.threshold} {unit}): PASSED")
+        else:
+            logger.warning(f"    Sustained Benchmark ({window_minutes} min at >= {stats.threshold} {unit}): FAILED or BELOW THRESHOLD")
         logger.info("-----------------------------------------------------------------------------------")
 
     logger.info("===================================================================================")
-    logger.info("Daily performance fetching completed for the specified period.")
+    logger.info("Sustained performance check completed for the specified period.")
     logger.info("===================================================================================")
-    
-    # --- Optional: Save summary to a file ---
-    # import json
-    # summary_file_name = f"daily_performance_summary_{start_date_overall.strftime('%Y%m%d')}_to_{end_date_overall.strftime('%Y%m%d')}.json"
-    # try:
-    #     with open(summary_file_name, 'w') as f:
-    #         json.dump(all_daily_results_summary, f, indent=4)
-    #     logger.info(f"Daily performance summary saved to {summary_file_name}")
-    # except Exception as e:
-    #     logger.error(f"Failed to save summary JSON file: {e}")
-    # --- End Optional Save ---
+    return results
 
-    return all_daily_results_summary
+
+def compare_backends(start_date_overall: datetime, end_date_overall: datetime, project_id: str, instance_id: str, granularity: str = "day", backends: list | None = None) -> dict[str, list[float | None]]:
+    """
+    Runs the same bucketed peak query through each backend (raw points, PromQL rollup and, for buckets of
+    a day or more, the coarse-to-fine search by default) and logs wall time plus every bucket where the
+    backends disagree by more than 0.5%.
+    Returns {"<backend>/<metric>": [peak per bucket]}.
+    """
+    if not backends:
+        backends = [psbackend.RawPointsBackend(), psbackend.PromQLRollupBackend()]
+        if psseries.GRANULARITY_SECONDS[granularity] > psrefine.COARSE_PERIOD_SECONDS:
+            backends.append(psbackend.CoarseToFineBackend())
+    windows = psseries.bucket_windows(start_date_overall, end_date_overall, granularity)
+    results = {}
+    for backend in backends:
+        started = time.monotonic()
+        for metric_type in (READ_IOPS_METRIC, WRITE_OPS_METRIC):
+            try:
+                results[f"{backend.name}/{metric_type}"] = backend.bucket_peaks(metric_type, project_id, instance_id, windows, granularity)
+            except Exception as e:
+                logger.error(f"Backend {backend.name} failed for {metric_type}: {e}", exc_info=True)
+                results[f"{backend.name}/{metric_type}"] = [None] * len(windows)
+        logger.info(f"Backend {backend.name}: {time.monotonic() - started:.2f}s for {len(windows)} {granularity} bucket(s) x 2 metrics")
+
+    reference = backends[0].name
+    for backend in backends[1:]:
+        mismatches = 0
+        for metric_type in (READ_IOPS_METRIC, WRITE_OPS_METRIC):
+            pairs = zip(windows, results[f"{reference}/{metric_type}"], results[f"{backend.name}/{metric_type}"])
+            for (bucket_start, _), expected, actual in pairs:
+                if expected is None and actual is None:
+                    continue
+                if expected is None or actual is None or abs(expected - actual) > 0.005 * max(abs(expected), 1.0):
+                    mismatches += 1
+                    logger.warning(f"  {psseries.bucket_label(bucket_start, granularity)} {metric_type}: {reference}={expected} {backend.name}={actual}")
+        logger.info(f"Backend {backend.name} vs {reference}: {mismatches} mismatching bucket(s)")
+    return results
+
+
+def log_fleet_performance_over_period(start_date_overall: datetime, end_date_overall: datetime, project_id: str, granularity: str = "day", log_results: bool = True, extra_metrics: list[str] | None = None, point_sink=None) -> dict[str, list[dict]]:
+    """
+    Fleet mode: reports every Parallelstore instance in the project at once.
+    All metrics (REPORT_METRICS plus extra_metrics) are fetched with a single whole-period one_of request
+    that has no instance filter, then split per metric and instance and bucketed locally.
+    Returns {instance_id: [summary dict per bucket]}. With log_results=False only errors are logged.
+    point_sink (e.g. psexport.ReportExporter.write_points) receives every instance's raw points.
+    """
+    if log_results:
+        logger.info(f"===================================================================================")
+        logger.info(f"Fetching Peak Performance ({granularity} buckets) for ALL Parallelstore Instances")
+        logger.info(f"Project: {project_id}")
+        logger.info(f"Period: {start_date_overall.strftime('%Y-%m-%d')} to {end_date_overall.strftime('%Y-%m-%d')} (UTC)")
+        logger.info(f"===================================================================================")
+
+    windows = psseries.bucket_windows(start_date_overall, end_date_overall, granularity)
+    extra_metrics = extra_metrics or []
+    metric_types = REPORT_METRICS + [metric for metric in extra_metrics if metric not in REPORT_METRICS]
+    peaks_by_metric = {}
+    try:
+        peaks_by_metric = psseries.fetch_bucketed_peaks_by_instance_for_metrics(metric_types, project_id, windows, granularity, point_sink)
+    except Exception as e:
+        logger.error(f"Error retrieving fleet metrics for project {project_id}: {e}", exc_info=True)
+    read_peaks_by_instance = peaks_by_metric.get(READ_IOPS_METRIC, {})
+    write_peaks_by_instance = peaks_by_metric.get(WRITE_OPS_METRIC, {})
+
+    fleet_results_summary = {}
+    instance_ids = sorted(set(read_peaks_by_instance) | set(write_peaks_by_instance))
+    if not instance_ids and log_results:
+        logger.info(f"No Parallelstore instance reported metrics in project {project_id} for this period.")
+    no_data = [None] * len(windows)
+    for instance_id in instance_ids:
+        if log_results:
+            logger.info(f"===== Instance: {instance_id} =====")
+        read_peaks = read_peaks_by_instance.get(instance_id, no_data)
+        write_peaks = write_peaks_by_instance.get(instance_id, no_data)
+        instance_summary = []
+        for window_index, ((bucket_start, _), read_peak, write_peak) in enumerate(zip(windows, read_peaks, write_peaks)):
+            extra_peaks = {metric: peaks_by_metric.get(metric, {}).get(instance_id, no_data)[window_index] for metric in extra_metrics}
+            daily_summary = summarize_daily_peaks(psseries.bucket_label(bucket_start, granularity), read_peak, write_peak, log_results, extra_peaks)
+            daily_summary["instance_id"] = instance_id
+            instance_summary.append(daily_summary)
+            if log_results:
+                logger.info("-----------------------------------------------------------------------------------")
+        fleet_results_summary[instance_id] = instance_summary
+
+    if log_results:
+        logger.info("===================================================================================")
+        logger.info(f"Fleet performance fetching completed for {len(instance_ids)} instance(s).")
+        logger.info("===================================================================================")
+    return fleet_results_summary
+
+
+def read_project_ids(project_ids_arg: str | None, projects_file: str | None) -> list[str]:
+    """
+    Collects project IDs from a comma-separated --project_ids value and/or a --projects_file
+    (one project per line, blank lines and '#' comments ignored). Duplicates are dropped, order kept.
+    """
+    project_ids = []
+    if project_ids_arg:
+        project_ids.extend(p.strip() for p in project_ids_arg.split(","))
+    if projects_file:
+        with open(projects_file) as f:
+            project_ids.extend(line.split("#", 1)[0].strip() for line in f)
+    return list(dict.fromkeys(p for p in project_ids if p))
+
+
+def scan_projects_fleet(start_date_overall: datetime, end_date_overall: datetime, project_ids: list[str], granularity: str = "day", max_workers: int = 8, extra_metrics: list[str] | None = None, instance_details: bool = False, instance_cache: psinstances.InstanceMetadataCache | None = None, exporter: psexport.ReportExporter | None = None) -> list[dict]:
+    """
+    Runs the fleet query for every project concurrently (one worker per project, up to max_workers),
+    all sharing the process-wide Monitoring client, and merges every instance's daily summary dicts
+    into one list tagged with project_id and headroom_mbps (EXPECTED_THROUGHPUT_MBPS minus the peak
+    total throughput). Rows are sorted by headroom, least headroom first; rows without data go last.
+    With instance_details, each project's instances are also listed once (through instance_cache) in the
+    same pool and rows get capacity_gib and state.
+    exporter receives each project's rows (and raw points, if it exports them) as soon as the project is done.
+    """
+    logger.info(f"===================================================================================")
+    logger.info(f"Scanning {len(project_ids)} project(s) for Parallelstore instances (max {max_workers} in parallel)")
+    logger.info(f"Period: {start_date_overall.strftime('%Y-%m-%d')} to {end_date_overall.strftime('%Y-%m-%d')} (UTC)")
+    logger.info(f"===================================================================================")
+
+    fleet_rows = []
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        metadata_futures = {}
+        if instance_details:
+            metadata_futures = {project_id: executor.submit(psinstances.list_instances, project_id, instance_cache) for project_id in project_ids}
+        point_sink = exporter.point_sink if exporter else None
+        futures = {
+            executor.submit(log_fleet_performance_over_period, start_date_overall, end_date_overall, project_id, granularity, False, extra_metrics, point_sink): project_id
+            for project_id in project_ids
+        }
+        for future in as_completed(futures):
+            project_id = futures[future]
+            try:
+                project_results = future.result()
+            except Exception as e:
+                logger.error(f"Error scanning project {project_id}: {e}", exc_info=True)
+                continue
+            logger.info(f"Project {project_id}: {len(project_results)} instance(s) reported metrics.")
+            instances = {}
+            if project_id in metadata_futures:
+                try:
+                    instances = metadata_futures[project_id].result()
+                except Exception as e:
+                    logger.warning(f"Could not list Parallelstore instances of project {project_id}: {e}")
+            project_rows = []
+            for instance_id, instance_summary in project_results.items():
+                instance = instances.get(instance_id, {})
+                for daily_summary in instance_summary:
+                    peak = daily_summary["peak_total_throughput_mbps"]
+                    daily_summary["project_id"] = project_id
+                    daily_summary["headroom_mbps"] = None if peak is None else EXPECTED_THROUGHPUT_MBPS - peak
+                    daily_summary["capacity_gib"] = instance.get("capacityGib")
+                    daily_summary["state"] = instance.get("state")
+                    project_rows.append(daily_summary)
+            if exporter:
+                exporter.write_summaries(project_id, None, project_rows)
+            fleet_rows.extend(project_rows)
+
+    fleet_rows.sort(key=lambda row: (
+        row["headroom_mbps"] is None,
+        row["headroom_mbps"] if row["headroom_mbps"] is not None else 0.0,
+        row["project_id"], row["instance_id"], row["date"]
+    ))
+    return fleet_rows
+
+
+def log_fleet_table(fleet_rows: list[dict]) -> None:
+    """
+    Logs the merged fleet table from scan_projects_fleet, one row per instance per bucket.
+    """
+    logger.info("===================================================================================")
+    logger.info(f"Fleet-wide summary (sorted by headroom vs {EXPECTED_THROUGHPUT_MBPS} MBps expected throughput)")
+    logger.info(f"{'Project':<30} {'Instance':<30} {'Date':<16} {'Read IOPS':>12} {'Write IOPS':>12} {'Total MBps':>11} {'Headroom':>10} {'Cap GiB':>8} {'State':<10}")
+
+    def _fmt(value, width):
+        return f"{value:>{width}.2f}" if value is not None else f"{'-':>{width}}"
+
+    for row in fleet_rows:
+        logger.info(
+            f"{row['project_id']:<30} {row['instance_id']:<30} {row['date']:<16} "
+            f"{_fmt(row['peak_read_iops_ops_sec'], 12)} {_fmt(row['peak_write_iops_ops_sec'], 12)} "
+            f"{_fmt(row['peak_total_throughput_mbps'], 11)} {_fmt(row['headroom_mbps'], 10)} "
+            f"{row.get('capacity_gib') or '-':>8} {row.get('state') or '-':<10}"
+        )
+    logger.info("===================================================================================")
+
+
+def check_watch_thresholds(summary: dict, read_peak: float | None, write_peak: float | None) -> dict[str, bool | None]:
+    """
+    Which thresholds the current rolling peaks are at or above: total throughput against
+    EXPECTED_THROUGHPUT_MBPS and read/write rates against EXPECTED_IOPS_PER_SECOND (None = no data).
+    """
+    return {
+        "peak_total_throughput_mbps": summary["met_throughput_benchmark"],
+        "peak_read_iops_ops_sec": None if read_peak is None else read_peak >= EXPECTED_IOPS_PER_SECOND,
+        "peak_write_iops_ops_sec": None if write_peak is None else write_peak >= EXPECTED_IOPS_PER_SECOND,
+    }
+
+
+def watch_instance_performance(project_id: str, instance_id: str, poll_interval_seconds: int = 60, window_minutes: int = 60, events_file: str | None = None, max_polls: int | None = None):
+    """
+    Keeps running and polls Cloud Monitoring every poll_interval_seconds for only the alignment periods
+    since the previous successful poll (plus WATCH_INGEST_LAG_SECONDS for points published late), keeping
+    rolling peaks over the last window_minutes in memory.
+    Logs an event (and appends it as a JSON line to events_file) whenever a rolling peak crosses a
+    threshold in either direction. Stops after max_polls polls, or on Ctrl-C.
+    """
+    window_seconds = window_minutes * 60
+    rolling = {metric: psseries.RollingPeak(window_seconds) for metric in (READ_IOPS_METRIC, WRITE_OPS_METRIC)}
+    thresholds = {
+        "peak_total_throughput_mbps": EXPECTED_THROUGHPUT_MBPS,
+        "peak_read_iops_ops_sec": EXPECTED_IOPS_PER_SECOND,
+        "peak_write_iops_ops_sec": EXPECTED_IOPS_PER_SECOND,
+    }
+    previous_state = {}
+    query_cursor = None
+
+    logger.info(f"===================================================================================")
+    logger.info(f"Watching Parallelstore Instance: {instance_id} in project: {project_id}")
+    logger.info(f"Polling every {poll_interval_seconds}s, rolling peaks over the last {window_minutes} minute(s). Press Ctrl-C to stop.")
+    logger.info(f"===================================================================================")
+
+    polls = 0
+    try:
+        while max_polls is None or polls < max_polls:
+            poll_started = time.monotonic()
+            now = datetime.now(timezone.utc).replace(microsecond=0)
+            try:
+                new_points = 0
+                # First poll backfills the whole window; later polls ask for the periods since the last successful
+                # poll plus WATCH_INGEST_LAG_SECONDS for late points (a metric without points, e.g. no writes,
+                # must not pull the start back). Queries end on a whole minute so every poll sees one grid of periods.
+                query_end = now - timedelta(seconds=now.second)
+                query_start = now - timedelta(seconds=window_seconds)
+                if query_cursor is not None:
+                    query_start = max(query_start, query_cursor - timedelta(seconds=WATCH_INGEST_LAG_SECONDS))
+                if query_start < query_end:
+                    series = psseries.fetch_metrics_series(list(rolling), project_id, instance_id, query_start, query_end)
+                    for metric, (timestamps, values) in series.items():
+                        order = timestamps.argsort(kind="stable")
+                        for timestamp, value in zip(timestamps[order].tolist(), values[order].tolist()):
+                            new_points += rolling[metric].add(timestamp, value)
+                query_cursor = query_end
+                for peak in rolling.values():
+                    peak.expire(int(now.timestamp()))
+
+                read_peak = rolling[READ_IOPS_METRIC].peak
+                write_peak = rolling[WRITE_OPS_METRIC].peak
+                summary = summarize_daily_peaks(f"last {window_minutes} min", read_peak, write_peak, log_results=False)
+                total_peak = summary["peak_total_throughput_mbps"]
+                read_text = "no data" if read_peak is None else f"{read_peak:.2f} ops/sec"
+                write_text = "no data" if write_peak is None else f"{write_peak:.2f} ops/sec"
+                total_text = "no data" if total_peak is None else f"{total_peak:.2f} MBps"
+                logger.info(f"[{now.isoformat()}] {new_points} new point(s); rolling peaks - read: {read_text}, write: {write_text}, total throughput: {total_text}")
+
+                for name, above in check_watch_thresholds(summary, read_peak, write_peak).items():
+                    if above is None or above == previous_state.get(name, False):
+                        continue
+                    previous_state[name] = above
+                    event = {
+                        "time": now.isoformat(),
+                        "project_id": project_id,
+                        "instance_id": instance_id,
+                        "metric": name,
+                        "value": summary[name],
+                        "threshold": thresholds[name],
+                        "direction": "above" if above else "below",
+                        "window_minutes": window_minutes,
+                    }
+                    logger.warning(f"THRESHOLD EVENT: rolling {name} went {event['direction']} {event['threshold']} ({event['value']:.2f}) on {instance_id}")
+                    if events_file:
+                        with open(events_file, "a") as f:
+                            f.write(json.dumps(event) + "\n")
+            except Exception as e:
+                # Keep the watcher alive across transient API errors; the next poll picks up from the last successful one.
+                logger.error(f"Error during watch poll for {instance_id}: {e}", exc_info=True)
+
+            polls += 1
+            if max_polls is not None and polls >= max_polls:
+                break
+            time.sleep(max(0.0, poll_interval_seconds - (time.monotonic() - poll_started)))
+    except KeyboardInterrupt:
+        logger.info("Watch stopped by user.")
+    return {metric: (peak.peak, peak.peak_time) for metric, peak in rolling.items()}
+
+
+def log_api_call_summary(metrics_textfile: str | None = None, metrics_json: str | None = None) -> None:
+    """
+    Logs the connection count and per-API call measurements for this run and writes the optional exports.
+    """
+    logger.info(f"Monitoring API connections opened during this run: {psclient.connections_opened()}")
+    logger.info("API calls during this run:")
+    psinstrument.RECORDER.log_summary(logger)
+    logger.info("Request scheduling per project:")
+    psquota.SCHEDULER.log_summary(logger)
+    if psshard.SHARDER.summary()["sharded_fetches"]:
+        logger.info("Adaptive time sharding:")
+        psshard.SHARDER.log_summary(logger)
+    if metrics_textfile:
+        psinstrument.RECORDER.write_prometheus_textfile(metrics_textfile)
+        logger.info(f"API call metrics written to {metrics_textfile}")
+    if metrics_json:
+        psinstrument.RECORDER.write_json_summary(metrics_json)
+        logger.info(f"API call summary written to {metrics_json}")
 
 
 # --- Main Execution Block ---
 if __name__ == "__main__":
-    logger.info("=====================================================================")
-    logger.info("Starting Parallelstore Daily Metrics Retrieval Script...")
-    logger.info(f"Current script execution time (UTC): {datetime.now(timezone.utc).isoformat()}")
-    logger.info("Usage: python script.py --project_id <PROJECT_ID> --instance_id <INSTANCE_ID> --start_date YYYY-MM-DD [--end_date YYYY-MM-DD]")
-    logger.info("=====================================================================")
-    # Reminders for the user/client about necessary pre-requisites.
-    logger.info("Make sure the following are correctly set up before running:")
-    logger.info("1. GCP Authentication: Run `gcloud auth application-default login` OR set `GOOGLE_APPLICATION_CREDENTIALS` environment variable.")
-    logger.info("2. 'Cloud Monitoring API' enabled in GCP.")
-    logger.info("3. The authenticated principal (user or service account) has at least 'roles/monitoring.viewer' IAM permission on the project.")
-    logger.info("4. The gcloud CLI is installed and configured.")
-    logger.info("=====================================================================")
-
     parser = argparse.ArgumentParser(
         description="Fetch daily peak performance metrics for a Parallelstore instance."
     )
     parser.add_argument(
         "--project_id",
-        required=True,
         type=str,
-        help="GCP Project ID.",
+        default=None,
+        help="GCP Project ID. Required unless --project_ids or --projects_file is given.",
+    )
+    parser.add_argument(
+        "--project_ids",
+        type=str,
+        default=None,
+        help="Comma-separated GCP Project IDs to scan concurrently in fleet mode (implies --all_instances).",
+    )
+    parser.add_argument(
+        "--projects_file",
+        type=str,
+        default=None,
+        help="File listing GCP Project IDs to scan, one per line (implies --all_instances).",
     )
     parser.add_argument(
         "--instance_id",
-        required=True,
         type=str,
-        help="Parallelstore Instance ID.",
+        default=None,
+        help="Parallelstore Instance ID. Required unless --all_instances is given.",
+    )
+    parser.add_argument(
+        "--all_instances", "--all-instances",
+        action="store_true",
+        help="Report every Parallelstore instance in the project using one grouped query per metric (implies whole-period fetching).",
     )
     parser.add_argument(
         "--start_date",
-        required=True,
         type=str,
-        help="Start date for the report (YYYY-MM-DD).",
+        default=None,
+        help="Start date for the report (YYYY-MM-DD). Required unless --watch is given.",
     )
     parser.add_argument(
         "--end_date",
@@ -283,7 +865,316 @@ if __name__ == "__main__":
         default=None,
         help="End date for the report (YYYY-MM-DD). If not provided, it will default to today's date in UTC.",
     )
+    parser.add_argument(
+        "--whole_period",
+        action="store_true",
+        help="Fetch each metric with one query for the whole date range and bucket the points locally instead of querying day by day.",
+    )
+    parser.add_argument(
+        "--granularity",
+        choices=sorted(psseries.GRANULARITY_SECONDS),
+        default="day",
+        help="Bucket size for --whole_period and --all_instances reports (default: day).",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=sorted(psbackend.BACKENDS) + ["compare"],
+        default="raw",
+        help="How --whole_period peaks are computed: raw (download 60s points, reduce locally), promql (server-side max_over_time rollup), coarse_to_fine (hourly rates first, 60s points only for hours that could hold a peak; exact) or compare (run them all and report differences).",
+    )
+    parser.add_argument(
+        "--cache_db",
+        type=str,
+        default=None,
+        help=f"SQLite file caching every fetched 60s point; only windows missing from it are queried (implies --whole_period). Suggested: {pscache.DEFAULT_CACHE_PATH}",
+    )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Serve the report from --cache_db only, without calling Cloud Monitoring or gcloud.",
+    )
+    parser.add_argument(
+        "--stub_client",
+        action="store_true",
+        help="Use the synthetic offline Monitoring client and PromQL session (psstub) instead of Cloud Monitoring, for testing without network.",
+    )
+    parser.add_argument(
+        "--extra_metrics",
+        type=str,
+        default=None,
+        help=f"Comma-separated extra metrics to report alongside read/write IOPS, fetched in the same request (known: {', '.join(sorted(psregistry.METRICS))}).",
+    )
+    parser.add_argument(
+        "--sustained_minutes",
+        type=int,
+        default=None,
+        help="Instead of peak minutes, report sustained performance: longest run at/above threshold, fraction of minutes meeting it and the best rolling N-minute mean (single instance, works with --cache_db).",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Keep running and poll only the newest alignment periods every --poll_interval seconds, logging threshold crossings of the rolling peaks (single instance only).",
+    )
+    parser.add_argument(
+        "--poll_interval",
+        type=int,
+        default=60,
+        help="Seconds between --watch polls (default: 60).",
+    )
+    parser.add_argument(
+        "--window_minutes",
+        type=int,
+        default=60,
+        help="Length of the --watch rolling peak window in minutes (default: 60).",
+    )
+    parser.add_argument(
+        "--events_file",
+        type=str,
+        default=None,
+        help="Append --watch threshold events to this file as JSON lines.",
+    )
+    parser.add_argument(
+        "--metrics_textfile",
+        type=str,
+        default=None,
+        help="Write per-API-call latency/page/byte/retry histograms to this file in Prometheus text format (e.g. for the node_exporter textfile collector).",
+    )
+    parser.add_argument(
+        "--metrics_json",
+        type=str,
+        default=None,
+        help="Write a JSON summary of the per-API-call measurements to this file.",
+    )
+    parser.add_argument(
+        "--instance_cache",
+        type=str,
+        default=psinstances.DEFAULT_INSTANCE_CACHE_PATH,
+        help=f"JSON file caching Parallelstore instance metadata between runs (default: {psinstances.DEFAULT_INSTANCE_CACHE_PATH}; empty string disables it).",
+    )
+    parser.add_argument(
+        "--instance_cache_ttl",
+        type=int,
+        default=psinstances.DEFAULT_INSTANCE_CACHE_TTL_SECONDS,
+        help=f"Seconds cached instance metadata stays valid (default: {psinstances.DEFAULT_INSTANCE_CACHE_TTL_SECONDS}).",
+    )
+    parser.add_argument(
+        "--refresh_instances",
+        action="store_true",
+        help="Ignore cached instance metadata and list the instances again.",
+    )
+    parser.add_argument(
+        "--export_summaries",
+        type=str,
+        default=None,
+        help="Stream every window's summary (one row per day/bucket and instance) to this file; the format follows the extension: .parquet or .arrow (need pyarrow), .csv or .csv.gz.",
+    )
+    parser.add_argument(
+        "--export_points",
+        type=str,
+        default=None,
+        help="Also stream every fetched 60-second point (project_id, instance_id, metric, timestamp, value) to this file; same formats as --export_summaries.",
+    )
+    parser.add_argument(
+        "--export_row_group",
+        type=int,
+        default=psexport.DEFAULT_ROW_GROUP_ROWS,
+        help=f"Rows buffered before each row group is written to the export files (default: {psexport.DEFAULT_ROW_GROUP_ROWS}).",
+    )
+    parser.add_argument(
+        "--sketch_db",
+        type=str,
+        default=None,
+        help="SQLite file of per-instance/metric/day percentile sketches: the daily, --whole_period (raw backend) and --all_instances reports store one for every day they fetch and log p50/p95/p99 over the period merged from the stored days.",
+    )
+    parser.add_argument(
+        "--from_sketches",
+        action="store_true",
+        help="Only log the percentiles over the period from --sketch_db, without fetching anything (with --all_instances: every instance stored for the project).",
+    )
+    parser.add_argument(
+        "--quantiles",
+        type=str,
+        default=",".join(f"{quantile:g}" for quantile in pssketch.DEFAULT_QUANTILES),
+        help=f"Comma-separated quantiles for the sketch percentiles (default: {','.join(f'{quantile:g}' for quantile in pssketch.DEFAULT_QUANTILES)}).",
+    )
+    parser.add_argument(
+        "--heatmap",
+        type=str,
+        default=None,
+        help="Render the fetched 60-second rates as a days x minute-of-day heatmap per instance and metric, with each day's peak and the busiest minutes of day: a .html path writes one self-contained page, a .png path one image per instance/metric. Applies to the same reports as --sketch_db (with --cache_db, straight from the cached points).",
+    )
+    parser.add_argument(
+        "--peak_db",
+        type=str,
+        default=None,
+        help="SQLite store of daily peaks: the daily report answers days already stored (by earlier runs, or backfilled from old logs with pshistory.py) without querying Cloud Monitoring, and stores every completed day it fetches.",
+    )
+    parser.add_argument(
+        "--log_file",
+        type=str,
+        default=pslogging.DEFAULT_LOG_FILE,
+        help=f"Human-readable log file, rotated by size (default: {pslogging.DEFAULT_LOG_FILE}; empty string disables it).",
+    )
+    parser.add_argument(
+        "--json_log_file",
+        type=str,
+        default=pslogging.DEFAULT_JSON_LOG_FILE,
+        help=f"JSON-lines log with one record per log line, including each window's summary dict (default: {pslogging.DEFAULT_JSON_LOG_FILE}; empty string disables it).",
+    )
+    parser.add_argument(
+        "--log_max_mb",
+        type=float,
+        default=pslogging.DEFAULT_MAX_MB,
+        help=f"Rotate each log file when it reaches this size in MB (default: {pslogging.DEFAULT_MAX_MB}).",
+    )
+    parser.add_argument(
+        "--log_backups",
+        type=int,
+        default=pslogging.DEFAULT_BACKUP_COUNT,
+        help=f"Number of rotated log files to keep (default: {pslogging.DEFAULT_BACKUP_COUNT}).",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=8,
+        help="Maximum number of Monitoring queries (or projects, in multi-project mode) in flight at once (default: 8, 1 = serial).",
+    )
+    parser.add_argument(
+        "--requests_per_second",
+        type=float,
+        default=psquota.DEFAULT_REQUESTS_PER_SECOND,
+        help=f"Monitoring API requests per second per project, halved after each quota (429) error and recovered on success (default: {psquota.DEFAULT_REQUESTS_PER_SECOND:g}; 0 = no limit).",
+    )
+    parser.add_argument(
+        "--request_burst",
+        type=int,
+        default=psquota.DEFAULT_BURST,
+        help=f"Requests per project that may start at once before --requests_per_second applies (default: {psquota.DEFAULT_BURST}).",
+    )
+    parser.add_argument(
+        "--max_attempts",
+        type=int,
+        default=psquota.DEFAULT_MAX_ATTEMPTS,
+        help=f"Attempts per request on 429/503/504 errors, with jittered exponential backoff (default: {psquota.DEFAULT_MAX_ATTEMPTS}).",
+    )
+    parser.add_argument(
+        "--retry_budget",
+        type=float,
+        default=psquota.DEFAULT_RETRY_BUDGET,
+        help=f"Retries allowed per request made, across all projects, on top of {psquota.MIN_RETRY_BUDGET} (default: {psquota.DEFAULT_RETRY_BUDGET:g}).",
+    )
+    parser.add_argument(
+        "--shard_points",
+        type=int,
+        default=psshard.DEFAULT_TARGET_POINTS,
+        help=f"Split --whole_period, fleet and cache fetches expected to return more than this many points into time shards fetched in parallel; later shards are resized from the rate observed and slow ones are split again (default: {psshard.DEFAULT_TARGET_POINTS}; 0 = never shard).",
+    )
+    parser.add_argument(
+        "--shard_workers",
+        type=int,
+        default=psshard.DEFAULT_MAX_WORKERS,
+        help=f"Shards of one fetch in flight at once (default: {psshard.DEFAULT_MAX_WORKERS}).",
+    )
     args = parser.parse_args()
+    root_logger = logging.getLogger()
+    root_logger.setLevel(logging.INFO)
+    pslogging.setup_logging(root_logger, args.log_file or None, args.json_log_file or None, args.log_max_mb, args.log_backups)
+
+    logger.info("=====================================================================")
+    logger.info("Starting Parallelstore Daily Metrics Retrieval Script...")
+    logger.info(f"Current script execution time (UTC): {datetime.now(timezone.utc).isoformat()}")
+    logger.info("Usage: python script.py (--project_id <PROJECT_ID> (--instance_id <INSTANCE_ID> | --all_instances) | --project_ids <P1,P2> | --projects_file <FILE>) (--start_date YYYY-MM-DD [--end_date YYYY-MM-DD] | --watch [--poll_interval S] [--window_minutes M] [--events_file FILE]) [--concurrency N] [--requests_per_second R] [--max_attempts N] [--shard_points N] [--whole_period [--granularity hour|day|week]] [--backend raw|promql|coarse_to_fine|compare] [--cache_db FILE [--offline]] [--extra_metrics NAME,...] [--sustained_minutes N] [--export_summaries FILE] [--export_points FILE] [--sketch_db FILE [--from_sketches]] [--heatmap FILE.html|FILE.png] [--peak_db FILE] [--metrics_textfile FILE] [--metrics_json FILE]")
+    logger.info("=====================================================================")
+    # Reminders for the user/client about necessary pre-requisites.
+    logger.info("Make sure the following are correctly set up before running:")
+    logger.info("1. GCP Authentication: Run `gcloud auth application-default login` OR set `GOOGLE_APPLICATION_CREDENTIALS` environment variable.")
+    logger.info("2. 'Cloud Monitoring API' enabled in GCP.")
+    logger.info("3. The authenticated principal (user or service account) has at least 'roles/monitoring.viewer' IAM permission on the project.")
+    logger.info("4. The gcloud CLI is installed and configured.")
+    logger.info("=====================================================================")
+
+    psclient.configure(**CONFIG["monitoring_client"])
+    if args.stub_client:
+        import psstub
+        psclient.configure(client_factory=psstub.StubMetricServiceClient, session_factory=psstub.StubPrometheusSession)
+    # --project_ids/--projects_file are fleet reports: set before the checks on --all_instances below.
+    multi_project = bool(args.project_ids or args.projects_file)
+    if multi_project:
+        args.all_instances = True
+    elif not args.project_id:
+        parser.error("one of --project_id, --project_ids or --projects_file is required.")
+    if args.offline and not args.cache_db:
+        parser.error("--offline requires --cache_db.")
+    if args.cache_db and args.all_instances:
+        parser.error("--cache_db is not supported with fleet modes yet; use it with --instance_id.")
+    if args.cache_db and args.backend != "raw":
+        parser.error("--cache_db only applies to the raw backend.")
+    if args.backend != "raw" and args.all_instances:
+        parser.error("--backend is only supported for single-instance reports.")
+    if args.cache_db or args.backend != "raw":
+        args.whole_period = True
+    if args.granularity != "day" and not (args.whole_period or args.all_instances):
+        parser.error("--granularity requires --whole_period or --all_instances.")
+    if args.backend == "coarse_to_fine" and psseries.GRANULARITY_SECONDS[args.granularity] <= psrefine.COARSE_PERIOD_SECONDS:
+        parser.error("--backend coarse_to_fine needs --granularity day or week.")
+    if not args.instance_id and not args.all_instances:
+        parser.error("either --instance_id or --all_instances is required.")
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1.")
+    if args.request_burst < 1 or args.max_attempts < 1 or args.retry_budget < 0:
+        parser.error("--request_burst and --max_attempts must be at least 1 and --retry_budget at least 0.")
+    psquota.SCHEDULER.configure(args.requests_per_second, args.request_burst, args.max_attempts, args.retry_budget)
+    if args.shard_workers < 1:
+        parser.error("--shard_workers must be at least 1.")
+    psshard.SHARDER.configure(args.shard_points, args.shard_workers)
+    try:
+        extra_metrics = [spec.metric_type for spec in psregistry.resolve(args.extra_metrics or "")]
+    except ValueError as e:
+        parser.error(str(e))
+    if args.sustained_minutes is not None:
+        if args.all_instances or args.backend != "raw" or args.watch:
+            parser.error("--sustained_minutes only supports a single --instance_id with the raw backend.")
+        if args.sustained_minutes < 1:
+            parser.error("--sustained_minutes must be at least 1.")
+    if args.watch:
+        if args.all_instances or args.cache_db or args.whole_period or args.backend != "raw":
+            parser.error("--watch only supports a single --instance_id with the default raw backend.")
+        if args.poll_interval < 1 or args.window_minutes < 1:
+            parser.error("--poll_interval and --window_minutes must be at least 1.")
+    elif not args.start_date:
+        parser.error("--start_date is required unless --watch is given.")
+    if args.export_summaries or args.export_points:
+        if args.watch or args.sustained_minutes is not None or args.backend != "raw":
+            parser.error("--export_summaries/--export_points only apply to the daily, --whole_period (raw backend) and fleet reports.")
+        if args.export_row_group < 1:
+            parser.error("--export_row_group must be at least 1.")
+    if args.heatmap:
+        if args.from_sketches or multi_project or args.watch or args.sustained_minutes is not None or args.backend != "raw":
+            parser.error("--heatmap only applies to the daily, --whole_period (raw backend) and single-project --all_instances reports.")
+        if not args.heatmap.endswith(psheatmap.HEATMAP_FORMATS):
+            parser.error(f"--heatmap must end with one of: {', '.join(psheatmap.HEATMAP_FORMATS)}")
+    if args.peak_db:
+        if args.from_sketches or multi_project or args.all_instances or args.watch or args.sustained_minutes is not None or args.whole_period or args.backend != "raw":
+            parser.error("--peak_db only applies to the daily report.")
+        if args.export_points or args.sketch_db or args.heatmap:
+            parser.error("--peak_db answers stored days without their points, so it cannot be combined with --export_points, --sketch_db or --heatmap.")
+    if args.from_sketches and not args.sketch_db:
+        parser.error("--from_sketches requires --sketch_db.")
+    if args.sketch_db and not args.from_sketches and (multi_project or args.watch or args.sustained_minutes is not None or args.backend != "raw"):
+        parser.error("--sketch_db only applies to the daily, --whole_period (raw backend) and single-project --all_instances reports.")
+    try:
+        quantiles = [float(quantile) for quantile in args.quantiles.split(",") if quantile.strip()]
+    except ValueError:
+        parser.error(f"Invalid --quantiles: {args.quantiles}")
+    if not quantiles or not all(0 <= quantile <= 1 for quantile in quantiles):
+        parser.error("--quantiles must be numbers between 0 and 1.")
+
+    if args.watch:
+        try:
+            watch_instance_performance(args.project_id, args.instance_id, args.poll_interval, args.window_minutes, args.events_file)
+        finally:
+            log_api_call_summary(args.metrics_textfile, args.metrics_json)
+        exit(0)
 
     try:
         period_start_date = datetime.strptime(args.start_date, "%Y-%m-%d").replace(tzinfo=timezone.utc)
@@ -304,7 +1195,9 @@ if __name__ == "__main__":
         exit(1)
     
     # Get and display instance details
-    instance_details = get_instance_details(args.project_id, args.instance_id)
+    instance_cache = psinstances.InstanceMetadataCache(args.instance_cache, args.instance_cache_ttl) if args.instance_cache else None
+    lookup_instances = not (args.offline or args.stub_client or args.from_sketches)
+    instance_details = None if (args.all_instances or not lookup_instances) else get_instance_details(args.project_id, args.instance_id, instance_cache, args.refresh_instances)
     if instance_details:
         logger.info(f"===================================================================================")
         logger.info(f"Parallelstore Instance Details:")
@@ -316,12 +1209,76 @@ if __name__ == "__main__":
         logger.info(f"  Access Points: {instance_details.get('accessPoints', 'N/A')}")
         logger.info(f"===================================================================================")
 
+    exporter = None
+    if args.export_summaries or args.export_points:
+        try:
+            exporter = psexport.ReportExporter(args.export_summaries, args.export_points, args.export_row_group)
+        except (ValueError, ImportError, OSError) as e:
+            parser.error(str(e))
+    sketch_store = pssketch.SketchStore(args.sketch_db) if args.sketch_db else None
+    sketch_recorder = pssketch.SketchRecorder(sketch_store) if sketch_store and not args.from_sketches else None
+    heatmap_recorder = psheatmap.HeatmapRecorder(period_start_date, period_end_date) if args.heatmap else None
+    report_sink = combine_point_sinks(sketch_recorder.add_points if sketch_recorder else None, heatmap_recorder.add_points if heatmap_recorder else None)
+    point_sink = combine_point_sinks(exporter.point_sink if exporter else None, report_sink)
+    peak_store = pshistory.DailyPeakStore(args.peak_db) if args.peak_db else None
+    peak_fetcher = pshistory.StoredPeakFetcher(peak_store, fetch_metrics_stats) if peak_store else None
+    report_metrics = REPORT_METRICS + [metric for metric in extra_metrics if metric not in REPORT_METRICS]
+    sketched_instance_ids = [args.instance_id]
+
     try:
-        log_daily_performance_over_period(period_start_date, period_end_date, args.project_id, args.instance_id)
+        if args.from_sketches:
+            if args.all_instances:
+                days = pssketch.day_labels(period_start_date, period_end_date)
+                sketched_instance_ids = sketch_store.instance_ids(args.project_id, days[0], days[-1])
+        elif multi_project:
+            project_ids = read_project_ids(args.project_ids, args.projects_file)
+            fleet_rows = scan_projects_fleet(period_start_date, period_end_date, project_ids, args.granularity, args.concurrency, extra_metrics, lookup_instances, instance_cache, exporter)
+            log_fleet_table(fleet_rows)
+        elif args.all_instances:
+            fleet_results = log_fleet_performance_over_period(period_start_date, period_end_date, args.project_id, args.granularity, extra_metrics=extra_metrics, point_sink=point_sink)
+            sketched_instance_ids = sorted(fleet_results)
+            if exporter:
+                for instance_summary in fleet_results.values():
+                    exporter.write_summaries(args.project_id, None, instance_summary)
+        elif args.backend == "compare":
+            compare_backends(period_start_date, period_end_date, args.project_id, args.instance_id, args.granularity)
+        elif args.sustained_minutes is not None:
+            fetch_series = None
+            if args.cache_db:
+                metric_cache = pscache.MetricCache(args.cache_db)
+                fetch_series = functools.partial(pscache.fetch_cached_series, metric_cache, offline=args.offline)
+            log_sustained_performance_over_period(period_start_date, period_end_date, args.project_id, args.instance_id, args.sustained_minutes, fetch_series)
+        elif args.whole_period:
+            if args.backend == "promql":
+                backend = psbackend.PromQLRollupBackend()
+            elif args.backend == "coarse_to_fine":
+                backend = psbackend.CoarseToFineBackend(args.concurrency)
+            elif args.cache_db:
+                metric_cache = pscache.MetricCache(args.cache_db)
+                backend = psbackend.RawPointsBackend(functools.partial(pscache.fetch_cached_series, metric_cache, offline=args.offline), point_sink)
+            else:
+                backend = psbackend.RawPointsBackend(point_sink=point_sink)
+            log_bucketed_performance_over_period(period_start_date, period_end_date, args.project_id, args.instance_id, args.granularity, backend, extra_metrics, exporter)
+            if args.backend == "coarse_to_fine":
+                logger.info(f"Coarse-to-fine search transferred {backend.stats.points} point(s) ({backend.stats.coarse_points} hourly, {backend.stats.fine_points} at 60s in {backend.stats.fine_requests} request(s)); refined {backend.stats.periods_refined} of {backend.stats.periods_with_data} hour(s) with data.")
+        else:
+            log_daily_performance_over_period(period_start_date, period_end_date, args.project_id, args.instance_id, args.concurrency, extra_metrics, exporter, report_sink, peak_fetcher)
+            if peak_fetcher:
+                logger.info(f"Answered {peak_fetcher.served} day(s) from {args.peak_db}; fetched {peak_fetcher.fetched} and stored {peak_fetcher.stored} completed day(s).")
+        if sketch_recorder:
+            logger.info(f"Stored {sketch_recorder.flush()} daily sketch(es) in {args.sketch_db}")
+        if heatmap_recorder:
+            log_heatmaps(heatmap_recorder, args.heatmap)
+        if sketch_store:
+            log_sketch_percentiles(sketch_store, period_start_date, period_end_date, args.project_id, sketched_instance_ids, report_metrics, quantiles)
     except Exception as e:
         logger.critical(f"An unhandled critical error occurred during the script execution: {e}", exc_info=True)
         logger.critical("Please check authentication, permissions, API enablement, and instance identifiers in the command line arguments.")
     finally:
+        if exporter:
+            for path, rows_written in exporter.close().items():
+                logger.info(f"Exported {rows_written} row(s) to {path}")
+        log_api_call_summary(args.metrics_textfile, args.metrics_json)
         logger.info("=====================================================================")
         logger.info("Script execution finished.")
         logger.info("=====================================================================")
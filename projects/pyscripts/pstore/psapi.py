@@ -0,0 +1,186 @@
+"""
+Importable API for the daily peak report: results stream out day by day as they are fetched, so
+notebooks and other tools can consume months of data incrementally with bounded memory.
+
+    import psapi
+    for day in psapi.iter_daily_peaks("my-project", "my-instance", start, end, metrics=["read_ops", "write_ops"]):
+        print(day.date, day.peak("read_ops"), day.error)
+
+    async for day in psapi.aiter_daily_peaks("my-project", "my-instance", start, end):
+        ...
+"""
+from __future__ import annotations
+
+from collections import deque
+from collections.abc import AsyncIterator, Iterator
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta, timezone
+
+import psregistry
+import psseries
+
+DEFAULT_METRICS = ("read_ops", "write_ops")
+DEFAULT_CONCURRENCY = 8
+# Days queued per worker: enough to keep every worker busy while the caller handles the oldest day,
+# few enough that a months-long range never holds more than a handful of results.
+DAYS_IN_FLIGHT_PER_WORKER = 2
+
+
+class DailyPeaks:
+    """
+    One day's result for one instance: the UTC day's window, the RateStats of every requested metric
+    (peak, peak time, min, mean, point count) and the exception if the day could not be fetched.
+    """
+    __slots__ = ("project_id", "instance_id", "date", "start", "end", "stats", "error")
+
+    def __init__(self, project_id: str, instance_id: str, start: datetime, end: datetime, stats: dict[str, psseries.RateStats] | None = None, error: Exception | None = None):
+        self.project_id = project_id
+        self.instance_id = instance_id
+        self.date = start.strftime("%Y-%m-%d")
+        self.start = start
+        self.end = end
+        self.stats = stats or {}
+        self.error = error
+
+    @property
+    def peaks(self) -> dict[str, float | None]:
+        """{metric_type: peak 60-second rate}; None for metrics without points (or for a failed day)."""
+        return {metric_type: stats.maximum for metric_type, stats in self.stats.items()}
+
+    def peak(self, metric: str) -> float | None:
+        """Peak 60-second rate of a metric given by registry name (e.g. "read_ops") or metric type."""
+        stats = self.stats.get(psregistry.get(metric).metric_type)
+        return stats.maximum if stats else None
+
+    def __repr__(self):
+        if self.error is not None:
+            return f"DailyPeaks({self.instance_id} {self.date}, error={self.error!r})"
+        peaks = ", ".join(f"{psregistry.get(metric_type).name}={peak}" for metric_type, peak in self.peaks.items())
+        return f"DailyPeaks({self.instance_id} {self.date}, {peaks})"
+
+
+def day_windows(start: datetime, end: datetime) -> list[tuple[datetime, datetime]]:
+    """The 00:00:00 - 23:59:59 UTC window of every day from start to end, as the daily report queries them."""
+    windows = []
+    day = start
+    while day <= end:
+        windows.append((
+            datetime(day.year, day.month, day.day, 0, 0, 0, tzinfo=timezone.utc),
+            datetime(day.year, day.month, day.day, 23, 59, 59, tzinfo=timezone.utc),
+        ))
+        day += timedelta(days=1)
+    return windows
+
+
+def _fetch_day(project_id: str, instance_id: str, metric_types: list[str], window: tuple[datetime, datetime], point_sink, fetch_stats) -> DailyPeaks:
+    # Errors are returned on the record so one bad day does not end the stream.
+    day_start, day_end = window
+    try:
+        stats = fetch_stats(metric_types, project_id, instance_id, day_start, day_end, point_sink)
+    except Exception as e:
+        return DailyPeaks(project_id, instance_id, day_start, day_end, error=e)
+    return DailyPeaks(project_id, instance_id, day_start, day_end, stats)
+
+
+def _metric_types(metrics: list[str] | tuple[str, ...] | str | None) -> list[str]:
+    return [spec.metric_type for spec in psregistry.resolve(metrics or list(DEFAULT_METRICS))]
+
+
+def iter_daily_peaks(
+    project_id: str,
+    instance_id: str,
+    start: datetime,
+    end: datetime,
+    metrics: list[str] | tuple[str, ...] | str | None = None,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    in_order: bool = True,
+    point_sink=None,
+    fetch_stats=None
+) -> Iterator[DailyPeaks]:
+    """
+    Yields a DailyPeaks record for every UTC day from start to end as soon as it is fetched: in date order
+    (in_order=True), or in completion order. Each day is one batched request for all metrics (registry
+    names or metric types; default read and write ops), run on `concurrency` threads with at most
+    DAYS_IN_FLIGHT_PER_WORKER days per thread queued ahead of the caller. Closing the generator early
+    cancels the queued days. point_sink receives the raw points (see psexport.ReportExporter.write_points);
+    fetch_stats replaces psseries.fetch_metrics_stats (same signature).
+    """
+    metric_types = _metric_types(metrics)
+    fetch_stats = fetch_stats or psseries.fetch_metrics_stats
+    windows = iter(day_windows(start, end))
+    max_in_flight = max(1, concurrency) * DAYS_IN_FLIGHT_PER_WORKER
+    executor = ThreadPoolExecutor(max_workers=max(1, concurrency))
+    pending = deque()
+
+    def _submit_next() -> bool:
+        window = next(windows, None)
+        if window is None:
+            return False
+        pending.append(executor.submit(_fetch_day, project_id, instance_id, metric_types, window, point_sink, fetch_stats))
+        return True
+
+    try:
+        while len(pending) < max_in_flight and _submit_next():
+            pass
+        while pending:
+            if in_order:
+                record = pending.popleft().result()
+            else:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                future = next(iter(done))
+                pending.remove(future)
+                record = future.result()
+            _submit_next()
+            yield record
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+async def aiter_daily_peaks(
+    project_id: str,
+    instance_id: str,
+    start: datetime,
+    end: datetime,
+    metrics: list[str] | tuple[str, ...] | str | None = None,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    in_order: bool = True,
+    point_sink=None,
+    fetch_stats=None
+) -> AsyncIterator[DailyPeaks]:
+    """
+    Async variant of iter_daily_peaks for asyncio code: the blocking fetches run on a thread pool and each
+    record is yielded as it arrives, without blocking the event loop.
+    """
+    import asyncio
+
+    metric_types = _metric_types(metrics)
+    fetch_stats = fetch_stats or psseries.fetch_metrics_stats
+    windows = iter(day_windows(start, end))
+    max_in_flight = max(1, concurrency) * DAYS_IN_FLIGHT_PER_WORKER
+    executor = ThreadPoolExecutor(max_workers=max(1, concurrency))
+    pending = deque()
+
+    def _submit_next() -> bool:
+        window = next(windows, None)
+        if window is None:
+            return False
+        future = executor.submit(_fetch_day, project_id, instance_id, metric_types, window, point_sink, fetch_stats)
+        pending.append(asyncio.wrap_future(future))
+        return True
+
+    try:
+        while len(pending) < max_in_flight and _submit_next():
+            pass
+        while pending:
+            if in_order:
+                record = await pending.popleft()
+            else:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                future = next(iter(done))
+                pending.remove(future)
+                record = future.result()
+            _submit_next()
+            yield record
+    finally:
+        # Do not block the event loop on fetches that are already running; queued days are dropped.
+        executor.shutdown(wait=False, cancel_futures=True)
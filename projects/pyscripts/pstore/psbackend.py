@@ -0,0 +1,144 @@
+import logging
+from datetime import datetime
+
+import psclient
+import psinstrument
+import psquota
+import psrefine
+import psseries
+
+logger = logging.getLogger(__name__)
+
+PROMETHEUS_QUERY_RANGE_URL = "https://monitoring.googleapis.com/v1/projects/{project_id}/location/global/prometheus/api/v1/query_range"
+PARALLELSTORE_RESOURCE_TYPE = "parallelstore.googleapis.com/Instance"
+# Parallelstore counters are sampled every 60 s and rate() needs two samples inside its range, so the
+# range is twice the sample period; evaluated every minute, it is the rate over the latest minute.
+RATE_RANGE = "2m"
+
+
+class RawPointsBackend:
+    """
+    Downloads every 60-second ALIGN_RATE point for the whole range and reduces them locally
+    (psseries.fetch_bucketed_peaks). fetch_series swaps the point source, e.g. the on-disk cache.
+    point_sink receives the points bucket_peaks_many fetched (see psexport.ReportExporter.write_points).
+    """
+    name = "raw"
+
+    def __init__(self, fetch_series=None, point_sink=None):
+        self.fetch_series = fetch_series
+        self.point_sink = point_sink
+
+    def bucket_peaks(self, metric_type: str, project_id: str, instance_id: str, windows: list[tuple[datetime, datetime]], granularity: str) -> list[float | None]:
+        return psseries.fetch_bucketed_peaks(metric_type, project_id, instance_id, windows, granularity, self.fetch_series)
+
+    def bucket_peaks_many(self, metric_types: list[str], project_id: str, instance_id: str, windows: list[tuple[datetime, datetime]], granularity: str) -> dict[str, list[float | None]]:
+        """All metrics from one batched one_of request (or per metric from fetch_series, e.g. the cache)."""
+        return psseries.fetch_bucketed_peaks_for_metrics(metric_types, project_id, instance_id, windows, granularity, self.fetch_series, self.point_sink)
+
+
+class PromQLRollupBackend:
+    """
+    Lets Cloud Monitoring do both aggregation stages: one PromQL query_range request per metric (plus one per bucket clamped to the report range) returns
+    max_over_time of the per-minute rate for each bucket, so a single number per bucket crosses the wire.
+    The rate is taken over RATE_RANGE: a 1m range rarely holds the two samples rate() needs.
+    Each bucket is evaluated at its last second, so the subquery covers the same
+    00:00:00 - 23:59:59 window (for daily buckets) that the raw-point queries use.
+    """
+    name = "promql"
+
+    @staticmethod
+    def promql_metric_name(metric_type: str) -> str:
+        # Cloud Monitoring's PromQL mapping: the first "/" becomes ":", remaining "/" and "." become "_".
+        domain, _, path = metric_type.partition("/")
+        return f"{domain.replace('.', '_')}:{path.replace('/', '_').replace('.', '_')}"
+
+    @classmethod
+    def build_query(cls, metric_type: str, instance_id: str, bucket_seconds: int) -> str:
+        resource_type = PARALLELSTORE_RESOURCE_TYPE.replace(".", "_").replace("/", "_")
+        selector = f'{cls.promql_metric_name(metric_type)}{{monitored_resource="{resource_type}",instance_id="{instance_id}"}}'
+        return f"max_over_time(max(rate({selector}[{RATE_RANGE}]))[{bucket_seconds}s:1m])"
+
+    @staticmethod
+    def _query_range(metric_type: str, project_id: str, query: str, start: int, end: int, step: int) -> dict[int, float]:
+        """Runs one query_range request; returns {evaluation timestamp: peak} (NaN results left out)."""
+        session = psclient.get_prometheus_session()
+
+        def _query_range():
+            with psinstrument.timed_call("prometheus_query_range") as call:
+                response = session.post(
+                    PROMETHEUS_QUERY_RANGE_URL.format(project_id=project_id),
+                    data={"query": query, "start": start, "end": end, "step": f"{step}s"},
+                )
+                call.response_bytes = len(response.content)
+                response.raise_for_status()
+            return response
+        # Same per-project rate limit and 429/503 retries as the ListTimeSeries calls.
+        response = psquota.SCHEDULER.call(project_id, _query_range)
+        body = response.json()
+        if body.get("status") != "success":
+            raise RuntimeError(f"PromQL query failed for {metric_type}: {body.get('errorType')}: {body.get('error')}")
+
+        peaks = {}
+        for series in body["data"]["result"]:
+            for timestamp, value in series["values"]:
+                evaluated_at = int(float(timestamp))
+                peak = float(value)
+                if peak != peak:  # PromQL reports NaN for buckets without samples.
+                    continue
+                if evaluated_at not in peaks or peak > peaks[evaluated_at]:
+                    peaks[evaluated_at] = peak
+        return peaks
+
+    def bucket_peaks(self, metric_type: str, project_id: str, instance_id: str, windows: list[tuple[datetime, datetime]], granularity: str) -> list[float | None]:
+        if not windows:
+            return []
+        bucket_seconds = psseries.GRANULARITY_SECONDS[granularity]
+        # Results are keyed by evaluation timestamp, which is each bucket's last second. Full buckets share
+        # one request stepping bucket by bucket; a bucket clamped to the report range (see
+        # psseries.bucket_windows) is evaluated on its own, over just its own length.
+        window_seconds = [int(end.timestamp()) - int(start.timestamp()) + 1 for start, end in windows]
+        full_ends = [int(end.timestamp()) for (_, end), seconds in zip(windows, window_seconds) if seconds == bucket_seconds]
+        peaks_by_bucket_end = {}
+        if full_ends:
+            query = self.build_query(metric_type, instance_id, bucket_seconds)
+            logger.debug(f"PromQL query for {metric_type} on {instance_id}: {query}")
+            peaks_by_bucket_end.update(self._query_range(metric_type, project_id, query, full_ends[0], full_ends[-1], bucket_seconds))
+        for (_, bucket_end), seconds in zip(windows, window_seconds):
+            if seconds != bucket_seconds:
+                query = self.build_query(metric_type, instance_id, seconds)
+                logger.debug(f"PromQL query for {metric_type} on {instance_id}: {query}")
+                end = int(bucket_end.timestamp())
+                peaks_by_bucket_end.update(self._query_range(metric_type, project_id, query, end, end, bucket_seconds))
+        return [peaks_by_bucket_end.get(int(bucket_end.timestamp())) for _, bucket_end in windows]
+
+    def bucket_peaks_many(self, metric_types: list[str], project_id: str, instance_id: str, windows: list[tuple[datetime, datetime]], granularity: str) -> dict[str, list[float | None]]:
+        # One query_range request per metric; the rollup responses are tiny, so there is nothing to batch.
+        return {metric_type: self.bucket_peaks(metric_type, project_id, instance_id, windows, granularity) for metric_type in metric_types}
+
+
+class CoarseToFineBackend:
+    """
+    Exact bucket peaks from far fewer points (see psrefine): hourly rates for the whole range first,
+    then 60-second points only for the hours whose upper bound could still hold a bucket's peak.
+    Idle days cost one hourly point stream and no minute points at all. .stats accumulates what was transferred.
+    """
+    name = "coarse_to_fine"
+
+    def __init__(self, max_workers: int = 8):
+        self.max_workers = max_workers
+        self.stats = psrefine.RefineStats()
+
+    def bucket_peaks(self, metric_type: str, project_id: str, instance_id: str, windows: list[tuple[datetime, datetime]], granularity: str) -> list[float | None]:
+        return self.bucket_peaks_many([metric_type], project_id, instance_id, windows, granularity)[metric_type]
+
+    def bucket_peaks_many(self, metric_types: list[str], project_id: str, instance_id: str, windows: list[tuple[datetime, datetime]], granularity: str) -> dict[str, list[float | None]]:
+        if psseries.GRANULARITY_SECONDS[granularity] < psrefine.COARSE_PERIOD_SECONDS:
+            raise ValueError(f"The {self.name} backend needs buckets of at least {psrefine.COARSE_PERIOD_SECONDS} seconds.")
+        return psrefine.fetch_bucketed_peaks_coarse_to_fine(metric_types, project_id, instance_id, windows, self.max_workers, self.stats)
+
+
+BACKENDS = {
+    RawPointsBackend.name: RawPointsBackend,
+    PromQLRollupBackend.name: PromQLRollupBackend,
+    CoarseToFineBackend.name: CoarseToFineBackend,
+}
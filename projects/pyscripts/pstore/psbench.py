@@ -0,0 +1,169 @@
+"""
+Replay benchmark for the pstore fetch/report path.
+
+Feeds pre-built ListTimeSeries pages through psstub.ReplayMetricServiceClient (no network, no credentials)
+and times fetch_metric and the report functions of 7.py over a matrix of day ranges and instance counts.
+Each scenario runs in a fresh process so peak RSS is per scenario.
+
+    python psbench.py --days 1,30,365 --instances 1,10,100 --output bench.json [--baseline previous.json]
+"""
+import argparse
+import importlib.util
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import sys
+import time
+from datetime import datetime, timezone, timedelta
+
+import psclient
+import psshard
+import psstub
+
+REPORT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "7.py")
+BENCH_PROJECT = "bench-project"
+BENCH_FIRST_DAY = datetime(2025, 1, 1, tzinfo=timezone.utc)
+# Paths that only make sense for a single instance; fleet_report runs for every instance count.
+SINGLE_INSTANCE_PATHS = ("fetch_metric", "daily_report", "whole_period_report")
+ALL_PATHS = SINGLE_INSTANCE_PATHS + ("fleet_report",)
+
+
+def load_report_module():
+    """
+    Imports 7.py under the name pstore_report with its log handlers replaced by a NullHandler,
+    so benchmark runs measure record creation but do not write to the shared log file.
+    """
+    spec = importlib.util.spec_from_file_location("pstore_report", REPORT_SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    for handler in list(module.logger.handlers):
+        module.logger.removeHandler(handler)
+        handler.close()
+    module.logger.addHandler(logging.NullHandler())
+    module.logger.propagate = False
+    return module
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS and kilobytes on Linux.
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_scenario(path: str, days: int, instances: int, concurrency: int) -> dict:
+    """
+    Runs one benchmark scenario in the current process and returns its measurements.
+    """
+    report = load_report_module()
+    instance_ids = [f"bench-{index:03d}" for index in range(instances)]
+    client = psstub.ReplayMetricServiceClient(instance_ids, int(BENCH_FIRST_DAY.timestamp()), days)
+    psclient.configure(client_factory=lambda: client)
+    last_day = BENCH_FIRST_DAY + timedelta(days=days - 1)
+    setup_rss = peak_rss_mb()
+
+    started = time.perf_counter()
+    if path == "fetch_metric":
+        report.fetch_metric(report.READ_IOPS_METRIC, BENCH_PROJECT, instance_ids[0], BENCH_FIRST_DAY, last_day + timedelta(seconds=86399))
+    elif path == "daily_report":
+        report.log_daily_performance_over_period(BENCH_FIRST_DAY, last_day, BENCH_PROJECT, instance_ids[0], concurrency)
+    elif path == "whole_period_report":
+        report.log_bucketed_performance_over_period(BENCH_FIRST_DAY, last_day, BENCH_PROJECT, instance_ids[0], "day")
+    elif path == "fleet_report":
+        report.log_fleet_performance_over_period(BENCH_FIRST_DAY, last_day, BENCH_PROJECT, "day", False)
+    else:
+        raise ValueError(f"Unknown benchmark path: {path}")
+    seconds = time.perf_counter() - started
+
+    reported_instances = 1 if path in SINGLE_INSTANCE_PATHS else instances
+    # Points read from shards that were then split (psshard) were decoded but not used; they are reported apart.
+    abandoned_points = psshard.SHARDER.summary()["abandoned_points"]
+    points = client.points_served - abandoned_points
+    return {
+        "path": path,
+        "days": days,
+        "instances": reported_instances,
+        "requests": len(client.requests),
+        "points": points,
+        "abandoned_points": abandoned_points,
+        "seconds": seconds,
+        "points_per_sec": points / seconds if seconds else None,
+        "days_per_sec": days * reported_instances / seconds if seconds else None,
+        "setup_rss_mb": setup_rss,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def run_isolated(path: str, days: int, instances: int, concurrency: int) -> dict:
+    """Runs run_scenario in a freshly spawned process so RSS and imports do not leak between scenarios."""
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        return pool.apply(run_scenario, (path, days, instances, concurrency))
+
+
+def print_table(results: list[dict], baseline: dict | None = None) -> None:
+    header = f"{'path':<20} {'days':>5} {'inst':>5} {'reqs':>6} {'points':>11} {'seconds':>9} {'points/s':>12} {'days/s':>9} {'peak MB':>8}"
+    if baseline is not None:
+        header += f" {'speedup':>8}"
+    print(header)
+    print("-" * len(header))
+    for result in results:
+        line = (
+            f"{result['path']:<20} {result['days']:>5} {result['instances']:>5} {result['requests']:>6} {result['points']:>11} "
+            f"{result['seconds']:>9.3f} {result['points_per_sec'] or 0:>12.0f} {result['days_per_sec'] or 0:>9.1f} {result['peak_rss_mb']:>8.1f}"
+        )
+        if baseline is not None:
+            previous = baseline.get((result["path"], result["days"], result["instances"]))
+            line += f" {previous['seconds'] / result['seconds']:>7.2f}x" if previous and result["seconds"] else f" {'-':>8}"
+        print(line)
+
+
+def _int_list(value: str) -> list[int]:
+    return [int(item) for item in value.split(",") if item.strip()]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline replay benchmark for the pstore fetch/report path.")
+    parser.add_argument("--days", type=_int_list, default=[1, 30, 365], help="Comma-separated day ranges (default: 1,30,365).")
+    parser.add_argument("--instances", type=_int_list, default=[1, 10, 100], help="Comma-separated fleet sizes for fleet_report (default: 1,10,100).")
+    parser.add_argument("--paths", type=lambda value: value.split(","), default=list(ALL_PATHS), help=f"Comma-separated paths to run (default: {','.join(ALL_PATHS)}).")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrency passed to the day-by-day report (default: 8).")
+    parser.add_argument("--max_points", type=int, default=5_000_000, help="Skip scenarios that would replay more points than this (default: 5,000,000).")
+    parser.add_argument("--output", type=str, default=None, help="Write results as JSON to this file (default: pstore_bench_<UTC timestamp>.json).")
+    parser.add_argument("--baseline", type=str, default=None, help="Earlier --output file to compare against (adds a speedup column).")
+    args = parser.parse_args()
+
+    unknown_paths = set(args.paths) - set(ALL_PATHS)
+    if unknown_paths:
+        parser.error(f"unknown paths: {sorted(unknown_paths)}; choose from {','.join(ALL_PATHS)}")
+
+    scenarios = []
+    for path in args.paths:
+        for days in args.days:
+            for instances in ([1] if path in SINGLE_INSTANCE_PATHS else args.instances):
+                if days * instances * 1440 > args.max_points:
+                    print(f"Skipping {path} days={days} instances={instances}: over --max_points")
+                    continue
+                scenarios.append((path, days, instances))
+
+    results = []
+    for path, days, instances in scenarios:
+        print(f"Running {path} days={days} instances={instances} ...", flush=True)
+        results.append(run_isolated(path, days, instances, args.concurrency))
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = {(r["path"], r["days"], r["instances"]): r for r in json.load(f)["results"]}
+    print()
+    print_table(results, baseline)
+
+    output = args.output or f"pstore_bench_{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}.json"
+    with open(output, "w") as f:
+        json.dump({
+            "created": datetime.now(timezone.utc).isoformat(),
+            "python": sys.version.split()[0],
+            "concurrency": args.concurrency,
+            "results": results,
+        }, f, indent=4)
+    print(f"\nResults saved to {output}")
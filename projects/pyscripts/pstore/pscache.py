@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+import logging
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+from typing import TYPE_CHECKING
+
+import psseries
+
+if TYPE_CHECKING:
+    import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = "parallelstore_metrics_cache.sqlite"
+# Cloud Monitoring can still back-fill the newest minutes, so only windows older than this are marked complete.
+CACHE_SETTLE_SECONDS = 15 * 60
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS points (
+    project_id TEXT NOT NULL,
+    instance_id TEXT NOT NULL,
+    metric_type TEXT NOT NULL,
+    ts INTEGER NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (project_id, instance_id, metric_type, ts)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS coverage (
+    project_id TEXT NOT NULL,
+    instance_id TEXT NOT NULL,
+    metric_type TEXT NOT NULL,
+    start_ts INTEGER NOT NULL,
+    end_ts INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS coverage_key ON coverage (project_id, instance_id, metric_type, start_ts);
+"""
+
+
+class MetricCache:
+    """
+    SQLite store of 60-second rate points keyed by project/instance/metric/timestamp.
+    Alongside the points it records which [start, end] windows (epoch seconds, inclusive) have already
+    been fetched, so days with no data are remembered too and only the gaps are queried again.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def missing_windows(self, project_id: str, instance_id: str, metric_type: str, start_ts: int, end_ts: int) -> list[tuple[int, int]]:
+        """
+        Returns the sub-windows of [start_ts, end_ts] that are not covered by earlier fetches.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT start_ts, end_ts FROM coverage WHERE project_id = ? AND instance_id = ? AND metric_type = ? "
+                "AND end_ts >= ? AND start_ts <= ? ORDER BY start_ts",
+                (project_id, instance_id, metric_type, start_ts, end_ts)
+            ).fetchall()
+        gaps = []
+        cursor = start_ts
+        for covered_start, covered_end in rows:
+            if covered_start > cursor:
+                gaps.append((cursor, covered_start - 1))
+            cursor = max(cursor, covered_end + 1)
+            if cursor > end_ts:
+                break
+        if cursor <= end_ts:
+            gaps.append((cursor, end_ts))
+        return gaps
+
+    def store(self, project_id: str, instance_id: str, metric_type: str, start_ts: int, end_ts: int, timestamps: np.ndarray, values: np.ndarray) -> None:
+        """
+        Saves the points fetched for [start_ts, end_ts] and marks the settled part of that window as covered.
+        Coverage ends on the 60-second grid, so the next gap fetch picks up at the following minute.
+        """
+        covered_end = min(end_ts, int(time.time()) - CACHE_SETTLE_SECONDS)
+        covered_end -= covered_end % 60
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO points (project_id, instance_id, metric_type, ts, value) VALUES (?, ?, ?, ?, ?)",
+                ((project_id, instance_id, metric_type, ts, value) for ts, value in zip(timestamps.tolist(), values.tolist()))
+            )
+            if covered_end >= start_ts:
+                self._add_coverage(project_id, instance_id, metric_type, start_ts, covered_end)
+
+    def _add_coverage(self, project_id: str, instance_id: str, metric_type: str, start_ts: int, end_ts: int) -> None:
+        # Merge with any overlapping or adjacent windows so coverage stays one row per contiguous range.
+        key = (project_id, instance_id, metric_type)
+        overlapping = self._conn.execute(
+            "SELECT start_ts, end_ts FROM coverage WHERE project_id = ? AND instance_id = ? AND metric_type = ? "
+            "AND end_ts >= ? AND start_ts <= ?",
+            (*key, start_ts - 1, end_ts + 1)
+        ).fetchall()
+        for covered_start, covered_end in overlapping:
+            start_ts = min(start_ts, covered_start)
+            end_ts = max(end_ts, covered_end)
+        self._conn.execute(
+            "DELETE FROM coverage WHERE project_id = ? AND instance_id = ? AND metric_type = ? AND end_ts >= ? AND start_ts <= ?",
+            (*key, start_ts - 1, end_ts + 1)
+        )
+        self._conn.execute(
+            "INSERT INTO coverage (project_id, instance_id, metric_type, start_ts, end_ts) VALUES (?, ?, ?, ?, ?)",
+            (*key, start_ts, end_ts)
+        )
+
+    def load(self, project_id: str, instance_id: str, metric_type: str, start_ts: int, end_ts: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the cached (timestamps, values) arrays for [start_ts, end_ts], ordered by timestamp.
+        """
+        import numpy as np
+
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT ts, value FROM points WHERE project_id = ? AND instance_id = ? AND metric_type = ? "
+                "AND ts BETWEEN ? AND ? ORDER BY ts",
+                (project_id, instance_id, metric_type, start_ts, end_ts)
+            ).fetchall()
+        if not rows:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        points = np.array(rows, dtype=np.float64)
+        return points[:, 0].astype(np.int64), points[:, 1]
+
+
+def fetch_cached_series(
+    cache: MetricCache,
+    metric_type: str,
+    project_id_str: str,
+    instance_id_str: str,
+    query_start_time: datetime,
+    query_end_time: datetime,
+    offline: bool = False
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Cache-aware psseries.fetch_metric_series: only the windows the cache has not seen are requested
+    from Cloud Monitoring (through the shared psclient client, which may be a stub), then the full
+    range is served from the cache. With offline=True no API calls are made at all.
+    """
+    # Like the API's own interval, the range is (start, end]: a point stamped at the start is not in it.
+    start_ts = int(query_start_time.timestamp()) + 1
+    end_ts = int(query_end_time.timestamp())
+    gaps = cache.missing_windows(project_id_str, instance_id_str, metric_type, start_ts, end_ts)
+    if offline:
+        if gaps:
+            logger.debug(f"Offline: {len(gaps)} uncached window(s) for {metric_type} on {instance_id_str} will report no data")
+    else:
+        for gap_start, gap_end in gaps:
+            # Monitoring aligns ALIGN_RATE periods back from the interval end: ending every gap on a whole
+            # minute keeps the points of all runs on one 60-second grid.
+            gap_end -= gap_end % 60
+            if gap_end <= gap_start:
+                continue
+            logger.debug(f"Cache miss for {metric_type} on {instance_id_str}: {gap_start} to {gap_end}")
+            # Starting a second early, so the fetch holds every point stamped in [gap_start, gap_end].
+            timestamps, values = psseries.fetch_metric_series(
+                metric_type, project_id_str, instance_id_str,
+                datetime.fromtimestamp(gap_start - 1, tz=timezone.utc), datetime.fromtimestamp(gap_end, tz=timezone.utc)
+            )
+            cache.store(project_id_str, instance_id_str, metric_type, gap_start, gap_end, timestamps, values)
+    return cache.load(project_id_str, instance_id_str, metric_type, start_ts, end_ts)
@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import logging
+import threading
+from typing import TYPE_CHECKING
+
+import psinstrument
+import psquota
+
+# The Monitoring client, gRPC transport and google-auth are imported when the first client or session
+# is created, so commands that never reach the API (--help, --offline) do not pay for them.
+if TYPE_CHECKING:
+    from google.auth.transport.requests import AuthorizedSession
+    from google.cloud import monitoring_v3
+
+logger = logging.getLogger(__name__)
+
+# Defaults for the shared Monitoring client; override with configure().
+CLIENT_CONFIG = {
+    "keepalive_time_ms": 30000,      # Ping the server every 30s so idle channels between days stay open.
+    "keepalive_timeout_ms": 10000,
+    "max_message_mb": -1,            # Unlimited, as the gapic transport sets it; a positive value caps each page.
+    "per_project": False,            # True = one client per project instead of one per process.
+    "client_factory": None,          # Callable returning a client; used for offline/stub clients.
+    "session_factory": None,         # Callable returning an HTTP session; used for offline/stub PromQL.
+}
+
+_clients = {}
+_clients_lock = threading.Lock()
+_client_creation_lock = threading.Lock()
+_connections_opened = 0
+_authorized_sessions = {}
+
+MONITORING_READ_SCOPE = "https://www.googleapis.com/auth/monitoring.read"
+CLOUD_PLATFORM_SCOPE = "https://www.googleapis.com/auth/cloud-platform"
+
+
+def configure(**settings) -> None:
+    """
+    Updates CLIENT_CONFIG. Clients that were already created keep their settings,
+    so call this before the first fetch.
+    """
+    unknown = set(settings) - set(CLIENT_CONFIG)
+    if unknown:
+        raise ValueError(f"Unknown monitoring client settings: {sorted(unknown)}")
+    CLIENT_CONFIG.update(settings)
+
+
+def _channel_options() -> list[tuple[str, int]]:
+    max_message_bytes = int(CLIENT_CONFIG["max_message_mb"] * 1024 * 1024) if CLIENT_CONFIG["max_message_mb"] > 0 else -1
+    return [
+        ("grpc.keepalive_time_ms", CLIENT_CONFIG["keepalive_time_ms"]),
+        ("grpc.keepalive_timeout_ms", CLIENT_CONFIG["keepalive_timeout_ms"]),
+        ("grpc.keepalive_permit_without_calls", 1),
+        ("grpc.max_receive_message_length", max_message_bytes),
+        ("grpc.max_send_message_length", max_message_bytes),
+    ]
+
+
+def _create_channel(*args, **kwargs):
+    global _connections_opened
+    from google.cloud.monitoring_v3.services.metric_service.transports import MetricServiceGrpcTransport
+
+    kwargs["options"] = _channel_options()
+    channel = MetricServiceGrpcTransport.create_channel(*args, **kwargs)
+    with _clients_lock:
+        _connections_opened += 1
+    logger.debug(f"Opened Monitoring gRPC channel #{_connections_opened}")
+    return channel
+
+
+def _new_client():
+    """
+    Builds a client wrapped in psinstrument.InstrumentedMetricClient, so every list_time_series call
+    made through it is timed and counted, and in psquota.ScheduledMetricClient, so every call is
+    rate-limited per project and retried (each retried attempt is recorded as its own call).
+    """
+    global _connections_opened
+    factory = CLIENT_CONFIG["client_factory"]
+    with psinstrument.timed_call("metric_client_setup"):
+        if factory is not None:
+            with _clients_lock:
+                _connections_opened += 1
+            client = factory()
+        else:
+            from google.cloud import monitoring_v3
+            from google.cloud.monitoring_v3.services.metric_service.transports import MetricServiceGrpcTransport
+
+            transport = MetricServiceGrpcTransport(channel=_create_channel)
+            client = monitoring_v3.MetricServiceClient(transport=transport)
+    return psquota.ScheduledMetricClient(psinstrument.InstrumentedMetricClient(client))
+
+
+def get_metric_client(project_id: str | None = None) -> monitoring_v3.MetricServiceClient:
+    """
+    Returns the long-lived MetricServiceClient for this process (or for project_id when
+    CLIENT_CONFIG["per_project"] is set), creating it on first use.
+    Credentials are resolved and the gRPC channel is opened only once per client.
+    """
+    key = project_id if CLIENT_CONFIG["per_project"] else None
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    with _client_creation_lock:
+        # Re-check under the lock so concurrent first calls still open a single channel.
+        client = _clients.get(key)
+        if client is None:
+            client = _new_client()
+            _clients[key] = client
+    return client
+
+
+def get_authorized_session(scope: str = MONITORING_READ_SCOPE) -> AuthorizedSession:
+    """
+    Returns the process-wide authorized HTTP session for `scope`, creating it on first use.
+    Like the gRPC client it is shared so credentials are resolved and connections pooled once per scope.
+    """
+    global _connections_opened
+    session = _authorized_sessions.get(scope)
+    if session is not None:
+        return session
+    with _client_creation_lock:
+        session = _authorized_sessions.get(scope)
+        if session is None:
+            with psinstrument.timed_call("authorized_session_setup"):
+                if CLIENT_CONFIG["session_factory"] is not None:
+                    session = CLIENT_CONFIG["session_factory"]()
+                else:
+                    import google.auth
+                    from google.auth.transport.requests import AuthorizedSession
+
+                    credentials, _ = google.auth.default(scopes=[scope])
+                    session = AuthorizedSession(credentials)
+            _authorized_sessions[scope] = session
+            with _clients_lock:
+                _connections_opened += 1
+    return session
+
+
+def get_prometheus_session() -> AuthorizedSession:
+    """The shared session for Cloud Monitoring's Prometheus (PromQL) API."""
+    return get_authorized_session(MONITORING_READ_SCOPE)
+
+
+def connections_opened() -> int:
+    """Number of Monitoring channels (or stub clients) and HTTP sessions created during this run."""
+    return _connections_opened
+
+
+def reset_clients() -> None:
+    """Drops cached clients so the next get_metric_client() builds a new one (e.g. after configure())."""
+    with _clients_lock:
+        _clients.clear()
+        _authorized_sessions.clear()
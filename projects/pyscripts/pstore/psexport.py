@@ -0,0 +1,232 @@
+from __future__ import annotations
+
+import csv
+import gzip
+import threading
+from typing import TYPE_CHECKING
+
+import psregistry
+
+# pyarrow is optional: it is only imported when a .parquet/.arrow path is opened; CSV needs nothing extra.
+if TYPE_CHECKING:
+    import numpy as np
+
+DEFAULT_ROW_GROUP_ROWS = 65536
+FORMATS_BY_SUFFIX = {
+    ".parquet": "parquet",
+    ".arrow": "arrow",
+    ".feather": "arrow",
+    ".csv": "csv",
+    ".csv.gz": "csv.gz",
+}
+# One row per 60-second point. timestamp is the end of the alignment period (epoch seconds in CSV).
+POINT_COLUMNS = {
+    "project_id": "string",
+    "instance_id": "string",
+    "metric": "string",
+    "timestamp": "timestamp",
+    "value": "float",
+}
+
+
+def export_format(path: str) -> str:
+    for suffix, file_format in sorted(FORMATS_BY_SUFFIX.items(), key=lambda item: -len(item[0])):
+        if path.endswith(suffix):
+            return file_format
+    raise ValueError(f"Cannot tell the export format of {path}; use one of: {', '.join(FORMATS_BY_SUFFIX)}")
+
+
+def _import_pyarrow(path: str):
+    try:
+        import pyarrow as pa
+        import pyarrow.ipc  # noqa: F401
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError(f"Writing {path} needs pyarrow (pip install pyarrow); use a .csv or .csv.gz path instead.") from e
+    return pa, pq
+
+
+def summary_column_kind(name: str) -> str:
+    """Column type of a summary dict field (see summarize_daily_peaks and the fleet scan)."""
+    if name in ("date", "project_id", "instance_id", "state"):
+        return "string"
+    if name.startswith("met_"):
+        return "bool"
+    if name == "capacity_gib":
+        return "int"
+    return "float"
+
+
+class ColumnarWriter:
+    """
+    Appends rows to a Parquet, Arrow IPC or (optionally gzipped) CSV file in row groups: rows are buffered
+    column by column and written out every row_group_rows rows, so memory stays bounded however long the
+    run is. `columns` maps column name to "string", "float", "int", "bool" or "timestamp" (epoch seconds).
+    Safe to call from several threads. close() writes the last row group (and the Parquet/Arrow footer).
+    """
+
+    def __init__(self, path: str, columns: dict[str, str], row_group_rows: int = DEFAULT_ROW_GROUP_ROWS):
+        self.path = path
+        self.columns = dict(columns)
+        self.row_group_rows = max(1, row_group_rows)
+        self.format = export_format(path)
+        self.rows_written = 0
+        self._lock = threading.Lock()
+        self._buffer = {name: [] for name in self.columns}
+        self._buffered_rows = 0
+        self._file = None
+        self._csv = None
+        self._writer = None
+        self._schema = None
+        if self.format in ("parquet", "arrow"):
+            self._open_arrow()
+        else:
+            self._file = gzip.open(path, "wt", newline="") if self.format == "csv.gz" else open(path, "w", newline="")
+            self._csv = csv.writer(self._file)
+            self._csv.writerow(self.columns)
+
+    def _open_arrow(self) -> None:
+        pa, pq = _import_pyarrow(self.path)
+        arrow_types = {
+            "string": pa.string(),
+            "float": pa.float64(),
+            "int": pa.int64(),
+            "bool": pa.bool_(),
+            "timestamp": pa.timestamp("s", tz="UTC"),
+        }
+        self._schema = pa.schema([(name, arrow_types[kind]) for name, kind in self.columns.items()])
+        if self.format == "parquet":
+            self._writer = pq.ParquetWriter(self.path, self._schema, compression="zstd")
+        else:
+            self._writer = pa.ipc.new_file(self.path, self._schema)
+
+    def write_rows(self, rows: list[dict]) -> None:
+        """Appends dict rows; missing fields are written as nulls and fields outside `columns` are ignored."""
+        with self._lock:
+            for row in rows:
+                for name, values in self._buffer.items():
+                    values.append(row.get(name))
+            self._buffered_rows += len(rows)
+            self._flush_full_groups()
+
+    def write_columns(self, columns: dict[str, list]) -> None:
+        """
+        Appends equal-length columns (lists or NumPy arrays); a non-list value is repeated for every row,
+        e.g. write_columns({"instance_id": "x", "timestamp": timestamps, ...}).
+        """
+        lengths = {len(values) for values in columns.values() if isinstance(values, list) or hasattr(values, "tolist")}
+        if len(lengths) > 1:
+            raise ValueError(f"Columns of different lengths: {sorted(lengths)}")
+        row_count = lengths.pop() if lengths else 0
+        if row_count == 0:
+            return
+        with self._lock:
+            for name, values in self._buffer.items():
+                value = columns.get(name)
+                if hasattr(value, "tolist"):
+                    values.extend(value.tolist())
+                elif isinstance(value, list):
+                    values.extend(value)
+                else:
+                    values.extend([value] * row_count)
+            self._buffered_rows += row_count
+            self._flush_full_groups()
+
+    def _flush_full_groups(self) -> None:
+        while self._buffered_rows >= self.row_group_rows:
+            self._write_group(self.row_group_rows)
+
+    def _write_group(self, row_count: int) -> None:
+        group = {name: values[:row_count] for name, values in self._buffer.items()}
+        for values in self._buffer.values():
+            del values[:row_count]
+        self._buffered_rows -= row_count
+        if self._writer is not None:
+            import pyarrow as pa
+
+            arrays = [
+                pa.array(group[field.name], type=pa.int64()).cast(field.type) if self.columns[field.name] == "timestamp"
+                else pa.array(group[field.name], type=field.type)
+                for field in self._schema
+            ]
+            self._writer.write_table(pa.Table.from_arrays(arrays, schema=self._schema))
+        else:
+            self._csv.writerows(zip(*group.values()))
+            self._file.flush()
+        self.rows_written += row_count
+
+    def close(self) -> None:
+        with self._lock:
+            if self._buffered_rows:
+                self._write_group(self._buffered_rows)
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ReportExporter:
+    """
+    Streams what a report run produces to columnar files for notebooks: every window's summary dict
+    (write_summary) and, optionally, every 60-second point that was fetched (write_points, which has the
+    point_sink signature the fetch paths take). The summary columns are fixed by the first summary written.
+    """
+
+    def __init__(self, summaries_path: str | None = None, points_path: str | None = None, row_group_rows: int = DEFAULT_ROW_GROUP_ROWS):
+        self.summaries_path = summaries_path
+        self.row_group_rows = row_group_rows
+        self._summaries = None
+        self._summaries_lock = threading.Lock()
+        # The summary writer is opened with the first summary; check its path (and pyarrow) up front instead.
+        if summaries_path and export_format(summaries_path) in ("parquet", "arrow"):
+            _import_pyarrow(summaries_path)
+        self._points = ColumnarWriter(points_path, POINT_COLUMNS, row_group_rows) if points_path else None
+
+    @property
+    def point_sink(self):
+        """write_points when points are exported, else None (so fetch paths skip decoding them twice)."""
+        return self.write_points if self._points is not None else None
+
+    def write_summary(self, project_id: str | None, instance_id: str | None, summary: dict) -> None:
+        self.write_summaries(project_id, instance_id, [summary])
+
+    def write_summaries(self, project_id: str | None, instance_id: str | None, summaries: list[dict]) -> None:
+        """Writes summary dicts; project_id/instance_id fill in the rows that do not carry their own."""
+        if not self.summaries_path or not summaries:
+            return
+        rows = [{"project_id": project_id, "instance_id": instance_id, **summary} for summary in summaries]
+        with self._summaries_lock:
+            if self._summaries is None:
+                columns = {name: summary_column_kind(name) for name in rows[0]}
+                self._summaries = ColumnarWriter(self.summaries_path, columns, self.row_group_rows)
+        for row in rows:
+            if row.get("capacity_gib") is not None:
+                row["capacity_gib"] = int(row["capacity_gib"])
+        self._summaries.write_rows(rows)
+
+    def write_points(self, project_id: str, instance_id: str, metric_type: str, timestamps: list[int] | np.ndarray, values: list[float] | np.ndarray) -> None:
+        spec = psregistry.METRICS_BY_TYPE.get(metric_type)
+        self._points.write_columns({
+            "project_id": project_id,
+            "instance_id": instance_id,
+            "metric": spec.name if spec else metric_type,
+            "timestamp": timestamps,
+            "value": values,
+        })
+
+    def close(self) -> dict[str, int]:
+        """Closes both files and returns {path: rows written}."""
+        rows_written = {}
+        for writer in (self._summaries, self._points):
+            if writer is not None:
+                writer.close()
+                rows_written[writer.path] = writer.rows_written
+        return rows_written
@@ -0,0 +1,264 @@
+from __future__ import annotations
+
+import base64
+import html
+import struct
+import threading
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING
+
+import psregistry
+
+if TYPE_CHECKING:
+    import numpy as np
+
+MINUTES_PER_DAY = 1440
+HEATMAP_FORMATS = (".html", ".png")
+# Image rows per day: short periods get taller rows so they stay readable, long ones one pixel per day.
+MAX_ROW_PIXELS = 12
+TARGET_IMAGE_ROWS = 360
+TOP_MINUTES = 5
+# Anchor colours of the scale (dark blue for idle through green to yellow for the peak); minutes without
+# a point are drawn grey so they are not mistaken for idle ones.
+COLOR_ANCHORS = ((68, 1, 84), (59, 82, 139), (33, 145, 140), (94, 201, 98), (253, 231, 37))
+MISSING_COLOR = (224, 224, 224)
+
+
+def minute_matrix(timestamps: np.ndarray, values: np.ndarray, first_day: datetime, days: int) -> np.ndarray:
+    """
+    The 60-second rates of one series as a days x MINUTES_PER_DAY matrix: row d is the d-th UTC day from
+    first_day, column m the point stamped m minutes after its midnight. Several series (or repeated points)
+    landing on one minute keep the largest value; minutes without a point, and points outside the days,
+    are NaN / dropped. One vectorized scatter into a flat grid and a reshape, no per-point Python loop.
+    """
+    import numpy as np
+
+    grid = np.full(days * MINUTES_PER_DAY, np.nan, dtype=np.float32)
+    _scatter_max(grid, timestamps, values, _day_start_ts(first_day))
+    return grid.reshape(days, MINUTES_PER_DAY)
+
+
+def _day_start_ts(moment: datetime) -> int:
+    return int(datetime(moment.year, moment.month, moment.day, tzinfo=timezone.utc).timestamp())
+
+
+def _scatter_max(grid: np.ndarray, timestamps, values, first_ts: int) -> None:
+    import numpy as np
+
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    if timestamps.size == 0:
+        return
+    minute_index = (timestamps - first_ts) // 60
+    in_range = (minute_index >= 0) & (minute_index < grid.size)
+    # fmax ignores the NaN the grid starts from, so the first point in each minute becomes its running max.
+    np.fmax.at(grid, minute_index[in_range], values[in_range])
+
+
+def row_maxima(matrix: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Each day's peak and the minute of day it happened (-1 for a day without points)."""
+    import numpy as np
+
+    has_data = ~np.isnan(matrix).all(axis=1)
+    peaks = np.fmax.reduce(matrix, axis=1)
+    minutes = np.where(has_data, np.argmax(np.nan_to_num(matrix, nan=-np.inf), axis=1), -1)
+    return peaks, minutes
+
+
+def column_maxima(matrix: np.ndarray) -> np.ndarray:
+    """The highest rate of every minute of day across all days (NaN where no day had a point)."""
+    import numpy as np
+
+    return np.fmax.reduce(matrix, axis=0)
+
+
+def busiest_minutes(minute_peaks: np.ndarray, count: int = TOP_MINUTES) -> list[int]:
+    """The minutes of day with the highest column maxima, busiest first."""
+    import numpy as np
+
+    order = np.argsort(np.nan_to_num(minute_peaks, nan=-np.inf), kind="stable")[::-1][:count]
+    return [int(minute) for minute in order if not np.isnan(minute_peaks[minute])]
+
+
+def peak_cell(matrix: np.ndarray) -> tuple[int, int] | None:
+    """(day index, minute of day) of the highest rate in the matrix, or None if it has no points."""
+    import numpy as np
+
+    if np.isnan(matrix).all():
+        return None
+    day_index, minute = divmod(int(np.nanargmax(matrix)), matrix.shape[1])
+    return day_index, minute
+
+
+def minute_label(minute: int) -> str:
+    return f"{minute // 60:02d}:{minute % 60:02d}"
+
+
+class HeatmapRecorder:
+    """
+    Point sink (see psexport.ReportExporter.write_points for the signature) that scatters every fetched
+    60-second point straight into its instance/metric's days x minutes matrix, so a fleet-wide report
+    keeps one float32 grid per instance and metric instead of the points.
+    """
+
+    def __init__(self, start: datetime, end: datetime):
+        self.first_day = datetime(start.year, start.month, start.day, tzinfo=timezone.utc)
+        self.days = (_day_start_ts(end) - _day_start_ts(start)) // 86400 + 1
+        self._lock = threading.Lock()
+        self._grids = {}
+
+    def add_points(self, project_id: str, instance_id: str, metric_type: str, timestamps: list[int] | np.ndarray, values: list[float] | np.ndarray) -> None:
+        import numpy as np
+
+        key = (project_id, instance_id, metric_type)
+        with self._lock:
+            grid = self._grids.get(key)
+            if grid is None:
+                grid = self._grids[key] = np.full(self.days * MINUTES_PER_DAY, np.nan, dtype=np.float32)
+            _scatter_max(grid, timestamps, values, int(self.first_day.timestamp()))
+
+    def heatmaps(self) -> dict[tuple[str, str, str], np.ndarray]:
+        """{(project_id, instance_id, metric_type): days x MINUTES_PER_DAY matrix} of everything recorded."""
+        with self._lock:
+            return {key: grid.reshape(self.days, MINUTES_PER_DAY) for key, grid in sorted(self._grids.items())}
+
+
+def _color_table() -> np.ndarray:
+    import numpy as np
+
+    anchors = np.array(COLOR_ANCHORS, dtype=np.float64)
+    positions = np.linspace(0, 255, len(anchors))
+    levels = np.arange(256)
+    return np.stack([np.interp(levels, positions, anchors[:, channel]) for channel in range(3)], axis=1).astype(np.uint8)
+
+
+def colorize(matrix: np.ndarray, scale_max: float | None = None) -> np.ndarray:
+    """Maps a matrix to an RGB image (rows x columns x 3, uint8) on a linear 0..scale_max colour scale."""
+    import numpy as np
+
+    missing = np.isnan(matrix)
+    if scale_max is None:
+        scale_max = float(np.nanmax(matrix)) if not missing.all() else 0.0
+    scaled = np.nan_to_num(matrix, nan=0.0) / scale_max if scale_max > 0 else np.zeros(matrix.shape)
+    levels = np.clip(np.rint(scaled * 255), 0, 255).astype(np.uint8)
+    image = _color_table()[levels]
+    image[missing] = MISSING_COLOR
+    return image
+
+
+def encode_png(image: np.ndarray) -> bytes:
+    """A truecolour PNG of an RGB image, written with zlib only (no imaging library needed)."""
+    import numpy as np
+
+    height, width, _ = image.shape
+    # Filter type 0 (none) in front of every scanline.
+    scanlines = np.hstack([np.zeros((height, 1), dtype=np.uint8), image.reshape(height, width * 3)])
+
+    def _chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + _chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+        + _chunk(b"IDAT", zlib.compress(scanlines.tobytes(), 9))
+        + _chunk(b"IEND", b"")
+    )
+
+
+def render_png(matrix: np.ndarray) -> bytes:
+    """The heatmap itself: one pixel per minute, each day repeated to at most MAX_ROW_PIXELS rows."""
+    import numpy as np
+
+    row_pixels = max(1, min(MAX_ROW_PIXELS, TARGET_IMAGE_ROWS // max(1, matrix.shape[0])))
+    return encode_png(np.repeat(colorize(matrix), row_pixels, axis=0))
+
+
+def _data_uri(png: bytes) -> str:
+    return "data:image/png;base64," + base64.b64encode(png).decode("ascii")
+
+
+def _format(value: float) -> str:
+    return "No data" if value != value else f"{value:.2f}"
+
+
+_STYLE = """
+body { font-family: sans-serif; margin: 1.5em; color: #222; }
+section { margin-bottom: 3em; }
+img.map { width: 100%; image-rendering: pixelated; display: block; }
+img.strip { width: 100%; height: 24px; image-rendering: pixelated; display: block; }
+img.scale { width: 240px; height: 12px; vertical-align: middle; }
+.hours { display: flex; font-size: 11px; color: #666; }
+.hours span { flex: 1; }
+table { border-collapse: collapse; font-size: 13px; margin-top: 1em; }
+td, th { border: 1px solid #ccc; padding: 2px 8px; text-align: right; }
+"""
+
+
+def _render_section(project_id: str, instance_id: str, metric_type: str, matrix: np.ndarray, first_day: datetime) -> str:
+    import numpy as np
+
+    spec = psregistry.get(metric_type)
+    peaks, peak_minutes = row_maxima(matrix)
+    minute_peaks = column_maxima(matrix)
+    scale_max = float(np.nanmax(matrix)) if not np.isnan(matrix).all() else 0.0
+    busiest = busiest_minutes(minute_peaks)
+    legend = colorize(np.linspace(0, scale_max, 256).reshape(1, 256), scale_max)
+
+    rows = []
+    for day_index, (peak, minute) in enumerate(zip(peaks.tolist(), peak_minutes.tolist())):
+        day = (first_day + timedelta(days=day_index)).strftime("%Y-%m-%d")
+        rows.append(f"<tr><td>{day}</td><td>{_format(peak)}</td><td>{minute_label(minute) if minute >= 0 else ''}</td></tr>")
+    busiest_text = ", ".join(f"{minute_label(minute)} ({minute_peaks[minute]:.2f})" for minute in busiest) or "No data"
+    return f"""<section>
+<h2>{html.escape(instance_id)}: {html.escape(spec.label)} ({html.escape(spec.unit)})</h2>
+<p>Project {html.escape(project_id)}. One row per UTC day, one column per minute (60-second rate stamped at that minute); grey means no point.
+Scale: 0 <img class="scale" src="{_data_uri(encode_png(legend))}" alt="colour scale"> {scale_max:.2f} {html.escape(spec.unit)}</p>
+<img class="map" src="{_data_uri(render_png(matrix))}" alt="heatmap of {html.escape(instance_id)} {html.escape(spec.label)}">
+<div class="hours">{''.join(f'<span>{hour:02d}</span>' for hour in range(24))}</div>
+<h3>Column maxima: highest rate at each minute of day across all days</h3>
+<img class="strip" src="{_data_uri(encode_png(colorize(minute_peaks.reshape(1, -1), scale_max)))}" alt="column maxima">
+<p>Busiest minutes of day: {busiest_text}</p>
+<h3>Row maxima: each day's peak</h3>
+<table><tr><th>Day</th><th>Peak ({html.escape(spec.unit)})</th><th>At (UTC)</th></tr>
+{chr(10).join(rows)}
+</table>
+</section>"""
+
+
+def render_html(heatmaps: dict[tuple[str, str, str], np.ndarray], first_day: datetime, title: str = "Parallelstore 60-second rate heatmaps") -> str:
+    """One self-contained page (images inlined as data URIs) with a section per instance/metric."""
+    sections = "\n".join(
+        _render_section(project_id, instance_id, metric_type, matrix, first_day)
+        for (project_id, instance_id, metric_type), matrix in heatmaps.items()
+    )
+    return f"""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{html.escape(title)}</title><style>{_STYLE}</style></head>
+<body><h1>{html.escape(title)}</h1>
+{sections or '<p>No data.</p>'}
+</body></html>
+"""
+
+
+def _safe_name(text: str) -> str:
+    return "".join(character if character.isalnum() or character in "-_." else "_" for character in text)
+
+
+def write_heatmaps(path: str, heatmaps: dict[tuple[str, str, str], np.ndarray], first_day: datetime) -> list[str]:
+    """
+    Writes the heatmaps: a .html path gets one self-contained page; a .png path one image per
+    instance/metric, named <stem>_<instance>_<metric>.png. Returns the files written.
+    """
+    if path.endswith(".html"):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(render_html(heatmaps, first_day))
+        return [path]
+    if not path.endswith(".png"):
+        raise ValueError(f"Cannot tell the heatmap format of {path}; use one of: {', '.join(HEATMAP_FORMATS)}")
+    written = []
+    for (_, instance_id, metric_type), matrix in heatmaps.items():
+        image_path = f"{path[:-len('.png')]}_{_safe_name(instance_id)}_{psregistry.get(metric_type).name}.png"
+        with open(image_path, "wb") as f:
+            f.write(render_png(matrix))
+        written.append(image_path)
+    return written
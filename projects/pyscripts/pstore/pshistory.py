@@ -0,0 +1,375 @@
+"""
+Daily peak store, and a backfill of it from the logs of past runs, so days a run has already reported
+are never queried from Cloud Monitoring again (see 7.py --peak_db).
+
+    python3 pshistory.py --peak_db peaks.sqlite parallelstore_metrics_over_time.log [parallelstore_metrics_over_time.jsonl ...]
+
+The ingester reads each log once, line by line, and understands what every generation of the report
+wrote: the human log ("Peak Read IOPS (rate): 123.45 ops/sec", "None" and "No data" entries, the older
+"Peak Throughput" of transferred bytes in MBps) and the JSON-lines log, whose summary dicts carry the
+unrounded peaks. Only whole, settled UTC days of daily reports are taken; days whose fetch logged an
+error, and week/hour bucket runs, are skipped. Human-log peaks keep the two decimals they were logged
+with; a later run that fetches the day from the API replaces them.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import pscache
+import psregistry
+import psseries
+
+SOURCE_API = "api"
+SOURCE_LOG = "log"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS daily_peaks (
+    project_id TEXT NOT NULL,
+    instance_id TEXT NOT NULL,
+    metric_type TEXT NOT NULL,
+    day TEXT NOT NULL,
+    peak REAL,
+    source TEXT NOT NULL,
+    PRIMARY KEY (project_id, instance_id, metric_type, day)
+) WITHOUT ROWID;
+"""
+
+# What each "Peak <label> (rate)" line of the human log holds: (registry name, factor from the logged
+# unit to the metric's unit). The older scripts' "Throughput" is transferred bytes in MBps; the current
+# "Total/Read/Write Throughput" lines are derived from the ops peaks and carry nothing new.
+_PEAK_LABELS = {spec.label: (spec.name, 1.0) for spec in psregistry.METRICS.values()}
+_PEAK_LABELS["Throughput"] = ("transferred_bytes", 1 / psregistry.METRICS["transferred_bytes"].mbps_per_unit)
+# Summary dict fields (summarize_daily_peaks) that are peaks, by registry name.
+_SUMMARY_FIELDS = {"peak_read_iops_ops_sec": "read_ops", "peak_write_iops_ops_sec": "write_ops"}
+_SUMMARY_FIELDS.update({f"peak_{name}": name for name in psregistry.METRICS})
+_DATE = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+
+def day_complete(day: str, as_of: datetime) -> bool:
+    """Whether the UTC day had ended (and settled, see pscache.CACHE_SETTLE_SECONDS) by as_of."""
+    day_end = datetime.strptime(day, "%Y-%m-%d").replace(tzinfo=timezone.utc) + timedelta(days=1)
+    return day_end + timedelta(seconds=pscache.CACHE_SETTLE_SECONDS) <= as_of
+
+
+class DailyPeakStore:
+    """
+    SQLite store of the peak 60-second rate per project/instance/metric/UTC day. A NULL peak records a
+    day that was queried and had no data, so it is not queried again either. Rows from the API replace
+    anything; rows backfilled from logs never replace rows from the API.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def store_many(self, rows: list[tuple[str, str, str, str, float | None]], source: str = SOURCE_API) -> None:
+        """Saves (project_id, instance_id, metric_type, day, peak) rows."""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO daily_peaks (project_id, instance_id, metric_type, day, peak, source) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (project_id, instance_id, metric_type, day) DO UPDATE SET peak = excluded.peak, source = excluded.source "
+                "WHERE excluded.source = ? OR daily_peaks.source = ?",
+                ((*row, source, SOURCE_API, SOURCE_LOG) for row in rows)
+            )
+
+    def peaks(self, project_id: str, instance_id: str, day: str) -> dict[str, float | None]:
+        """{metric_type: peak} stored for one day (metrics never stored are absent)."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT metric_type, peak FROM daily_peaks WHERE project_id = ? AND instance_id = ? AND day = ?",
+                (project_id, instance_id, day)
+            ).fetchall()
+        return dict(rows)
+
+    def day_count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM (SELECT DISTINCT project_id, instance_id, day FROM daily_peaks)").fetchone()[0]
+
+
+def stats_from_peak(peak: float | None) -> psseries.RateStats:
+    """A RateStats carrying only a stored peak (the daily report only reads .maximum)."""
+    stats = psseries.RateStats()
+    stats.maximum = peak
+    return stats
+
+
+class StoredPeakFetcher:
+    """
+    fetch_stats for psapi.iter_daily_peaks that answers days whose metrics are all in the store without
+    any API call; other days go to fetch_stats and, once the day is complete, their peaks are stored.
+    Served days have no points, so nothing reaches the point sink for them.
+    """
+
+    def __init__(self, store: DailyPeakStore, fetch_stats):
+        self.store = store
+        self.fetch_stats = fetch_stats
+        self.served = 0
+        self.fetched = 0
+        self.stored = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, metric_types: list[str], project_id: str, instance_id: str, query_start_time: datetime, query_end_time: datetime, point_sink=None) -> dict[str, psseries.RateStats]:
+        day = query_start_time.strftime("%Y-%m-%d")
+        stored = self.store.peaks(project_id, instance_id, day)
+        if all(metric_type in stored for metric_type in metric_types):
+            with self._lock:
+                self.served += 1
+            return {metric_type: stats_from_peak(stored[metric_type]) for metric_type in metric_types}
+        stats = self.fetch_stats(metric_types, project_id, instance_id, query_start_time, query_end_time, point_sink)
+        with self._lock:
+            self.fetched += 1
+        if day_complete(day, datetime.now(timezone.utc)):
+            self.store.store_many([(project_id, instance_id, metric_type, day, stats[metric_type].maximum) for metric_type in metric_types])
+            with self._lock:
+                self.stored += 1
+        return stats
+
+
+class IngestStats:
+    """What one ingest run read and kept."""
+    __slots__ = ("lines", "runs", "sections", "days", "rows", "incomplete_days", "failed_days", "skipped_sections")
+
+    def __init__(self):
+        self.lines = 0
+        self.runs = 0
+        self.sections = 0
+        self.days = 0
+        self.rows = 0
+        self.incomplete_days = 0
+        self.failed_days = 0
+        self.skipped_sections = 0
+
+    def __repr__(self):
+        return ", ".join(f"{field}={getattr(self, field)}" for field in self.__slots__)
+
+
+class _Section:
+    """One instance's block of one daily report in a log, buffered until it ends."""
+    __slots__ = ("project_id", "instance_id", "period_start", "daily", "days", "exact_days", "failed", "last_day")
+
+    def __init__(self, project_id: str | None, instance_id: str | None, period_start: str | None, daily: bool):
+        self.project_id = project_id
+        self.instance_id = instance_id
+        self.period_start = period_start
+        self.daily = daily
+        self.days = {}
+        self.exact_days = set()
+        self.failed = set()
+        self.last_day = None
+
+    def day(self, label: str) -> dict | None:
+        """The peaks of the day labelled label, checking that labels run day by day from the period start."""
+        peaks = self.days.get(label)
+        if peaks is not None or not self.daily:
+            return peaks
+        try:
+            day = datetime.strptime(label, "%Y-%m-%d")
+        except ValueError:
+            # An hour bucket label: not a daily report after all.
+            self.daily = False
+            return None
+        expected = self.last_day + timedelta(days=1) if self.last_day else (datetime.strptime(self.period_start, "%Y-%m-%d") if self.period_start else day)
+        if day != expected:
+            # Week buckets (the older scripts label them like days) or a report out of step.
+            self.daily = False
+            return None
+        self.last_day = day
+        peaks = self.days[label] = {}
+        return peaks
+
+
+class LogIngester:
+    """
+    Streams report logs into a DailyPeakStore. Feed it lines with add_line() (or whole files with
+    ingest()); sections are written as they end and finish() writes the last one.
+    """
+
+    def __init__(self, store: DailyPeakStore):
+        self.store = store
+        self.stats = IngestStats()
+        self._project_id = None
+        self._period_start = None
+        self._run_time = None
+        self._section = None
+        self._current_day = None
+
+    def ingest(self, path: str) -> IngestStats:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            for line in f:
+                self.add_line(line)
+        self.finish()
+        return self.stats
+
+    def add_line(self, line: str) -> None:
+        self.stats.lines += 1
+        summary = None
+        if line.startswith("{"):
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                return
+            message, level, summary = entry.get("message", ""), entry.get("level", ""), entry.get("summary")
+            logged_at = entry.get("time")
+        else:
+            parts = line.rstrip("\n").split(" - ", 3)
+            if len(parts) < 4:
+                return  # A traceback or other continuation line.
+            logged_at, _, level, message = parts
+        self._message(message, level, summary, logged_at)
+
+    def _message(self, message: str, level: str, summary: dict | None, logged_at: str | None) -> None:
+        section = self._section
+        if message.startswith("  Peak "):
+            if section is not None and self._current_day is not None:
+                self._peak_line(section, message)
+        elif message.startswith("--- Querying data for: "):
+            self._start_day(message[len("--- Querying data for: "):].rstrip(" -"))
+        elif message.startswith("Results for "):
+            self._start_day(message[len("Results for "):].rstrip(":"), summary)
+        elif message.startswith("No significant performance metrics (IOPS or Throughput) found for "):
+            peaks = self._start_day(message.rsplit(" ", 1)[1].rstrip("."), summary)
+            if peaks is not None and summary is None:
+                # Neither ops counter nor transferred bytes had a point, so the day was idle throughout.
+                for name in ("read_ops", "write_ops", "transferred_bytes"):
+                    peaks.setdefault(psregistry.METRICS[name].metric_type, None)
+        elif level in ("ERROR", "CRITICAL"):
+            if section is not None and message.startswith(("Error", "Could not")):
+                dates = set(_DATE.findall(message))
+                if len(dates) == 1:
+                    section.failed.update(dates)
+                else:
+                    # A whole-period or fleet fetch failed: nothing in the section can be trusted.
+                    section.daily = False
+        elif message.startswith("Fetching Daily Peak Performance for Parallelstore Instance: "):
+            self._start_section(message.rsplit(": ", 1)[1], True)
+        elif message.startswith("Fetching Peak Performance ("):
+            granularity = message[len("Fetching Peak Performance ("):].split(" ", 1)[0]
+            self._start_section(None if " for ALL " in message else message.rsplit(": ", 1)[1], granularity == "day")
+        elif message.startswith("===== Instance: "):
+            if section is not None:
+                self._start_section(message[len("===== Instance: "):].rstrip(" ="), section.daily)
+        elif message.startswith("Project: "):
+            self._project_id = message[len("Project: "):].strip()
+            if section is not None:
+                section.project_id = self._project_id
+        elif message.startswith("Period: "):
+            self._period_start = message[len("Period: "):].split(" ", 1)[0]
+            if section is not None and section.period_start is None:
+                section.period_start = self._period_start
+        elif message.startswith("Current script execution time (UTC): "):
+            self._run_time = datetime.fromisoformat(message.rsplit(": ", 1)[1].strip())
+        elif message.startswith("Starting Parallelstore"):
+            self._flush_section()
+            self.stats.runs += 1
+            self._project_id = None
+            self._period_start = None
+            self._run_time = self._logged_at(logged_at)
+        elif message.startswith(("Daily performance fetching completed", "Fleet performance fetching completed", "Script execution finished")):
+            self._flush_section()
+
+    @staticmethod
+    def _logged_at(logged_at: str | None) -> datetime | None:
+        """When a line was logged: JSON lines carry UTC; the human log's local time is taken a day early."""
+        if not logged_at:
+            return None
+        try:
+            if "T" in logged_at:
+                return datetime.fromisoformat(logged_at)
+            return datetime.strptime(logged_at, "%Y-%m-%d %H:%M:%S,%f").replace(tzinfo=timezone.utc) - timedelta(days=1)
+        except ValueError:
+            return None
+
+    def _start_section(self, instance_id: str | None, daily: bool) -> None:
+        self._flush_section()
+        self._current_day = None
+        # A fleet header names no instance; its sections start at each "===== Instance:" line.
+        self._section = _Section(self._project_id, instance_id, self._period_start, daily)
+
+    def _start_day(self, label: str, summary: dict | None = None) -> dict | None:
+        section = self._section
+        if section is None or section.instance_id is None:
+            self._current_day = None
+            return None
+        peaks = section.day(label)
+        self._current_day = label if peaks is not None else None
+        if peaks is not None and summary:
+            for field, name in _SUMMARY_FIELDS.items():
+                if field in summary:
+                    peaks[psregistry.METRICS[name].metric_type] = summary[field]
+            section.exact_days.add(label)
+        return peaks
+
+    def _peak_line(self, section: _Section, message: str) -> None:
+        if self._current_day in section.exact_days:
+            return
+        label, _, rest = message[len("  Peak "):].partition(" (rate): ")
+        target = _PEAK_LABELS.get(label)
+        if target is None:
+            return
+        name, factor = target
+        value = rest.split(" ", 1)[0]
+        try:
+            peak = float(value) * factor
+        except ValueError:
+            peak = None  # "None" (older scripts) or "No data".
+        section.days[self._current_day][psregistry.METRICS[name].metric_type] = peak
+
+    def _flush_section(self) -> None:
+        section, self._section = self._section, None
+        self._current_day = None
+        if section is None or section.instance_id is None:
+            return
+        self.stats.sections += 1
+        if not section.daily or not section.project_id:
+            self.stats.skipped_sections += 1
+            return
+        write_ops = psregistry.METRICS["write_ops"].metric_type
+        transferred_bytes = psregistry.METRICS["transferred_bytes"].metric_type
+        rows = []
+        for day, peaks in section.days.items():
+            if day in section.failed:
+                self.stats.failed_days += 1
+                continue
+            if self._run_time is None or not day_complete(day, self._run_time):
+                self.stats.incomplete_days += 1
+                continue
+            if write_ops not in peaks and transferred_bytes in peaks and peaks[transferred_bytes] is None:
+                # The older scripts did not log write ops, but no transferred bytes means no writes.
+                peaks[write_ops] = None
+            if peaks:
+                self.stats.days += 1
+                rows.extend((section.project_id, section.instance_id, metric_type, day, peak) for metric_type, peak in peaks.items())
+        if rows:
+            self.store.store_many(rows, SOURCE_LOG)
+            self.stats.rows += len(rows)
+
+    def finish(self) -> None:
+        self._flush_section()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill the daily peak store from the logs of past report runs.")
+    parser.add_argument("logs", nargs="+", help="Human-readable (.log) or JSON-lines (.jsonl) report logs, oldest first.")
+    parser.add_argument("--peak_db", type=str, required=True, help="SQLite daily peak store to fill (see 7.py --peak_db).")
+    args = parser.parse_args()
+
+    store = DailyPeakStore(args.peak_db)
+    for log_path in args.logs:
+        started = time.perf_counter()
+        stats = LogIngester(store).ingest(log_path)
+        print(f"{log_path}: {stats} in {time.perf_counter() - started:.3f}s")
+    print(f"{args.peak_db} now holds {store.day_count()} instance-day(s)")
+    store.close()
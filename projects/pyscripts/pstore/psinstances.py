@@ -0,0 +1,111 @@
+import json
+import logging
+import os
+import threading
+import time
+
+import psclient
+import psinstrument
+
+logger = logging.getLogger(__name__)
+
+# Same API version `gcloud beta parallelstore` uses, so the fields match what the reports printed before.
+# "locations/-" lists every location of the project in one (paginated) call.
+INSTANCES_LIST_URL = "https://parallelstore.googleapis.com/v1beta/projects/{project_id}/locations/-/instances"
+DEFAULT_INSTANCE_CACHE_PATH = "parallelstore_instances_cache.json"
+DEFAULT_INSTANCE_CACHE_TTL_SECONDS = 3600
+
+
+class InstanceMetadataCache:
+    """
+    TTL cache of instances.list results on disk, one entry per project:
+    {project_id: {"fetched_at": epoch seconds, "instances": {instance_id: instance resource}}}.
+    The file is rewritten atomically, so concurrent runs never read a half-written cache.
+    """
+
+    def __init__(self, path: str = DEFAULT_INSTANCE_CACHE_PATH, ttl_seconds: float = DEFAULT_INSTANCE_CACHE_TTL_SECONDS):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+
+    def _read(self) -> dict:
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.debug(f"Ignoring unreadable instance cache {self.path}: {e}")
+            return {}
+
+    def get(self, project_id: str) -> dict[str, dict] | None:
+        """The cached instances of project_id, or None when missing or older than the TTL."""
+        with self._lock:
+            entry = self._read().get(project_id)
+        if entry is None or time.time() - entry["fetched_at"] > self.ttl_seconds:
+            return None
+        return entry["instances"]
+
+    def put(self, project_id: str, instances: dict[str, dict]) -> None:
+        with self._lock:
+            entries = self._read()
+            entries[project_id] = {"fetched_at": time.time(), "instances": instances}
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(entries, f, indent=2)
+            os.replace(tmp_path, self.path)
+
+
+def fetch_instances(project_id: str) -> dict[str, dict]:
+    """
+    Lists every Parallelstore instance of the project across all locations with the shared authorized
+    session (no gcloud process), following nextPageToken. Returns {instance_id: instance resource}.
+    """
+    session = psclient.get_authorized_session(psclient.CLOUD_PLATFORM_SCOPE)
+    instances = {}
+    page_token = None
+    while True:
+        with psinstrument.timed_call("parallelstore_instances_list") as call:
+            response = session.get(
+                INSTANCES_LIST_URL.format(project_id=project_id),
+                params={"pageToken": page_token} if page_token else None,
+            )
+            call.response_bytes = len(response.content)
+            response.raise_for_status()
+        body = response.json()
+        for instance in body.get("instances", []):
+            instances[instance["name"].rsplit("/", 1)[-1]] = instance
+        if body.get("unreachable"):
+            logger.warning(f"Parallelstore locations unreachable while listing {project_id}: {', '.join(body['unreachable'])}")
+        page_token = body.get("nextPageToken")
+        if not page_token:
+            return instances
+
+
+def list_instances(project_id: str, cache: InstanceMetadataCache | None = None, refresh: bool = False) -> dict[str, dict]:
+    """
+    {instance_id: instance resource} for the project, served from `cache` while it is fresh
+    (refresh=True forces an API call) and stored back into it after a fetch.
+    """
+    if cache is not None and not refresh:
+        instances = cache.get(project_id)
+        if instances is not None:
+            logger.debug(f"Instance metadata for {project_id} served from {cache.path}")
+            return instances
+    instances = fetch_instances(project_id)
+    if cache is not None:
+        cache.put(project_id, instances)
+    return instances
+
+
+def get_instance(project_id: str, instance_id: str, cache: InstanceMetadataCache | None = None, refresh: bool = False) -> dict | None:
+    """
+    One instance's resource (capacityGib, state, network, accessPoints, ...), or None if the project has no
+    such instance. Looking up several instances of a project costs one list call in total.
+    An instance missing from a cached list triggers one refresh, in case it was created since.
+    """
+    if cache is not None and not refresh:
+        cached = cache.get(project_id)
+        if cached is not None and instance_id in cached:
+            return cached[instance_id]
+    return list_instances(project_id, cache, refresh=True).get(instance_id)
@@ -0,0 +1,234 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Histogram bucket upper bounds (Prometheus "le" values); +Inf is added on export.
+HISTOGRAM_BUCKETS = {
+    "duration_seconds": (0.05, 0.1, 0.25, 0.5, 1, 2, 3, 5, 10, 30, 60),
+    "rpc_wait_seconds": (0.05, 0.1, 0.25, 0.5, 1, 2, 3, 5, 10, 30, 60),
+    "pages": (1, 2, 5, 10, 50, 100, 500),
+    "points": (0, 100, 1440, 10000, 100000, 1000000),
+    "response_bytes": (1024, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864),
+}
+HISTOGRAM_HELP = {
+    "duration_seconds": "Wall time from issuing the call until its last page was consumed.",
+    "rpc_wait_seconds": "Time spent waiting on the API (first call plus every next-page fetch and decode).",
+    "pages": "Result pages returned per call.",
+    "points": "Time series points returned per call.",
+    "response_bytes": "Serialized response size per call.",
+}
+
+
+class ApiCall:
+    """
+    Measurements for one API call. Filled in by the instrumented client/pager (or by timed_call)
+    and handed to the recorder once the call has finished.
+    """
+    __slots__ = ("api", "started", "duration_seconds", "rpc_wait_seconds", "pages", "points", "response_bytes", "retries", "error")
+
+    def __init__(self, api: str):
+        self.api = api
+        self.started = time.perf_counter()
+        self.duration_seconds = 0.0
+        self.rpc_wait_seconds = 0.0
+        self.pages = 0
+        self.points = 0
+        self.response_bytes = 0
+        self.retries = 0
+        self.error = None
+
+
+class CallRecorder:
+    """Thread-safe collection of finished ApiCall measurements for the current run."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = []
+
+    def record(self, call: ApiCall) -> None:
+        call.duration_seconds = time.perf_counter() - call.started
+        with self._lock:
+            self.calls.append(call)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.calls = []
+
+    def _calls_by_api(self) -> dict[str, list[ApiCall]]:
+        with self._lock:
+            calls = list(self.calls)
+        by_api = {}
+        for call in calls:
+            by_api.setdefault(call.api, []).append(call)
+        return by_api
+
+    def summary(self) -> dict:
+        """
+        Per-API totals and latency percentiles, e.g. to tell RPC wait apart from local processing time.
+        """
+        result = {}
+        for api, calls in sorted(self._calls_by_api().items()):
+            durations = sorted(call.duration_seconds for call in calls)
+            total_duration = sum(durations)
+            total_wait = sum(call.rpc_wait_seconds for call in calls)
+            result[api] = {
+                "calls": len(calls),
+                "errors": sum(1 for call in calls if call.error),
+                "retries": sum(call.retries for call in calls),
+                "pages": sum(call.pages for call in calls),
+                "points": sum(call.points for call in calls),
+                "response_bytes": sum(call.response_bytes for call in calls),
+                "duration_seconds_total": total_duration,
+                "rpc_wait_seconds_total": total_wait,
+                "processing_seconds_total": max(0.0, total_duration - total_wait),
+                "duration_seconds_p50": _percentile(durations, 0.50),
+                "duration_seconds_p95": _percentile(durations, 0.95),
+                "duration_seconds_max": durations[-1],
+            }
+        return result
+
+    def write_json_summary(self, path: str) -> None:
+        with open(path, "w") as f:
+            json.dump(self.summary(), f, indent=4)
+
+    def write_prometheus_textfile(self, path: str) -> None:
+        """
+        Writes histograms and counters in the Prometheus text exposition format, replacing the file
+        atomically so a node_exporter textfile collector never reads a partial file.
+        """
+        by_api = self._calls_by_api()
+        lines = []
+        for field, buckets in HISTOGRAM_BUCKETS.items():
+            metric = f"pstore_api_call_{field}"
+            lines.append(f"# HELP {metric} {HISTOGRAM_HELP[field]}")
+            lines.append(f"# TYPE {metric} histogram")
+            for api, calls in sorted(by_api.items()):
+                values = [getattr(call, field) for call in calls]
+                for bound in buckets:
+                    lines.append(f'{metric}_bucket{{api="{api}",le="{bound}"}} {sum(1 for v in values if v <= bound)}')
+                lines.append(f'{metric}_bucket{{api="{api}",le="+Inf"}} {len(values)}')
+                lines.append(f'{metric}_sum{{api="{api}"}} {sum(values)}')
+                lines.append(f'{metric}_count{{api="{api}"}} {len(values)}')
+        for field, help_text in (("retries", "Retried attempts."), ("errors", "Calls that ended in an error.")):
+            metric = f"pstore_api_call_{field}_total"
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} counter")
+            for api, calls in sorted(by_api.items()):
+                total = sum(call.retries for call in calls) if field == "retries" else sum(1 for call in calls if call.error)
+                lines.append(f'{metric}{{api="{api}"}} {total}')
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, path)
+
+    def log_summary(self, log: logging.Logger) -> None:
+        for api, stats in self.summary().items():
+            log.info(
+                f"  {api}: {stats['calls']} call(s), {stats['errors']} error(s), {stats['retries']} retr(ies), "
+                f"{stats['pages']} page(s), {stats['points']} point(s), {stats['response_bytes'] / 1e6:.2f} MB; "
+                f"latency p50 {stats['duration_seconds_p50']:.3f}s p95 {stats['duration_seconds_p95']:.3f}s max {stats['duration_seconds_max']:.3f}s; "
+                f"API wait {stats['rpc_wait_seconds_total']:.2f}s vs local processing {stats['processing_seconds_total']:.2f}s"
+            )
+
+
+def _percentile(sorted_values: list[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+RECORDER = CallRecorder()
+
+
+class InstrumentedPager:
+    """
+    Wraps a ListTimeSeries pager. Walking .pages (or iterating series) times each page fetch
+    separately from the caller's processing and records the call when the pages are exhausted.
+    """
+
+    def __init__(self, pager, call: ApiCall):
+        self._pager = pager
+        self._call = call
+
+    @property
+    def pages(self):
+        call = self._call
+        pages = iter(self._pager.pages)
+        try:
+            while True:
+                waited_from = time.perf_counter()
+                try:
+                    page = next(pages)
+                except StopIteration:
+                    call.rpc_wait_seconds += time.perf_counter() - waited_from
+                    break
+                call.rpc_wait_seconds += time.perf_counter() - waited_from
+                raw_page = type(page).pb(page)
+                call.pages += 1
+                call.response_bytes += raw_page.ByteSize()
+                call.points += sum(len(ts.points) for ts in raw_page.time_series)
+                yield page
+        except Exception as e:
+            call.error = repr(e)
+            raise
+        finally:
+            # Also reached when the caller stops early, so partial reads are still recorded.
+            RECORDER.record(call)
+
+    def __iter__(self):
+        for page in self.pages:
+            yield from page.time_series
+
+
+class InstrumentedMetricClient:
+    """
+    Proxy around a MetricServiceClient (or stub) that records every list_time_series call in RECORDER.
+    Other attributes pass straight through to the wrapped client.
+    """
+
+    def __init__(self, client):
+        self._client = client
+
+    def list_time_series(self, request=None, retried: bool = False, **kwargs):
+        # retried: this call repeats a failed attempt (psquota.ScheduledMetricClient does the retrying).
+        call = ApiCall("list_time_series")
+        call.retries = int(retried)
+        waited_from = time.perf_counter()
+        try:
+            pager = self._client.list_time_series(request=request, **kwargs)
+        except Exception as e:
+            call.rpc_wait_seconds += time.perf_counter() - waited_from
+            call.error = repr(e)
+            RECORDER.record(call)
+            raise
+        call.rpc_wait_seconds += time.perf_counter() - waited_from
+        return InstrumentedPager(pager, call)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+@contextmanager
+def timed_call(api: str):
+    """
+    Records a non-paged API call (e.g. a gcloud invocation or an HTTP request) as a single-page call.
+    The caller may set response_bytes/points on the yielded ApiCall.
+    """
+    call = ApiCall(api)
+    call.pages = 1
+    try:
+        yield call
+    except Exception as e:
+        call.error = repr(e)
+        raise
+    finally:
+        call.rpc_wait_seconds = time.perf_counter() - call.started
+        RECORDER.record(call)
@@ -0,0 +1,328 @@
+"""
+I/O load generator for Parallelstore validation runs.
+
+Drives a sequential or random read/write workload against a directory (a Parallelstore/DFuse mount, or
+any local directory for a dry run) from a pool of worker processes, each keeping --queue_depth I/Os in
+flight on its own threads. Reports client-side IOPS, throughput and latency percentiles, and with
+--project_id/--instance_id hands the exact test window to the metrics validator in 7.py
+(validate_performance_window) once Cloud Monitoring has caught up:
+
+    python psload.py --path /mnt/parallelstore/loadtest --workload rand_read --block_size 4k \\
+        --processes 8 --queue_depth 16 --file_count 16 --file_size 1g --duration_seconds 1800 \\
+        --project_id my-project --instance_id my-instance
+"""
+import argparse
+import importlib.util
+import json
+import mmap
+import multiprocessing
+import os
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+import pslogging
+import pssketch
+
+REPORT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "7.py")
+WORKLOADS = ("seq_read", "seq_write", "rand_read", "rand_write", "rand_rw")
+FILE_NAME_FORMAT = "psload_{index:04d}.dat"
+PREPARE_CHUNK_BYTES = 4 * 1024 * 1024
+# Latencies are buffered per thread and folded into its sketch in batches of this many I/Os.
+LATENCY_BATCH = 4096
+LATENCY_QUANTILES = (0.5, 0.9, 0.99, 0.999)
+# Parallelstore metrics are sampled every 60 s and take a few minutes to show up in Cloud Monitoring.
+DEFAULT_SETTLE_SECONDS = 240
+SIZE_SUFFIXES = {"": 1, "k": 1024, "m": 1024**2, "g": 1024**3, "t": 1024**4}
+
+
+def parse_size(value: str) -> int:
+    """ "4k", "1M", "2g" or a plain byte count -> bytes (binary units)."""
+    value = value.strip().lower().removesuffix("b").removesuffix("i")
+    suffix = value[-1] if value and value[-1] in SIZE_SUFFIXES else ""
+    number = value[:-1] if suffix else value
+    try:
+        return int(float(number) * SIZE_SUFFIXES[suffix])
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid size: {value}")
+
+
+def file_paths(directory: str, file_count: int) -> list[str]:
+    return [os.path.join(directory, FILE_NAME_FORMAT.format(index=index)) for index in range(file_count)]
+
+
+def prepare_file(path: str, file_size: int) -> int:
+    """Extends path to file_size bytes of non-zero data (reads of sparse holes never reach the servers); returns bytes written."""
+    existing = os.path.getsize(path) if os.path.exists(path) else 0
+    if existing >= file_size:
+        return 0
+    chunk = os.urandom(PREPARE_CHUNK_BYTES)
+    with open(path, "r+b" if existing else "wb") as f:
+        f.seek(existing)
+        remaining = file_size - existing
+        while remaining > 0:
+            remaining -= f.write(chunk[:min(remaining, len(chunk))])
+    return file_size - existing
+
+
+class ThreadResult:
+    """What one I/O thread did; merged per process, then across processes."""
+    __slots__ = ("read_ops", "write_ops", "read_bytes", "write_bytes", "errors", "latency_us")
+
+    def __init__(self):
+        self.read_ops = 0
+        self.write_ops = 0
+        self.read_bytes = 0
+        self.write_bytes = 0
+        self.errors = 0
+        self.latency_us = pssketch.RateSketch()
+
+    def merge(self, other: "ThreadResult") -> "ThreadResult":
+        self.read_ops += other.read_ops
+        self.write_ops += other.write_ops
+        self.read_bytes += other.read_bytes
+        self.write_bytes += other.write_bytes
+        self.errors += other.errors
+        self.latency_us.merge(other.latency_us)
+        return self
+
+    def to_dict(self) -> dict:
+        return {
+            "read_ops": self.read_ops,
+            "write_ops": self.write_ops,
+            "read_bytes": self.read_bytes,
+            "write_bytes": self.write_bytes,
+            "errors": self.errors,
+            "latency_us": self.latency_us.to_bytes(),
+        }
+
+    @classmethod
+    def from_dict(cls, state: dict) -> "ThreadResult":
+        result = cls()
+        for field in ("read_ops", "write_ops", "read_bytes", "write_bytes", "errors"):
+            setattr(result, field, state[field])
+        result.latency_us = pssketch.RateSketch.from_bytes(state["latency_us"])
+        return result
+
+
+def _io_thread(config: dict, fds: list[int], job: int, deadline: float, result: ThreadResult) -> None:
+    """Issues one I/O at a time until deadline (time.monotonic()); queue depth comes from running several of these."""
+    block_size = config["block_size"]
+    blocks_per_file = config["file_size"] // block_size
+    workload = config["workload"]
+    rng = random.Random(config["seed"] * 1_000_003 + job)
+    # mmap memory is page-aligned, as O_DIRECT requires.
+    buffer = mmap.mmap(-1, block_size)
+    buffer.write(os.urandom(block_size))
+    sequential = workload.startswith("seq_")
+    fd_index = job % len(fds)
+    block = rng.randrange(blocks_per_file)
+    latencies = []
+    try:
+        while time.monotonic() < deadline:
+            if sequential:
+                block = (block + 1) % blocks_per_file
+            else:
+                fd_index = rng.randrange(len(fds))
+                block = rng.randrange(blocks_per_file)
+            if workload == "rand_rw":
+                is_read = rng.random() * 100 < config["read_percent"]
+            else:
+                is_read = workload.endswith("_read")
+            started = time.perf_counter_ns()
+            try:
+                if is_read:
+                    transferred = os.preadv(fds[fd_index], [buffer], block * block_size)
+                else:
+                    transferred = os.pwritev(fds[fd_index], [buffer], block * block_size)
+            except OSError:
+                result.errors += 1
+                continue
+            latencies.append((time.perf_counter_ns() - started) / 1000)
+            if is_read:
+                result.read_ops += 1
+                result.read_bytes += transferred
+            else:
+                result.write_ops += 1
+                result.write_bytes += transferred
+            if len(latencies) >= LATENCY_BATCH:
+                result.latency_us.add_many(latencies)
+                latencies = []
+    finally:
+        result.latency_us.add_many(latencies)
+        buffer.close()
+
+
+def run_worker(config: dict, worker_index: int, barrier, results) -> None:
+    """
+    One load process: prepares its share of the files, waits for every other process at the barrier,
+    then runs queue_depth I/O threads for duration_seconds and puts its merged result on `results`.
+    """
+    paths = file_paths(config["path"], config["file_count"])
+    try:
+        prepared = sum(prepare_file(path, config["file_size"]) for path in paths[worker_index::config["processes"]])
+        barrier.wait()
+        fds = [os.open(path, os.O_RDWR | (os.O_DIRECT if config["direct"] else 0)) for path in paths]
+    except Exception as e:
+        # Release the other processes from the barrier instead of leaving them (and run_load) waiting forever.
+        barrier.abort()
+        results.put({"worker": worker_index, "error": repr(e)})
+        return
+    started = time.time()
+    deadline = time.monotonic() + config["duration_seconds"]
+    thread_results = [ThreadResult() for _ in range(config["queue_depth"])]
+    threads = [
+        threading.Thread(target=_io_thread, args=(config, fds, worker_index * config["queue_depth"] + index, deadline, thread_result), daemon=True)
+        for index, thread_result in enumerate(thread_results)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    ended = time.time()
+    for fd in fds:
+        os.close(fd)
+    merged = ThreadResult()
+    for thread_result in thread_results:
+        merged.merge(thread_result)
+    results.put({"worker": worker_index, "started": started, "ended": ended, "prepared_bytes": prepared, **merged.to_dict()})
+
+
+def run_load(config: dict) -> dict:
+    """
+    Runs the workload in config["processes"] spawned processes and returns the client-side summary:
+    the exact [started, ended] window (first start to last end, UTC), IOPS, MBps (10^6 bytes) and
+    latency percentiles in microseconds.
+    """
+    os.makedirs(config["path"], exist_ok=True)
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(config["processes"])
+    results = context.Queue()
+    processes = [context.Process(target=run_worker, args=(config, index, barrier, results)) for index in range(config["processes"])]
+    for process in processes:
+        process.start()
+    worker_results = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    errors = [f"worker {worker_result['worker']}: {worker_result['error']}" for worker_result in worker_results if "error" in worker_result]
+    if errors:
+        raise RuntimeError(f"Load run failed: {'; '.join(sorted(errors))}")
+
+    total = ThreadResult()
+    for worker_result in worker_results:
+        total.merge(ThreadResult.from_dict(worker_result))
+    started = min(worker_result["started"] for worker_result in worker_results)
+    ended = max(worker_result["ended"] for worker_result in worker_results)
+    seconds = max(ended - started, 1e-9)
+    return {
+        "workload": config["workload"],
+        "window_start": datetime.fromtimestamp(started, tz=timezone.utc).isoformat(),
+        "window_end": datetime.fromtimestamp(ended, tz=timezone.utc).isoformat(),
+        "seconds": seconds,
+        "prepared_bytes": sum(worker_result["prepared_bytes"] for worker_result in worker_results),
+        "read_ops": total.read_ops,
+        "write_ops": total.write_ops,
+        "errors": total.errors,
+        "read_iops": total.read_ops / seconds,
+        "write_iops": total.write_ops / seconds,
+        "read_mbps": total.read_bytes / seconds / 1000**2,
+        "write_mbps": total.write_bytes / seconds / 1000**2,
+        "throughput_mbps": (total.read_bytes + total.write_bytes) / seconds / 1000**2,
+        "latency_us": {
+            **{f"p{quantile * 100:g}": total.latency_us.quantile(quantile) for quantile in LATENCY_QUANTILES},
+            "max": total.latency_us.maximum,
+        },
+    }
+
+
+def load_report_module():
+    """Imports 7.py under the name pstore_report (its logger gets handlers from pslogging in __main__ below)."""
+    spec = importlib.util.spec_from_file_location("pstore_report", REPORT_SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def print_summary(summary: dict) -> None:
+    print(f"Workload {summary['workload']}: {summary['window_start']} to {summary['window_end']} ({summary['seconds']:.1f}s)")
+    print(f"  Read:  {summary['read_iops']:12.1f} IOPS {summary['read_mbps']:10.2f} MBps ({summary['read_ops']} ops)")
+    print(f"  Write: {summary['write_iops']:12.1f} IOPS {summary['write_mbps']:10.2f} MBps ({summary['write_ops']} ops)")
+    print(f"  Total throughput: {summary['throughput_mbps']:.2f} MBps; {summary['errors']} I/O error(s)")
+    latencies = ", ".join(f"{name} {value:.1f}" for name, value in summary["latency_us"].items() if value is not None)
+    print(f"  Latency (us): {latencies or 'no I/O completed'}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Multi-process I/O load generator for Parallelstore validation runs.")
+    parser.add_argument("--path", type=str, required=True, help="Directory to run the load in (created if missing); any local directory works for a dry run.")
+    parser.add_argument("--workload", choices=WORKLOADS, default="seq_read", help="I/O pattern (default: seq_read).")
+    parser.add_argument("--read_percent", type=float, default=70.0, help="Share of reads for rand_rw, in percent (default: 70).")
+    parser.add_argument("--block_size", type=parse_size, default=parse_size("1m"), help="Bytes per I/O, e.g. 4k or 1m (default: 1m).")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1, help="Worker processes (default: CPU count).")
+    parser.add_argument("--queue_depth", type=int, default=8, help="I/Os in flight per process, one thread each (default: 8).")
+    parser.add_argument("--file_count", type=int, default=16, help="Files the load is spread over (default: 16).")
+    parser.add_argument("--file_size", type=parse_size, default=parse_size("1g"), help="Size of each file; missing or short files are filled first, outside the measured window (default: 1g).")
+    parser.add_argument("--duration_seconds", type=float, default=1800.0, help="Length of the measured window (default: 1800, the 30 minutes the benchmark validation expects).")
+    parser.add_argument("--direct", action="store_true", help="Open the files with O_DIRECT to bypass the client page cache (block_size must be a multiple of 4096).")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the random offsets (default: 0).")
+    parser.add_argument("--cleanup", action="store_true", help="Delete the load files afterwards.")
+    parser.add_argument("--project_id", type=str, default=None, help="With --instance_id: validate the test window against Cloud Monitoring afterwards.")
+    parser.add_argument("--instance_id", type=str, default=None, help="Parallelstore instance behind --path.")
+    parser.add_argument("--settle_seconds", type=float, default=DEFAULT_SETTLE_SECONDS, help=f"Wait this long after the load for the metrics to reach Cloud Monitoring before validating (default: {DEFAULT_SETTLE_SECONDS}).")
+    parser.add_argument("--stub_client", action="store_true", help="Validate against the offline stub client instead of Cloud Monitoring (for testing).")
+    parser.add_argument("--output", type=str, default=None, help="Also write the client-side summary (and the validation verdict) as JSON to this file.")
+    args = parser.parse_args()
+
+    if min(args.processes, args.queue_depth, args.file_count, args.block_size) < 1 or args.duration_seconds <= 0:
+        parser.error("--processes, --queue_depth, --file_count, --block_size and --duration_seconds must be positive.")
+    if args.file_size < args.block_size:
+        parser.error("--file_size must be at least --block_size.")
+    if args.direct and (args.block_size % 4096 or not hasattr(os, "O_DIRECT")):
+        parser.error("--direct needs O_DIRECT support and a --block_size that is a multiple of 4096.")
+    if bool(args.project_id) != bool(args.instance_id):
+        parser.error("--project_id and --instance_id go together.")
+
+    config = {
+        "path": args.path,
+        "workload": args.workload,
+        "read_percent": args.read_percent,
+        "block_size": args.block_size,
+        "processes": args.processes,
+        "queue_depth": args.queue_depth,
+        "file_count": args.file_count,
+        "file_size": args.file_size,
+        "duration_seconds": args.duration_seconds,
+        "direct": args.direct,
+        "seed": args.seed,
+    }
+    print(f"Running {args.workload} with {args.processes} process(es) x queue depth {args.queue_depth}, {args.block_size} B blocks over {args.file_count} file(s) of {args.file_size} B in {args.path} for {args.duration_seconds:g}s ...", flush=True)
+    summary = run_load(config)
+    print_summary(summary)
+    if args.cleanup:
+        for path in file_paths(args.path, args.file_count):
+            if os.path.exists(path):
+                os.remove(path)
+
+    if args.project_id:
+        report = load_report_module()
+        pslogging.setup_logging(report.logger, None, None)
+        if args.stub_client:
+            import psstub
+            report.psclient.configure(client_factory=psstub.StubMetricServiceClient)
+        print(f"Waiting {args.settle_seconds:g}s for the metrics to reach Cloud Monitoring ...", flush=True)
+        time.sleep(args.settle_seconds)
+        summary["validation"] = report.validate_performance_window(
+            args.project_id, args.instance_id,
+            datetime.fromisoformat(summary["window_start"]), datetime.fromisoformat(summary["window_end"]),
+            summary
+        )
+        pslogging.stop_logging()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(summary, f, indent=4)
+    validation = summary.get("validation")
+    if validation and not (validation["met_iops_benchmark"] and validation["met_throughput_benchmark"]):
+        sys.exit(1)
@@ -0,0 +1,116 @@
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+from datetime import datetime, timezone
+
+DEFAULT_LOG_FILE = "parallelstore_metrics_over_time.log"
+DEFAULT_JSON_LOG_FILE = "parallelstore_metrics_over_time.jsonl"
+DEFAULT_MAX_MB = 10
+DEFAULT_BACKUP_COUNT = 5
+HUMAN_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# Attributes every LogRecord has; anything else on a record came from `extra=` and goes into the JSON line.
+_STANDARD_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "taskName"}
+
+_listener = None
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """
+    One JSON object per record: UTC timestamp, level, logger, thread, message, any `extra=` fields
+    (e.g. the summary dict attached to each window's results) and the traceback, if there is one.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_RECORD_FIELDS:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class _DeferredFormattingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that only resolves the message and traceback text on the calling thread (they can refer
+    to objects that change afterwards); timestamps, human/JSON formatting and file I/O happen on the
+    listener thread.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging(
+    logger: logging.Logger,
+    log_file: str | None = DEFAULT_LOG_FILE,
+    json_log_file: str | None = DEFAULT_JSON_LOG_FILE,
+    max_mb: float = DEFAULT_MAX_MB,
+    backup_count: int = DEFAULT_BACKUP_COUNT,
+    console: bool = True
+) -> logging.handlers.QueueListener:
+    """
+    Routes `logger` through a queue: the logging call only enqueues the record, and a single background
+    QueueListener writes it to the size-rotated human log, the size-rotated JSON-lines log and the console.
+    Replaces any handlers already on the logger; pass the root logger to also capture the ps* module loggers,
+    which propagate to it. The listener is flushed and stopped at exit (or by stop_logging()).
+    """
+    global _listener
+    stop_logging()
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
+
+    human_formatter = logging.Formatter(HUMAN_FORMAT)
+    max_bytes = int(max_mb * 1024 * 1024)
+    handlers = []
+    if log_file:
+        file_handler = logging.handlers.RotatingFileHandler(log_file, mode="a", maxBytes=max_bytes, backupCount=backup_count)
+        file_handler.setFormatter(human_formatter)
+        handlers.append(file_handler)
+    if json_log_file:
+        json_handler = logging.handlers.RotatingFileHandler(json_log_file, mode="a", maxBytes=max_bytes, backupCount=backup_count)
+        json_handler.setFormatter(JsonLinesFormatter())
+        handlers.append(json_handler)
+    if console:
+        stream_handler = logging.StreamHandler()
+        stream_handler.setFormatter(human_formatter)
+        handlers.append(stream_handler)
+
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(_DeferredFormattingQueueHandler(log_queue))
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def stop_logging() -> None:
+    """Drains the queue, stops the listener thread and closes its handlers."""
+    global _listener
+    if _listener is None:
+        return
+    listener, _listener = _listener, None
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
+
+
+atexit.register(stop_logging)
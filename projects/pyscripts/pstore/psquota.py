@@ -0,0 +1,318 @@
+import logging
+import random
+import threading
+import time
+
+import psinstrument
+
+logger = logging.getLogger(__name__)
+
+# Defaults for the shared scheduler; override with configure().
+DEFAULT_REQUESTS_PER_SECOND = 50.0   # Per project; Cloud Monitoring's read quota is per project and per minute.
+DEFAULT_BURST = 20
+DEFAULT_MAX_ATTEMPTS = 6
+DEFAULT_RETRY_BUDGET = 0.2           # Retries allowed per request made so far, on top of MIN_RETRY_BUDGET.
+MIN_RETRY_BUDGET = 10
+BASE_BACKOFF_SECONDS = 1.0
+MAX_BACKOFF_SECONDS = 32.0
+# After a 429 a project's rate is halved (never below this fraction of the configured rate) and every
+# successful request then wins back this fraction, so the bucket settles just under the real quota.
+MIN_RATE_FRACTION = 0.05
+RATE_RECOVERY_FRACTION = 0.02
+
+QUOTA_STATUS_CODES = (429,)
+RETRYABLE_STATUS_CODES = (429, 503, 504)
+
+
+def status_code(error: Exception) -> int | None:
+    """
+    HTTP status of an API error: google.api_core exceptions carry it in .code (ResourceExhausted and
+    TooManyRequests are 429, ServiceUnavailable 503, DeadlineExceeded 504), requests.HTTPError on .response.
+    """
+    code = getattr(error, "code", None)
+    if isinstance(code, int):
+        return code
+    response = getattr(error, "response", None)
+    return getattr(response, "status_code", None)
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. acquire() reserves a token and sleeps until it is due, so concurrent callers
+    queue up in order instead of polling. The rate adapts: slow_down() after a quota error, speed_up()
+    after a success (up to the configured rate).
+    """
+
+    def __init__(self, requests_per_second: float, burst: int = DEFAULT_BURST):
+        self.configured_rate = requests_per_second
+        self.rate = requests_per_second
+        self.lowest_rate = requests_per_second
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self) -> float:
+        """Takes one token, sleeping until it is available; returns the seconds spent waiting."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def slow_down(self) -> None:
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = max(self.configured_rate * MIN_RATE_FRACTION, self.rate / 2)
+            self.lowest_rate = min(self.lowest_rate, self.rate)
+
+    def speed_up(self) -> None:
+        with self._lock:
+            if self.rate < self.configured_rate:
+                self._refill(time.monotonic())
+                self.rate = min(self.configured_rate, self.rate + self.configured_rate * RATE_RECOVERY_FRACTION)
+
+
+class ProjectQuotaStats:
+    """Counters for one project's scheduled calls."""
+    __slots__ = ("requests", "retries", "quota_errors", "unavailable_errors", "retries_denied", "failed", "throttled_seconds", "backoff_seconds")
+
+    def __init__(self):
+        self.requests = 0
+        self.retries = 0
+        self.quota_errors = 0
+        self.unavailable_errors = 0
+        self.retries_denied = 0
+        self.failed = 0
+        self.throttled_seconds = 0.0
+        self.backoff_seconds = 0.0
+
+
+class QuotaScheduler:
+    """
+    Sits in front of every Monitoring API request: each request first takes a token from its project's
+    bucket, and 429/503/504 responses are retried with jittered exponential backoff ("full jitter")
+    for up to max_attempts attempts. Retries across all projects share one budget of
+    MIN_RETRY_BUDGET + retry_budget * requests, so an outage fails fast instead of multiplying the load.
+    requests_per_second <= 0 disables the rate limit (retries still apply).
+    """
+
+    def __init__(
+        self,
+        requests_per_second: float = DEFAULT_REQUESTS_PER_SECOND,
+        burst: int = DEFAULT_BURST,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        retry_budget: float = DEFAULT_RETRY_BUDGET
+    ):
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._stats = {}
+        self.configure(requests_per_second, burst, max_attempts, retry_budget)
+
+    def configure(
+        self,
+        requests_per_second: float = DEFAULT_REQUESTS_PER_SECOND,
+        burst: int = DEFAULT_BURST,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        retry_budget: float = DEFAULT_RETRY_BUDGET
+    ) -> None:
+        """Replaces the settings; buckets are rebuilt on next use, counters are kept."""
+        with self._lock:
+            self.requests_per_second = requests_per_second
+            self.burst = burst
+            self.max_attempts = max(1, max_attempts)
+            self.retry_budget = retry_budget
+            self._buckets.clear()
+
+    def _project(self, project_id: str | None) -> tuple[TokenBucket | None, ProjectQuotaStats]:
+        with self._lock:
+            stats = self._stats.get(project_id)
+            if stats is None:
+                stats = self._stats[project_id] = ProjectQuotaStats()
+            bucket = self._buckets.get(project_id)
+            if bucket is None and self.requests_per_second > 0:
+                bucket = self._buckets[project_id] = TokenBucket(self.requests_per_second, self.burst)
+            return bucket, stats
+
+    def acquire(self, project_id: str | None) -> None:
+        """Waits for a request slot for project_id (e.g. before fetching the next result page)."""
+        bucket, stats = self._project(project_id)
+        if bucket is not None:
+            waited = bucket.acquire()
+            with self._lock:
+                stats.requests += 1
+                stats.throttled_seconds += waited
+        else:
+            with self._lock:
+                stats.requests += 1
+
+    def _take_retry(self) -> bool:
+        # Caller holds self._lock.
+        requests = sum(stats.requests for stats in self._stats.values())
+        retries = sum(stats.retries for stats in self._stats.values())
+        return retries < MIN_RETRY_BUDGET + self.retry_budget * requests
+
+    def should_retry(self, project_id: str | None, error: Exception, attempt: int) -> bool:
+        """
+        Decides whether a failed attempt (1-based) is retried; if so, sleeps the backoff first.
+        Quota errors also slow the project's bucket down.
+        """
+        code = status_code(error)
+        if code not in RETRYABLE_STATUS_CODES:
+            return False
+        bucket, stats = self._project(project_id)
+        if code in QUOTA_STATUS_CODES and bucket is not None:
+            bucket.slow_down()
+        with self._lock:
+            if code in QUOTA_STATUS_CODES:
+                stats.quota_errors += 1
+            else:
+                stats.unavailable_errors += 1
+            if attempt >= self.max_attempts:
+                stats.failed += 1
+                return False
+            if not self._take_retry():
+                stats.retries_denied += 1
+                stats.failed += 1
+                return False
+            stats.retries += 1
+        delay = random.uniform(0, min(MAX_BACKOFF_SECONDS, BASE_BACKOFF_SECONDS * 2 ** (attempt - 1)))
+        logger.warning(f"{type(error).__name__} ({code}) for project {project_id}, attempt {attempt}/{self.max_attempts}; retrying in {delay:.2f}s")
+        time.sleep(delay)
+        with self._lock:
+            stats.backoff_seconds += delay
+        return True
+
+    def call(self, project_id: str | None, fn, *args, **kwargs):
+        """Runs fn(*args, **kwargs) under project_id's rate limit, retrying throttling/unavailable errors."""
+        attempt = 1
+        while True:
+            self.acquire(project_id)
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                if not self.should_retry(project_id, e, attempt):
+                    raise
+                attempt += 1
+                continue
+            bucket, _ = self._project(project_id)
+            if bucket is not None:
+                bucket.speed_up()
+            return result
+
+    def summary(self) -> dict[str, dict]:
+        """Per-project counters plus the bucket's current and lowest rate (requests per second)."""
+        with self._lock:
+            result = {}
+            for project_id, stats in sorted(self._stats.items(), key=lambda item: str(item[0])):
+                bucket = self._buckets.get(project_id)
+                result[str(project_id)] = {
+                    **{field: getattr(stats, field) for field in ProjectQuotaStats.__slots__},
+                    "rate": bucket.rate if bucket else None,
+                    "lowest_rate": bucket.lowest_rate if bucket else None,
+                }
+            return result
+
+    def reset(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+            self._stats.clear()
+
+    def log_summary(self, log: logging.Logger) -> None:
+        for project_id, stats in self.summary().items():
+            rate = f"rate {stats['rate']:.1f}/s (lowest {stats['lowest_rate']:.1f}/s)" if stats["rate"] is not None else "no rate limit"
+            log.info(
+                f"  {project_id}: {stats['requests']} request(s), {stats['throttled_seconds']:.2f}s throttled, "
+                f"{stats['retries']} retr(ies) after {stats['quota_errors']} quota and {stats['unavailable_errors']} unavailable error(s), "
+                f"{stats['backoff_seconds']:.2f}s backing off, {stats['retries_denied']} retr(ies) over budget, {stats['failed']} failed; {rate}"
+            )
+
+
+SCHEDULER = QuotaScheduler()
+
+
+class ScheduledPager:
+    """
+    Wraps a ListTimeSeries pager so every next-page request also waits for a token, and a page that fails
+    with a retryable error is requested again from the last page token instead of failing the whole call
+    (pages already handed to the caller are not read twice).
+    """
+
+    def __init__(self, client: "ScheduledMetricClient", pager, request, kwargs: dict, project_id: str | None):
+        self._client = client
+        self._pager = pager
+        self._request = request
+        self._kwargs = kwargs
+        self._project_id = project_id
+
+    @property
+    def pages(self):
+        scheduler = self._client.scheduler
+        pages = iter(self._pager.pages)
+        page_token = None
+        preloaded = True  # The first page comes with the (already scheduled) call itself.
+        attempt = 1  # Of the next page; back to 1 after every page that arrives.
+        while True:
+            # The pager only makes another request when the last page carried a token.
+            if page_token and not preloaded:
+                scheduler.acquire(self._project_id)
+            try:
+                page = next(pages)
+            except StopIteration:
+                return
+            except Exception as e:
+                if not page_token or not scheduler.should_retry(self._project_id, e, attempt):
+                    raise
+                attempt += 1
+                request = type(self._request)(self._request)
+                request.page_token = page_token
+                pages = iter(self._client.call_list_time_series(request, self._kwargs, self._project_id, retried=True).pages)
+                preloaded = True
+                continue
+            preloaded = False
+            attempt = 1
+            page_token = page.next_page_token
+            yield page
+
+    def __iter__(self):
+        for page in self.pages:
+            yield from page.time_series
+
+
+class ScheduledMetricClient:
+    """
+    Proxy around a MetricServiceClient (or an instrumented/stub one) that sends every list_time_series
+    call through a QuotaScheduler. The client library's own retry is turned off so retries happen in
+    one place, under the retry budget. Other attributes pass straight through to the wrapped client.
+    """
+
+    def __init__(self, client, scheduler: QuotaScheduler | None = None):
+        self._client = client
+        self.scheduler = scheduler or SCHEDULER
+
+    def call_list_time_series(self, request, kwargs: dict, project_id: str | None, retried: bool = False):
+        attempts = 0
+
+        def _list_time_series():
+            nonlocal attempts
+            attempts += 1
+            if isinstance(self._client, psinstrument.InstrumentedMetricClient):
+                # Every attempt after the first is counted as a retry on its ApiCall.
+                return self._client.list_time_series(request=request, retried=retried or attempts > 1, **kwargs)
+            return self._client.list_time_series(request=request, **kwargs)
+        return self.scheduler.call(project_id, _list_time_series)
+
+    def list_time_series(self, request=None, **kwargs):
+        kwargs["retry"] = None
+        project_id = request.name.split("/", 1)[1] if request is not None and request.name else None
+        pager = self.call_list_time_series(request, kwargs, project_id)
+        return ScheduledPager(self, pager, request, kwargs, project_id)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
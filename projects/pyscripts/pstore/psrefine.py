@@ -0,0 +1,183 @@
+import bisect
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import psseries
+
+logger = logging.getLogger(__name__)
+
+COARSE_PERIOD_SECONDS = 3600
+FINE_PERIOD_SECONDS = 60
+# The counters are deltas, so a period's rate is the mean of its minute rates and no single minute can
+# exceed period/60 times that mean: an exact upper bound on the 60-second peak inside the period.
+BOUND_FACTOR = COARSE_PERIOD_SECONDS // FINE_PERIOD_SECONDS
+# Hours to refine that are at most this many hours apart share one request (the hours in between are
+# fetched too): a few extra minute points are cheaper than another round trip.
+MERGE_GAP_PERIODS = 2
+
+
+class RefineStats:
+    """What a coarse-to-fine search transferred, to compare against fetching every minute."""
+    __slots__ = ("coarse_points", "fine_points", "fine_requests", "periods_with_data", "periods_refined")
+
+    def __init__(self):
+        self.coarse_points = 0
+        self.fine_points = 0
+        self.fine_requests = 0
+        self.periods_with_data = 0
+        self.periods_refined = 0
+
+    @property
+    def points(self) -> int:
+        return self.coarse_points + self.fine_points
+
+    def __repr__(self):
+        return (
+            f"RefineStats(points={self.points}, coarse={self.coarse_points}, fine={self.fine_points}, "
+            f"fine_requests={self.fine_requests}, periods refined={self.periods_refined}/{self.periods_with_data})"
+        )
+
+
+def _window_index(window_starts: list[int], window_ends: list[int], period_end: int) -> int | None:
+    """Index of the window holding the coarse period ending at period_end (None if it falls in no window)."""
+    index = bisect.bisect_left(window_ends, period_end)
+    if index == len(window_ends) or period_end <= window_starts[index]:
+        return None
+    return index
+
+
+def _coarse_bounds(timestamps, values, window_starts: list[int], window_ends: list[int]) -> dict[int, dict[int, float]]:
+    """{window index: {period_end: upper bound of any minute rate in the period}} from hourly rates."""
+    bounds = {}
+    for period_end, rate in zip(timestamps.tolist(), values.tolist()):
+        window_index = _window_index(window_starts, window_ends, period_end)
+        if window_index is None:
+            continue
+        periods = bounds.setdefault(window_index, {})
+        # Several series per instance come back unreduced; the largest bound covers all of them.
+        periods[period_end] = max(periods.get(period_end, 0.0), rate * BOUND_FACTOR)
+    return bounds
+
+
+def _runs(period_ends: list[int]) -> list[tuple[int, int]]:
+    """Merges sorted coarse period ends into (first, last) runs, bridging gaps of up to MERGE_GAP_PERIODS."""
+    runs = []
+    for period_end in period_ends:
+        if runs and period_end - runs[-1][1] <= (MERGE_GAP_PERIODS + 1) * COARSE_PERIOD_SECONDS:
+            runs[-1] = (runs[-1][0], period_end)
+        else:
+            runs.append((period_end, period_end))
+    return runs
+
+
+def fetch_bucketed_peaks_coarse_to_fine(
+    metric_types: list[str],
+    project_id_str: str,
+    instance_id_str: str,
+    windows: list[tuple[datetime, datetime]],
+    max_workers: int = 8,
+    stats: RefineStats | None = None
+) -> dict[str, list[float | None]]:
+    """
+    Exact per-window peak 60-second rates, like psseries.fetch_bucketed_peaks_for_metrics, without
+    downloading every minute:
+    1. One batched request for the whole range at COARSE_PERIOD_SECONDS gives each hour's mean rate and
+       with it an upper bound for every minute in the hour. Windows without any coarse point are done.
+    2. For each metric and window, the hour with the highest bound is fetched at 60 seconds; its
+       maximum is a lower bound for the window's peak.
+    3. Every remaining hour whose bound is above that lower bound is fetched at 60 seconds, with nearby
+       hours merged into one request and metrics that need the same span batched with one_of.
+    Hours whose bound cannot beat a minute already seen are never fetched, so the result is exact.
+    Windows must be at least an hour long and end on the hourly grid of the last window's end (as the
+    day and week buckets from psseries.bucket_windows do). stats, if given, collects transfer counts.
+    """
+    stats = stats if stats is not None else RefineStats()
+    if not windows:
+        return {metric_type: [] for metric_type in metric_types}
+    window_starts = [int(start.timestamp()) for start, _ in windows]
+    window_ends = [int(end.timestamp()) for _, end in windows]
+
+    coarse = psseries.fetch_metrics_series(
+        metric_types, project_id_str, instance_id_str, windows[0][0], windows[-1][1],
+        alignment_period_seconds=COARSE_PERIOD_SECONDS
+    )
+    bounds_by_metric = {}
+    for metric_type in metric_types:
+        timestamps, values = coarse[metric_type]
+        stats.coarse_points += len(values)
+        bounds_by_metric[metric_type] = _coarse_bounds(timestamps, values, window_starts, window_ends)
+        stats.periods_with_data += sum(len(periods) for periods in bounds_by_metric[metric_type].values())
+
+    def _span(window_index: int, first_period_end: int, last_period_end: int) -> tuple[int, int]:
+        # Clamped to the window, so a refined span never sees minutes the window's own query would not.
+        return (
+            max(first_period_end - COARSE_PERIOD_SECONDS, window_starts[window_index]),
+            min(last_period_end, window_ends[window_index]),
+        )
+
+    def _fetch_spans(spans: dict[tuple[int, int], list[str]]) -> dict[tuple[int, int], dict[str, float | None]]:
+        """Fetches each span at 60 seconds for the metrics that need it; returns the max per span and metric."""
+        def _fetch(span, span_metrics):
+            start, end = span
+            series = psseries.fetch_metrics_series(
+                span_metrics, project_id_str, instance_id_str,
+                datetime.fromtimestamp(start, tz=timezone.utc), datetime.fromtimestamp(end, tz=timezone.utc)
+            )
+            peaks = {}
+            points = 0
+            for metric_type in span_metrics:
+                _, values = series[metric_type]
+                points += len(values)
+                peaks[metric_type] = float(values.max()) if len(values) else None
+            return peaks, points
+
+        stats.fine_requests += len(spans)
+        results = {}
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            futures = {span: executor.submit(_fetch, span, span_metrics) for span, span_metrics in spans.items()}
+            for span, future in futures.items():
+                results[span], points = future.result()
+                stats.fine_points += points
+        return results
+
+    def _max(*values: float | None) -> float | None:
+        present = [value for value in values if value is not None]
+        return max(present) if present else None
+
+    peaks = {metric_type: [None] * len(windows) for metric_type in metric_types}
+
+    # Pass 1: the most promising hour of every metric/window.
+    first_spans = {}
+    first_choice = {}
+    for metric_type, bounds in bounds_by_metric.items():
+        for window_index, periods in bounds.items():
+            period_end = max(periods, key=periods.get)
+            span = _span(window_index, period_end, period_end)
+            first_spans.setdefault(span, []).append(metric_type)
+            first_choice[(metric_type, window_index)] = (period_end, span)
+    first_results = _fetch_spans(first_spans)
+    stats.periods_refined += len(first_choice)
+
+    # Pass 2: every other hour that could still hold a higher minute, merged into runs.
+    second_spans = {}
+    second_choice = {}
+    for (metric_type, window_index), (first_period_end, span) in first_choice.items():
+        peak = first_results[span][metric_type]
+        peaks[metric_type][window_index] = peak
+        periods = bounds_by_metric[metric_type][window_index]
+        remaining = sorted(
+            period_end for period_end, bound in periods.items()
+            if period_end != first_period_end and (peak is None or bound > peak)
+        )
+        stats.periods_refined += len(remaining)
+        for first, last in _runs(remaining):
+            run_span = _span(window_index, first, last)
+            second_spans.setdefault(run_span, []).append(metric_type)
+            second_choice.setdefault((metric_type, window_index), []).append(run_span)
+    second_results = _fetch_spans(second_spans) if second_spans else {}
+    for (metric_type, window_index), run_spans in second_choice.items():
+        peaks[metric_type][window_index] = _max(peaks[metric_type][window_index], *(second_results[span][metric_type] for span in run_spans))
+
+    logger.debug(f"Coarse-to-fine peaks for {instance_id_str}: {stats}")
+    return peaks
@@ -0,0 +1,55 @@
+METRIC_PREFIX = "parallelstore.googleapis.com/instance/"
+
+
+class MetricSpec:
+    """
+    One Parallelstore metric as the reports use it: the Cloud Monitoring metric type, the unit of its
+    60-second ALIGN_RATE value and the factor that turns that rate into MBps for throughput figures.
+    """
+    __slots__ = ("name", "metric_type", "unit", "mbps_per_unit", "label")
+
+    def __init__(self, name: str, metric_type: str, unit: str, mbps_per_unit: float, label: str):
+        self.name = name
+        self.metric_type = metric_type
+        self.unit = unit
+        self.mbps_per_unit = mbps_per_unit
+        self.label = label
+
+    def to_mbps(self, rate: float | None) -> float | None:
+        return None if rate is None else rate * self.mbps_per_unit
+
+    def __repr__(self):
+        return f"MetricSpec({self.name!r}, {self.metric_type!r}, unit={self.unit!r})"
+
+
+# The ops metrics keep the reports' long-standing assumption of 1 operation = 1 byte when they are
+# turned into "throughput"; transferred_bytes is the real byte counter (read + write).
+METRICS = {
+    spec.name: spec
+    for spec in (
+        MetricSpec("read_ops", METRIC_PREFIX + "read_ops_count", "ops/sec", 1 / 1000**2, "Read IOPS"),
+        MetricSpec("write_ops", METRIC_PREFIX + "write_ops_count", "ops/sec", 1 / 1000**2, "Write IOPS"),
+        MetricSpec("transferred_bytes", METRIC_PREFIX + "transferred_byte_count", "bytes/sec", 1 / 1000**2, "Transferred Bytes"),
+    )
+}
+METRICS_BY_TYPE = {spec.metric_type: spec for spec in METRICS.values()}
+
+
+def get(name_or_type: str) -> MetricSpec:
+    """Looks a metric up by registry name (e.g. "write_ops") or full metric type."""
+    spec = METRICS.get(name_or_type) or METRICS_BY_TYPE.get(name_or_type)
+    if spec is None:
+        raise ValueError(f"Unknown Parallelstore metric: {name_or_type}. Known metrics: {', '.join(sorted(METRICS))}")
+    return spec
+
+
+def resolve(names: str | list[str]) -> list[MetricSpec]:
+    """Turns a comma-separated string or list of names/types into MetricSpecs, keeping order and dropping repeats."""
+    if isinstance(names, str):
+        names = [name.strip() for name in names.split(",") if name.strip()]
+    specs = []
+    for name in names:
+        spec = get(name)
+        if spec not in specs:
+            specs.append(spec)
+    return specs
@@ -0,0 +1,537 @@
+from __future__ import annotations
+
+import functools
+import logging
+import math
+from collections import deque
+from datetime import datetime, timezone, timedelta
+from typing import TYPE_CHECKING
+
+import psclient
+import psshard
+
+# numpy and the Monitoring protobuf types are imported where they are used, so importing this module
+# (e.g. for the CLI's --help or an offline cache query) stays cheap; see psstartup.py.
+if TYPE_CHECKING:
+    import numpy as np
+    from google.cloud import monitoring_v3
+    from google.cloud.monitoring_v3.services.metric_service import pagers
+
+logger = logging.getLogger(__name__)
+
+# Bucket widths (seconds) for the --granularity option.
+GRANULARITY_SECONDS = {
+    "hour": 3600,
+    "day": 86400,
+    "week": 7 * 86400,
+}
+# The epoch (1970-01-01) is a Thursday; shifting by 3 days makes weekly buckets start on Monday.
+GRANULARITY_ORIGIN = {
+    "hour": 0,
+    "day": 0,
+    "week": -3 * 86400,
+}
+# Label that fleet queries group by so each instance comes back as its own series.
+INSTANCE_LABEL_FIELD = "resource.label.instance_id"
+GRANULARITY_LABEL_FORMAT = {
+    "hour": "%Y-%m-%d %H:00",
+    "day": "%Y-%m-%d",
+    "week": "%Y-%m-%d",
+}
+
+
+def floor_to_bucket(moment: datetime, granularity: str) -> datetime:
+    """
+    Returns the UTC start of the bucket (hour, day or Monday-based week) containing `moment`.
+    """
+    width = GRANULARITY_SECONDS[granularity]
+    origin = GRANULARITY_ORIGIN[granularity]
+    seconds = int(moment.timestamp())
+    return datetime.fromtimestamp(seconds - (seconds - origin) % width, tz=timezone.utc)
+
+
+def bucket_windows(start: datetime, end: datetime, granularity: str) -> list[tuple[datetime, datetime]]:
+    """
+    Splits the inclusive day range start..end into aligned buckets of the given granularity.
+    Each window is returned as (bucket_start, bucket_end) with bucket_end one second before the next bucket,
+    matching the 00:00:00 - 23:59:59 windows the day-by-day report queries. The first and last windows are
+    clamped to the range, so a week bucket never reaches outside the requested days.
+    """
+    width = timedelta(seconds=GRANULARITY_SECONDS[granularity])
+    first_day = datetime(start.year, start.month, start.day, tzinfo=timezone.utc)
+    range_end = datetime(end.year, end.month, end.day, tzinfo=timezone.utc) + timedelta(days=1) - timedelta(seconds=1)
+    windows = []
+    bucket_start = floor_to_bucket(first_day, granularity)
+    while bucket_start <= range_end:
+        windows.append((max(bucket_start, first_day), min(bucket_start + width - timedelta(seconds=1), range_end)))
+        bucket_start += width
+    return windows
+
+
+def bucket_label(bucket_start: datetime, granularity: str) -> str:
+    return bucket_start.strftime(GRANULARITY_LABEL_FORMAT[granularity])
+
+
+def build_rate_request(
+    metric_type: str,
+    project_id_str: str,
+    instance_id_str: str | None,
+    query_start_time: datetime,
+    query_end_time: datetime,
+    alignment_period_seconds: int = 60
+) -> monitoring_v3.types.ListTimeSeriesRequest:
+    """
+    Builds the 60-second ALIGN_RATE / REDUCE_MAX ListTimeSeries request used by the reports.
+    With instance_id_str=None the instance filter is dropped and the series are grouped by
+    resource.label.instance_id instead, so one request covers every instance in the project.
+    alignment_period_seconds coarsens the rate, e.g. to hourly means for psrefine's first pass.
+    """
+    from google.cloud import monitoring_v3
+
+    interval = monitoring_v3.types.TimeInterval(
+        end_time={"seconds": int(query_end_time.timestamp())},
+        start_time={"seconds": int(query_start_time.timestamp())}
+    )
+    aggregation = monitoring_v3.types.Aggregation(
+        alignment_period={"seconds": alignment_period_seconds},
+        per_series_aligner=monitoring_v3.types.Aggregation.Aligner.ALIGN_RATE,
+        cross_series_reducer=monitoring_v3.types.Aggregation.Reducer.REDUCE_MAX
+    )
+    filter_str = f'metric.type="{metric_type}" AND resource.type = "parallelstore.googleapis.com/Instance"'
+    if instance_id_str is None:
+        aggregation.group_by_fields = [INSTANCE_LABEL_FIELD]
+    else:
+        filter_str += f' AND resource.label.instance_id="{instance_id_str}"'
+    return monitoring_v3.types.ListTimeSeriesRequest(
+        name=f"projects/{project_id_str}",
+        filter=filter_str,
+        interval=interval,
+        view=monitoring_v3.types.ListTimeSeriesRequest.TimeSeriesView.FULL,
+        aggregation=aggregation
+    )
+
+
+def build_multi_rate_request(
+    metric_types: list[str],
+    project_id_str: str,
+    instance_id_str: str | None,
+    query_start_time: datetime,
+    query_end_time: datetime,
+    alignment_period_seconds: int = 60
+) -> monitoring_v3.types.ListTimeSeriesRequest:
+    """
+    Like build_rate_request, but one request covers every metric in metric_types via a
+    metric.type = one_of(...) filter. No cross-series reducer is applied (series of different metric
+    types cannot be reduced together), so the response holds one series per metric type and instance
+    and callers split it by metric.type; if several series share a type and instance, _to_arrays keeps
+    the max per point, which is what REDUCE_MAX would have done server-side.
+    """
+    from google.cloud import monitoring_v3
+
+    if len(metric_types) == 1:
+        return build_rate_request(metric_types[0], project_id_str, instance_id_str, query_start_time, query_end_time, alignment_period_seconds)
+    request = build_rate_request(metric_types[0], project_id_str, instance_id_str, query_start_time, query_end_time, alignment_period_seconds)
+    type_list = ", ".join(f'"{metric_type}"' for metric_type in metric_types)
+    request.filter = request.filter.replace(f'metric.type="{metric_types[0]}"', f"metric.type = one_of({type_list})", 1)
+    request.aggregation = monitoring_v3.types.Aggregation(
+        alignment_period={"seconds": alignment_period_seconds},
+        per_series_aligner=monitoring_v3.types.Aggregation.Aligner.ALIGN_RATE,
+    )
+    return request
+
+
+def _list_series_points(request: monitoring_v3.types.ListTimeSeriesRequest) -> dict[tuple[str, str], tuple[list[int], list[float]]]:
+    """
+    Walks every page of a ListTimeSeries request and collects point timestamps/values per
+    (metric type, instance_id label). Long or fleet-wide requests are split into time shards fetched in
+    parallel by psshard.SHARDER; the shards are merged newest first, the order a single query returns.
+    """
+    shards = psshard.SHARDER.fetch(request, _collect_series_points)
+    if len(shards) == 1:
+        return shards[0]
+    points_by_series = {}
+    for shard in shards:
+        for key, (shard_timestamps, shard_values) in shard.items():
+            timestamps, values = points_by_series.setdefault(key, ([], []))
+            timestamps.extend(shard_timestamps)
+            values.extend(shard_values)
+    return points_by_series
+
+
+def _collect_series_points(pages, after_ts: int | None = None) -> dict[tuple[str, str], tuple[list[int], list[float]]]:
+    points_by_series = {}
+    for page in pages:
+        for ts in page.time_series:
+            timestamps, values = points_by_series.setdefault((ts.metric.type, ts.resource.labels.get("instance_id", "")), ([], []))
+            _append_points(ts.points, timestamps, values)
+    if after_ts is not None:
+        # A shard boundary point is the older shard's last period; drop it if this shard returned it too.
+        for key, (timestamps, values) in points_by_series.items():
+            if timestamps and min(timestamps) <= after_ts:
+                kept = [(timestamp, value) for timestamp, value in zip(timestamps, values) if timestamp > after_ts]
+                points_by_series[key] = ([timestamp for timestamp, _ in kept], [value for _, value in kept])
+    return points_by_series
+
+
+def _append_points(points, timestamps: list[int], values: list[float]) -> None:
+    for point in points:
+        timestamps.append(int(point.interval.end_time.timestamp()))
+        if point.value.double_value is not None:
+            values.append(point.value.double_value)
+        elif point.value.int64_value is not None:
+            values.append(float(point.value.int64_value))
+
+
+class RateStats:
+    """
+    Running aggregates of a rate series: count, sum, min, max and the end timestamp of the peak point.
+    Built incrementally by reduce_rate_pages so no per-point values are kept.
+    """
+    __slots__ = ("count", "total", "minimum", "maximum", "peak_time")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = None
+        self.peak_time = None
+
+    @property
+    def mean(self) -> float | None:
+        return self.total / self.count if self.count else None
+
+    def merge(self, other: "RateStats") -> "RateStats":
+        """Folds another window's aggregates into this one (e.g. combining shards or days)."""
+        if other.count:
+            self.count += other.count
+            self.total += other.total
+            self.minimum = other.minimum if self.minimum is None else min(self.minimum, other.minimum)
+            if self.maximum is None or other.maximum > self.maximum:
+                self.maximum = other.maximum
+                self.peak_time = other.peak_time
+        return self
+
+    def __repr__(self):
+        peak_time = self.peak_time.isoformat() if self.peak_time else None
+        return f"RateStats(count={self.count}, max={self.maximum}, min={self.minimum}, mean={self.mean}, peak_time={peak_time})"
+
+
+def _reduce_series_points(points) -> RateStats:
+    count = 0
+    total = 0.0
+    minimum = None
+    maximum = None
+    peak_point = None
+    for point in points:
+        if point.value.double_value is not None:
+            value = point.value.double_value
+        elif point.value.int64_value is not None:
+            value = float(point.value.int64_value)
+        else:
+            continue
+        count += 1
+        total += value
+        if minimum is None or value < minimum:
+            minimum = value
+        if maximum is None or value > maximum:
+            maximum = value
+            peak_point = point
+    stats = RateStats()
+    stats.count = count
+    stats.total = total
+    stats.minimum = minimum
+    stats.maximum = maximum
+    if peak_point is not None:
+        stats.peak_time = datetime.fromtimestamp(peak_point.interval.end_time.timestamp(), tz=timezone.utc)
+    return stats
+
+
+def reduce_rate_pages(pages) -> RateStats:
+    """
+    Consumes ListTimeSeries pages as the pager yields them and reduces every point into a RateStats.
+    The peak timestamp is only decoded once per series, for its maximum point.
+    """
+    stats = RateStats()
+    for page in pages:
+        for ts in page.time_series:
+            stats.merge(_reduce_series_points(ts.points))
+    return stats
+
+
+def reduce_rate_pages_by_metric(pages, on_series=None) -> dict[str, RateStats]:
+    """
+    reduce_rate_pages for a batched (one_of) request: one RateStats per metric type in the response.
+    on_series, if given, is also called with (metric_type, timestamps, values) for every series as its
+    page arrives (e.g. to export the raw points).
+    """
+    stats_by_metric = {}
+    for page in pages:
+        for ts in page.time_series:
+            stats_by_metric.setdefault(ts.metric.type, RateStats()).merge(_reduce_series_points(ts.points))
+            if on_series is not None:
+                timestamps, values = [], []
+                _append_points(ts.points, timestamps, values)
+                on_series(ts.metric.type, timestamps, values)
+    return stats_by_metric
+
+
+def fetch_metrics_stats(
+    metric_types: list[str],
+    project_id_str: str,
+    instance_id_str: str,
+    query_start_time: datetime,
+    query_end_time: datetime,
+    point_sink=None
+) -> dict[str, RateStats]:
+    """
+    Peak/min/mean RateStats of several metrics from a single one_of ListTimeSeries request, reduced page by
+    page as the pages stream in. Metrics without points get an empty RateStats. point_sink, if given,
+    receives every series as (project_id, instance_id, metric_type, timestamps, values).
+    """
+    client = psclient.get_metric_client(project_id_str)
+    request = build_multi_rate_request(metric_types, project_id_str, instance_id_str, query_start_time, query_end_time)
+    results: pagers.ListTimeSeriesPager = client.list_time_series(request=request)
+    on_series = functools.partial(point_sink, project_id_str, instance_id_str) if point_sink else None
+    stats_by_metric = reduce_rate_pages_by_metric(results.pages, on_series)
+    return {metric_type: stats_by_metric.get(metric_type, RateStats()) for metric_type in metric_types}
+
+
+def fetch_metric_series(
+    metric_type: str,
+    project_id_str: str,
+    instance_id_str: str,
+    query_start_time: datetime,
+    query_end_time: datetime
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Queries the Google Cloud Monitoring API once for the whole query window and returns every
+    60-second ALIGN_RATE point as two NumPy arrays: end timestamps (epoch seconds) and rate values.
+    All result pages are consumed, so the caller gets the full series regardless of its length.
+    """
+    request = build_rate_request(metric_type, project_id_str, instance_id_str, query_start_time, query_end_time)
+    logger.debug(f"Fetching series: {metric_type} for instance: {instance_id_str} in project: {project_id_str}")
+    logger.debug(f"Query Window: {query_start_time.isoformat()} to {query_end_time.isoformat()}")
+
+    timestamps = []
+    values = []
+    for series_timestamps, series_values in _list_series_points(request).values():
+        timestamps.extend(series_timestamps)
+        values.extend(series_values)
+    logger.debug(f"Fetched {len(values)} points for {metric_type}")
+    return _to_arrays(timestamps, values)
+
+
+def fetch_metrics_series(
+    metric_types: list[str],
+    project_id_str: str,
+    instance_id_str: str,
+    query_start_time: datetime,
+    query_end_time: datetime,
+    fetch_series=None,
+    alignment_period_seconds: int = 60
+) -> dict[str, tuple[np.ndarray, np.ndarray]]:
+    """
+    fetch_metric_series for several metrics with a single one_of request, split by metric type
+    client-side. Returns {metric_type: (timestamps, values)}, with empty arrays for metrics that had no
+    points. fetch_series (same signature as fetch_metric_series, e.g. the cache) is called per metric instead
+    and always yields 60-second points; alignment_period_seconds only applies to the API request.
+    """
+    if fetch_series is not None:
+        return {
+            metric_type: fetch_series(metric_type, project_id_str, instance_id_str, query_start_time, query_end_time)
+            for metric_type in metric_types
+        }
+    request = build_multi_rate_request(metric_types, project_id_str, instance_id_str, query_start_time, query_end_time, alignment_period_seconds)
+    logger.debug(f"Fetching series: {', '.join(metric_types)} for instance: {instance_id_str} in project: {project_id_str}")
+    logger.debug(f"Query Window: {query_start_time.isoformat()} to {query_end_time.isoformat()}")
+
+    points = {metric_type: ([], []) for metric_type in metric_types}
+    for (metric_type, _), (series_timestamps, series_values) in _list_series_points(request).items():
+        timestamps, values = points.setdefault(metric_type, ([], []))
+        timestamps.extend(series_timestamps)
+        values.extend(series_values)
+    return {
+        metric_type: _to_arrays(timestamps, values)
+        for metric_type, (timestamps, values) in points.items()
+    }
+
+
+def fetch_metrics_series_by_instance(
+    metric_types: list[str],
+    project_id_str: str,
+    query_start_time: datetime,
+    query_end_time: datetime
+) -> dict[str, dict[str, tuple[np.ndarray, np.ndarray]]]:
+    """
+    Fleet variant of fetch_metrics_series: one request for every metric and every instance in the project.
+    Returns {metric_type: {instance_id: (timestamps, values)}}.
+    """
+    request = build_multi_rate_request(metric_types, project_id_str, None, query_start_time, query_end_time)
+    logger.debug(f"Fetching series: {', '.join(metric_types)} for all instances in project: {project_id_str}")
+    logger.debug(f"Query Window: {query_start_time.isoformat()} to {query_end_time.isoformat()}")
+
+    series = {metric_type: {} for metric_type in metric_types}
+    for (metric_type, instance_id), (timestamps, values) in _list_series_points(request).items():
+        series.setdefault(metric_type, {})[instance_id] = _to_arrays(timestamps, values)
+    return series
+
+
+def _to_arrays(timestamps: list[int], values: list[float]) -> tuple[np.ndarray, np.ndarray]:
+    """
+    The points as arrays. Several series of one metric type and instance (e.g. differing in a metric
+    label) are reduced to their max per timestamp, as REDUCE_MAX would have done server-side.
+    """
+    import numpy as np
+
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    unique_timestamps, point_index = np.unique(timestamps, return_inverse=True)
+    if unique_timestamps.size == timestamps.size:
+        return timestamps, values
+    # Newest first, like a single series from the API.
+    unique_timestamps = unique_timestamps[::-1]
+    point_index = unique_timestamps.size - 1 - point_index
+    peaks = np.full(unique_timestamps.size, np.nan)
+    np.fmax.at(peaks, point_index, values)
+    return unique_timestamps, peaks
+
+
+def _peak_list(peaks: np.ndarray) -> list[float | None]:
+    return [None if math.isnan(peak) else float(peak) for peak in peaks]
+
+
+def bucket_max(
+    timestamps: np.ndarray,
+    values: np.ndarray,
+    first_bucket_start: datetime,
+    granularity: str,
+    bucket_count: int
+) -> np.ndarray:
+    """
+    Vectorized group-by-max of a rate series into consecutive buckets, the first of which contains
+    first_bucket_start (the start of a window clamped by bucket_windows need not be on the bucket grid).
+    Returns one value per bucket; buckets without any points are NaN.
+    """
+    import numpy as np
+
+    width = GRANULARITY_SECONDS[granularity]
+    peaks = np.full(bucket_count, np.nan)
+    if timestamps.size == 0:
+        return peaks
+    bucket_index = (timestamps - int(floor_to_bucket(first_bucket_start, granularity).timestamp())) // width
+    in_range = (bucket_index >= 0) & (bucket_index < bucket_count)
+    # fmax ignores the NaN we start from, so the first point in each bucket becomes its running max.
+    np.fmax.at(peaks, bucket_index[in_range], values[in_range])
+    return peaks
+
+
+def fetch_bucketed_peaks(
+    metric_type: str,
+    project_id_str: str,
+    instance_id_str: str,
+    windows: list[tuple[datetime, datetime]],
+    granularity: str,
+    fetch_series=None
+) -> list[float | None]:
+    """
+    Fetches the whole windows range in a single paginated request and returns the peak rate of each window
+    (None where the window has no data), in the same order as `windows`.
+    fetch_series replaces fetch_metric_series as the point source (e.g. a cache-backed fetcher) and takes
+    the same (metric_type, project_id, instance_id, start, end) arguments.
+    """
+    if not windows:
+        return []
+    timestamps, values = (fetch_series or fetch_metric_series)(
+        metric_type, project_id_str, instance_id_str, windows[0][0], windows[-1][1]
+    )
+    peaks = bucket_max(timestamps, values, windows[0][0], granularity, len(windows))
+    return _peak_list(peaks)
+
+
+def fetch_bucketed_peaks_for_metrics(
+    metric_types: list[str],
+    project_id_str: str,
+    instance_id_str: str,
+    windows: list[tuple[datetime, datetime]],
+    granularity: str,
+    fetch_series=None,
+    point_sink=None
+) -> dict[str, list[float | None]]:
+    """
+    fetch_bucketed_peaks for several metrics from one batched request: {metric_type: [peak per window]}.
+    point_sink, if given, receives every fetched series as (project_id, instance_id, metric_type, timestamps, values).
+    """
+    if not windows:
+        return {metric_type: [] for metric_type in metric_types}
+    series = fetch_metrics_series(metric_types, project_id_str, instance_id_str, windows[0][0], windows[-1][1], fetch_series)
+    peaks_by_metric = {}
+    for metric_type in metric_types:
+        timestamps, values = series[metric_type]
+        if point_sink is not None:
+            point_sink(project_id_str, instance_id_str, metric_type, timestamps, values)
+        peaks = bucket_max(timestamps, values, windows[0][0], granularity, len(windows))
+        peaks_by_metric[metric_type] = _peak_list(peaks)
+    return peaks_by_metric
+
+
+def fetch_bucketed_peaks_by_instance_for_metrics(
+    metric_types: list[str],
+    project_id_str: str,
+    windows: list[tuple[datetime, datetime]],
+    granularity: str,
+    point_sink=None
+) -> dict[str, dict[str, list[float | None]]]:
+    """
+    Like fetch_bucketed_peaks_for_metrics, but for every instance in the project from one batched request
+    grouped by instance: {metric_type: {instance_id: [peak per window]}}; instances with no points in the
+    range are absent. point_sink works as in fetch_bucketed_peaks_for_metrics.
+    """
+    if not windows:
+        return {metric_type: {} for metric_type in metric_types}
+    series = fetch_metrics_series_by_instance(metric_types, project_id_str, windows[0][0], windows[-1][1])
+    peaks_by_metric = {}
+    for metric_type, series_by_instance in series.items():
+        peaks_by_metric[metric_type] = {}
+        for instance_id, (timestamps, values) in series_by_instance.items():
+            if point_sink is not None:
+                point_sink(project_id_str, instance_id, metric_type, timestamps, values)
+            peaks = bucket_max(timestamps, values, windows[0][0], granularity, len(windows))
+            peaks_by_metric[metric_type][instance_id] = _peak_list(peaks)
+    return peaks_by_metric
+
+
+class RollingPeak:
+    """
+    Maximum of a rate series over a sliding time window, for the --watch loop.
+    Points must be added in timestamp order; a monotonic deque keeps only the points that can still
+    become the window maximum, so add() and expire() are amortized O(1) and memory stays bounded.
+    """
+    __slots__ = ("window_seconds", "last_timestamp", "_candidates")
+
+    def __init__(self, window_seconds: int):
+        self.window_seconds = window_seconds
+        self.last_timestamp = None
+        self._candidates = deque()  # (timestamp, value), values strictly decreasing
+
+    def add(self, timestamp: int, value: float) -> bool:
+        """Adds a point; returns False (and ignores it) when it is not newer than the last point added."""
+        if self.last_timestamp is not None and timestamp <= self.last_timestamp:
+            return False
+        self.last_timestamp = timestamp
+        while self._candidates and self._candidates[-1][1] <= value:
+            self._candidates.pop()
+        self._candidates.append((timestamp, value))
+        return True
+
+    def expire(self, now_timestamp: int) -> None:
+        """Drops points that have slid out of the window ending at now_timestamp."""
+        while self._candidates and self._candidates[0][0] <= now_timestamp - self.window_seconds:
+            self._candidates.popleft()
+
+    @property
+    def peak(self) -> float | None:
+        return self._candidates[0][1] if self._candidates else None
+
+    @property
+    def peak_time(self) -> datetime | None:
+        return datetime.fromtimestamp(self._candidates[0][0], tz=timezone.utc) if self._candidates else None
@@ -0,0 +1,266 @@
+from __future__ import annotations
+
+import logging
+import statistics
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import TYPE_CHECKING
+
+import psclient
+
+if TYPE_CHECKING:
+    from google.cloud import monitoring_v3
+
+logger = logging.getLogger(__name__)
+
+# Defaults for the shared sharder; override with configure().
+DEFAULT_TARGET_POINTS = 50000        # Points per shard: a few dozen result pages.
+DEFAULT_MAX_WORKERS = 8
+MIN_SHARD_PERIODS = 60               # Never shard below an hour of 60-second periods.
+# A running shard that streams this many times the target keeps its pages, but the shards still to be carved
+# are sized from its rate; one that runs this many times longer than the median finished shard of the same
+# fetch (and at least MIN_SLOW_SECONDS) is abandoned and split in two.
+OVERSIZE_FACTOR = 2
+SLOW_SHARD_FACTOR = 3
+MIN_SLOW_SECONDS = 5.0
+# Weight of the newest observation in the points-per-second estimate kept per request shape.
+ESTIMATE_WEIGHT = 0.5
+
+
+class ShardStats:
+    """Counters for the sharded fetches of a run."""
+    __slots__ = ("fetches", "sharded_fetches", "shards", "oversized", "split_slow", "points", "abandoned_points")
+
+    def __init__(self):
+        self.fetches = 0
+        self.sharded_fetches = 0
+        self.shards = 0
+        self.oversized = 0
+        self.split_slow = 0
+        self.points = 0
+        self.abandoned_points = 0
+
+
+class _SplitShard(Exception):
+    def __init__(self, points: int):
+        super().__init__("slow")
+        self.points = points
+
+
+def _interval(request: monitoring_v3.types.ListTimeSeriesRequest) -> tuple[int, int]:
+    return int(request.interval.start_time.timestamp()), int(request.interval.end_time.timestamp())
+
+
+def _period(request: monitoring_v3.types.ListTimeSeriesRequest) -> int:
+    return int(request.aggregation.alignment_period.total_seconds()) or 60
+
+
+def _series_known(request: monitoring_v3.types.ListTimeSeriesRequest) -> bool:
+    # A single-instance, ungrouped request returns one series per metric; a fleet or grouped request
+    # returns as many as there are instances, which only a fetch of it tells.
+    return not request.aggregation.group_by_fields and 'resource.label.instance_id="' in request.filter
+
+
+def _default_points_per_second(request: monitoring_v3.types.ListTimeSeriesRequest) -> float:
+    # One point per period for each metric; a lower bound for fleet and grouped requests.
+    metric_count = request.filter.split("one_of(", 1)[1].count(",") + 1 if "one_of(" in request.filter else 1
+    return metric_count / _period(request)
+
+
+def split_shard(shard: tuple[int, int], period: int) -> list[tuple[int, int]]:
+    """The two halves of a shard (newest first), split on the alignment grid."""
+    start, end = shard
+    middle = end - (end - start) // period // 2 * period
+    return [(middle, end), (start, middle)]
+
+
+class AdaptiveSharder:
+    """
+    Splits long or fleet-wide ListTimeSeries requests into time shards fetched in parallel, so one huge
+    response is not walked page by page through a single stream. Shard length comes from the points per
+    second observed for the same request shape (project, filter, alignment) on earlier fetches. A shard
+    that turns out too large is kept, and the shards still to be carved are sized from the rate it has
+    streamed; one that turns out too slow is abandoned between pages and re-fetched as two halves.
+    Requests whose series count is unknown (fleet-wide or grouped) are not sharded until their shape has
+    been fetched once. target_points <= 0 disables sharding.
+    """
+
+    def __init__(self, target_points: int = DEFAULT_TARGET_POINTS, max_workers: int = DEFAULT_MAX_WORKERS):
+        self._lock = threading.Lock()
+        self._estimates = {}
+        self.stats = ShardStats()
+        self.configure(target_points, max_workers)
+
+    def configure(self, target_points: int = DEFAULT_TARGET_POINTS, max_workers: int = DEFAULT_MAX_WORKERS) -> None:
+        with self._lock:
+            self.target_points = target_points
+            self.max_workers = max(1, max_workers)
+
+    def _estimate(self, key: tuple, request) -> float:
+        # Never below one full series per metric, so idle stretches do not make the next shard huge.
+        with self._lock:
+            return max(self._estimates.get(key, 0.0), _default_points_per_second(request))
+
+    def _observe(self, key: tuple, points: int, seconds: int, lower_bound: bool = False) -> None:
+        # A lower bound (a shard still streaming) only ever raises the estimate.
+        if seconds <= 0:
+            return
+        observed = points / seconds
+        with self._lock:
+            previous = self._estimates.get(key)
+            if previous is None:
+                self._estimates[key] = observed
+            elif lower_bound:
+                self._estimates[key] = max(previous, observed)
+            else:
+                self._estimates[key] = ESTIMATE_WEIGHT * observed + (1 - ESTIMATE_WEIGHT) * previous
+
+    def fetch(self, request: monitoring_v3.types.ListTimeSeriesRequest, consume) -> list:
+        """
+        Runs request and returns consume's result per shard, newest shard first (the API's own point
+        order), so callers that concatenate them get what a single query would have returned.
+        consume(pages, after_ts) reduces one shard's pages; points ending at or before after_ts belong to
+        the next older shard and must be dropped (after_ts is None for the oldest shard).
+        A request that fits in one shard is run as is, on the calling thread.
+        """
+        start_ts, end_ts = _interval(request)
+        period = _period(request)
+        key = (request.name, request.filter, period)
+        estimate = self._estimate(key, request)
+        with self._lock:
+            self.stats.fetches += 1
+            target_points, max_workers = self.target_points, self.max_workers
+            observed = key in self._estimates
+        min_seconds = MIN_SHARD_PERIODS * period
+        if (
+            target_points <= 0
+            or (end_ts - start_ts) * estimate <= target_points
+            or end_ts - start_ts < 2 * min_seconds
+            or not (observed or _series_known(request))
+        ):
+            client = psclient.get_metric_client(request.name.split("/", 1)[1])
+            started = time.monotonic()
+            points = [0]
+            result = consume(self._counted(client.list_time_series(request=request).pages, points), None)
+            self._observe(key, points[0], end_ts - start_ts)
+            logger.debug(f"Unsharded fetch of {end_ts - start_ts}s: {points[0]} point(s) in {time.monotonic() - started:.2f}s")
+            return [result]
+
+        with self._lock:
+            self.stats.sharded_fetches += 1
+        logger.debug(f"Sharding {end_ts - start_ts}s of {request.filter} ({estimate:.3f} point(s)/s expected, {target_points} point(s) per shard)")
+        return self._fetch_shards(request, consume, start_ts, end_ts, period, key, target_points, max_workers)
+
+    def _shard_seconds(self, key: tuple, request, target_points: int, period: int) -> int:
+        """Seconds of the next shard: target_points at the current estimate, on the alignment grid."""
+        seconds = max(MIN_SHARD_PERIODS * period, int(target_points / self._estimate(key, request)))
+        return seconds - seconds % period
+
+    @staticmethod
+    def _counted(pages, points: list[int]):
+        for page in pages:
+            points[0] += sum(len(series.points) for series in page.time_series)
+            yield page
+
+    def _fetch_shards(self, request, consume, start_ts: int, end_ts: int, period: int, key: tuple, target_points: int, max_workers: int) -> list:
+        from google.cloud import monitoring_v3
+
+        client = psclient.get_metric_client(request.name.split("/", 1)[1])
+        min_seconds = MIN_SHARD_PERIODS * period
+        max_points = target_points * OVERSIZE_FACTOR
+        durations = []
+        # Shards are carved off the newest end of what is left only when a worker is free, so each one
+        # is sized from the estimate as it stands after the shards before it (and after any running shard
+        # that has already streamed more than max_points). Split halves go first.
+        unclaimed_end = end_ts
+        halves = []
+
+        def _next_shard() -> tuple[int, int] | None:
+            nonlocal unclaimed_end
+            if halves:
+                return halves.pop(0)
+            if unclaimed_end <= start_ts:
+                return None
+            shard = (max(start_ts, unclaimed_end - self._shard_seconds(key, request, target_points, period)), unclaimed_end)
+            unclaimed_end = shard[0]
+            return shard
+
+        def _watched(pages, shard, started, points):
+            splittable = shard[1] - shard[0] >= 2 * min_seconds
+            oversized = False
+            for page in pages:
+                points[0] += sum(len(series.points) for series in page.time_series)
+                if not oversized and points[0] > max_points:
+                    # At least this many points per second: the shards still to be carved get smaller.
+                    oversized = True
+                    self._observe(key, points[0], shard[1] - shard[0], lower_bound=True)
+                    with self._lock:
+                        self.stats.oversized += 1
+                    logger.debug(f"Shard {shard} passed {max_points} point(s); sizing the next shards from its rate")
+                # Checked between pages: the median is of the shards that finished so far.
+                if splittable and durations and time.monotonic() - started > max(MIN_SLOW_SECONDS, SLOW_SHARD_FACTOR * statistics.median(durations)):
+                    raise _SplitShard(points[0])
+                yield page
+
+        def _fetch(shard):
+            started = time.monotonic()
+            points = [0]
+            shard_request = type(request)(request)
+            shard_request.interval = monitoring_v3.types.TimeInterval(start_time={"seconds": shard[0]}, end_time={"seconds": shard[1]})
+            pages = client.list_time_series(request=shard_request).pages
+            result = consume(_watched(pages, shard, started, points), shard[0] if shard[0] > start_ts else None)
+            return result, points[0], time.monotonic() - started
+
+        results = {}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            running = {}
+
+            def _fill() -> None:
+                while len(running) < max_workers:
+                    shard = _next_shard()
+                    if shard is None:
+                        return
+                    running[executor.submit(_fetch, shard)] = shard
+
+            _fill()
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    shard = running.pop(future)
+                    try:
+                        results[shard], points, seconds = future.result()
+                    except _SplitShard as split:
+                        with self._lock:
+                            self.stats.abandoned_points += split.points
+                            self.stats.split_slow += 1
+                        logger.debug(f"Splitting slow shard {shard} after {split.points} point(s)")
+                        halves.extend(split_shard(shard, period))
+                        continue
+                    durations.append(seconds)
+                    self._observe(key, points, shard[1] - shard[0])
+                    with self._lock:
+                        self.stats.shards += 1
+                        self.stats.points += points
+                _fill()
+        return [results[shard] for shard in sorted(results, key=lambda shard: -shard[1])]
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {field: getattr(self.stats, field) for field in ShardStats.__slots__}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._estimates.clear()
+            self.stats = ShardStats()
+
+    def log_summary(self, log: logging.Logger) -> None:
+        stats = self.summary()
+        log.info(
+            f"  {stats['sharded_fetches']} of {stats['fetches']} fetch(es) sharded into {stats['shards']} shard(s) "
+            f"({stats['points']} point(s)); {stats['oversized']} shard(s) came back too large and {stats['split_slow']} were split as too slow, "
+            f"discarding {stats['abandoned_points']} point(s)"
+        )
+
+
+SHARDER = AdaptiveSharder()
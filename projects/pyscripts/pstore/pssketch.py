@@ -0,0 +1,216 @@
+from __future__ import annotations
+
+import json
+import math
+import sqlite3
+import threading
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import numpy as np
+
+DEFAULT_RELATIVE_ACCURACY = 0.01
+DEFAULT_QUANTILES = (0.5, 0.95, 0.99)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sketches (
+    project_id TEXT NOT NULL,
+    instance_id TEXT NOT NULL,
+    metric_type TEXT NOT NULL,
+    day TEXT NOT NULL,
+    points INTEGER NOT NULL,
+    sketch BLOB NOT NULL,
+    PRIMARY KEY (project_id, instance_id, metric_type, day)
+) WITHOUT ROWID;
+"""
+
+
+class RateSketch:
+    """
+    Mergeable quantile sketch of 60-second rates: a histogram with logarithmically sized bins (the HDR /
+    DDSketch idea), so any quantile is returned within relative_accuracy of a real point and two sketches
+    merge exactly by adding their bin counts. Zero (idle) rates get their own bin; min and max are exact.
+    """
+    __slots__ = ("relative_accuracy", "count", "zero_count", "minimum", "maximum", "bins", "_log_gamma")
+
+    def __init__(self, relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        self.count = 0
+        self.zero_count = 0
+        self.minimum = None
+        self.maximum = None
+        self.bins = {}
+        self._log_gamma = math.log((1 + relative_accuracy) / (1 - relative_accuracy))
+
+    def add_many(self, values: list[float] | np.ndarray) -> None:
+        import numpy as np
+
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if values.size == 0:
+            return
+        positive = values[values > 0]
+        self.zero_count += int(values.size - positive.size)
+        if positive.size:
+            indexes, counts = np.unique(np.ceil(np.log(positive) / self._log_gamma).astype(np.int64), return_counts=True)
+            for index, count in zip(indexes.tolist(), counts.tolist()):
+                self.bins[index] = self.bins.get(index, 0) + count
+        self.count += int(values.size)
+        low, high = float(values.min()), float(values.max())
+        self.minimum = low if self.minimum is None else min(self.minimum, low)
+        self.maximum = high if self.maximum is None else max(self.maximum, high)
+
+    def merge(self, other: RateSketch) -> RateSketch:
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError(f"Cannot merge sketches with relative accuracy {self.relative_accuracy} and {other.relative_accuracy}")
+        for index, count in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + count
+        self.count += other.count
+        self.zero_count += other.zero_count
+        if other.count:
+            self.minimum = other.minimum if self.minimum is None else min(self.minimum, other.minimum)
+            self.maximum = other.maximum if self.maximum is None else max(self.maximum, other.maximum)
+        return self
+
+    def quantile(self, q: float) -> float | None:
+        """The q-quantile (0 <= q <= 1) of the points added, or None for an empty sketch."""
+        if not self.count:
+            return None
+        if q >= 1:
+            return self.maximum
+        rank = q * (self.count - 1)
+        if rank < self.zero_count:
+            return 0.0
+        seen = self.zero_count
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if seen > rank:
+                # Midpoint of the bin (gamma^(i-1), gamma^i], which is within relative_accuracy of any value in it.
+                value = 2 * math.exp(index * self._log_gamma) / (1 + math.exp(self._log_gamma))
+                return min(max(value, self.minimum), self.maximum)
+        return self.maximum
+
+    def to_bytes(self) -> bytes:
+        return zlib.compress(json.dumps({
+            "relative_accuracy": self.relative_accuracy,
+            "count": self.count,
+            "zero_count": self.zero_count,
+            "minimum": self.minimum,
+            "maximum": self.maximum,
+            "bins": [[index, count] for index, count in sorted(self.bins.items())],
+        }).encode())
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> RateSketch:
+        state = json.loads(zlib.decompress(data))
+        sketch = cls(state["relative_accuracy"])
+        sketch.count = state["count"]
+        sketch.zero_count = state["zero_count"]
+        sketch.minimum = state["minimum"]
+        sketch.maximum = state["maximum"]
+        sketch.bins = {index: count for index, count in state["bins"]}
+        return sketch
+
+    def __repr__(self):
+        return f"RateSketch(count={self.count}, min={self.minimum}, max={self.maximum}, bins={len(self.bins)})"
+
+
+def day_label(timestamp: int) -> str:
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).strftime("%Y-%m-%d")
+
+
+def day_labels(start: datetime, end: datetime) -> list[str]:
+    """Every UTC day from start to end, inclusive, as YYYY-MM-DD."""
+    labels = []
+    day = datetime(start.year, start.month, start.day, tzinfo=timezone.utc)
+    while day <= end:
+        labels.append(day.strftime("%Y-%m-%d"))
+        day += timedelta(days=1)
+    return labels
+
+
+class SketchStore:
+    """
+    SQLite store of one RateSketch per project/instance/metric/UTC day. Percentiles over any range of
+    days are answered by merging the stored sketches, without fetching points again.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def store_many(self, sketches: dict[tuple[str, str, str, str], RateSketch]) -> None:
+        """Saves {(project_id, instance_id, metric_type, day): sketch}, replacing what was stored for those days."""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO sketches (project_id, instance_id, metric_type, day, points, sketch) VALUES (?, ?, ?, ?, ?, ?)",
+                ((*key, sketch.count, sketch.to_bytes()) for key, sketch in sketches.items())
+            )
+
+    def merged(self, project_id: str, instance_id: str, metric_type: str, first_day: str, last_day: str) -> tuple[RateSketch, list[str]]:
+        """The merge of the sketches stored for [first_day, last_day] and the days that had one."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT day, sketch FROM sketches WHERE project_id = ? AND instance_id = ? AND metric_type = ? "
+                "AND day BETWEEN ? AND ? ORDER BY day",
+                (project_id, instance_id, metric_type, first_day, last_day)
+            ).fetchall()
+        merged = None
+        for _, data in rows:
+            sketch = RateSketch.from_bytes(data)
+            merged = sketch if merged is None else merged.merge(sketch)
+        return merged or RateSketch(), [day for day, _ in rows]
+
+    def instance_ids(self, project_id: str, first_day: str, last_day: str) -> list[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT DISTINCT instance_id FROM sketches WHERE project_id = ? AND day BETWEEN ? AND ? ORDER BY instance_id",
+                (project_id, first_day, last_day)
+            ).fetchall()
+        return [instance_id for instance_id, in rows]
+
+
+class SketchRecorder:
+    """
+    Point sink (see psexport.ReportExporter.write_points for the signature) that folds every fetched
+    60-second point into its instance/metric/day sketch; flush() saves them to the store. A day is
+    replaced as a whole, so a report should fetch whole days (as the daily and whole-period reports do).
+    """
+
+    def __init__(self, store: SketchStore, relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY):
+        self.store = store
+        self.relative_accuracy = relative_accuracy
+        self._lock = threading.Lock()
+        self._sketches = {}
+
+    def add_points(self, project_id: str, instance_id: str, metric_type: str, timestamps: list[int] | np.ndarray, values: list[float] | np.ndarray) -> None:
+        import numpy as np
+
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        days = timestamps // 86400
+        for day in np.unique(days).tolist():
+            key = (project_id, instance_id, metric_type, day_label(day * 86400))
+            day_values = values[days == day]
+            with self._lock:
+                sketch = self._sketches.get(key)
+                if sketch is None:
+                    sketch = self._sketches[key] = RateSketch(self.relative_accuracy)
+                sketch.add_many(day_values)
+
+    def flush(self) -> int:
+        """Saves the sketches recorded so far; returns how many instance/metric/days were written."""
+        with self._lock:
+            sketches, self._sketches = self._sketches, {}
+        if sketches:
+            self.store.store_many(sketches)
+        return len(sketches)
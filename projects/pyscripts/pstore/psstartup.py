@@ -0,0 +1,138 @@
+"""
+Startup budget check for the pstore CLI (7.py).
+
+Runs the paths that should never touch the network or the heavy libraries (--help, an argument error and
+an --offline query against an empty cache) under `python -X importtime`, each in a fresh process, and
+fails when the median import time or wall time goes over budget or when a path imports a module it must
+not need (numpy, the Monitoring client/gRPC, google.auth, requests). Meant to run in CI after changes to
+the import blocks of 7.py and the ps*.py modules:
+
+    python psstartup.py [--runs 5] [--import_budget_ms 150] [--wall_budget_ms 400] [--top 10]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPORT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "7.py")
+NETWORK_MODULES = ("google.cloud.monitoring_v3", "grpc", "google.auth", "requests")
+# Module prefixes each scenario must not import. The offline path may load numpy to read cached points.
+FORBIDDEN_MODULES = {
+    "help": ("numpy",) + NETWORK_MODULES,
+    "argument_error": ("numpy",) + NETWORK_MODULES,
+    "offline_empty_cache": NETWORK_MODULES,
+}
+
+
+def scenario_args(name: str, workdir: str) -> tuple[list[str], int]:
+    """Command-line arguments for a scenario and the exit code it is expected to end with."""
+    if name == "help":
+        return ["--help"], 0
+    if name == "argument_error":
+        return ["--project_id", "p"], 2
+    if name == "offline_empty_cache":
+        return [
+            "--project_id", "startup-check", "--instance_id", "startup-check",
+            "--start_date", "2025-01-01", "--end_date", "2025-01-02",
+            "--offline", "--cache_db", os.path.join(workdir, "empty_cache.db"),
+            "--log_file", "", "--json_log_file", "",
+        ], 0
+    raise ValueError(f"Unknown scenario: {name}")
+
+
+def parse_importtime(stderr: str) -> dict[str, int]:
+    """
+    {module: cumulative microseconds} from `-X importtime` output. Only the first import of a module is
+    reported, so the cumulative times of the top-level (least indented) lines add up to the total.
+    """
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|", 2)
+        if not cumulative.strip().isdigit():
+            continue  # the header line
+        modules[name.strip()] = (int(cumulative), len(name) - len(name.lstrip()))
+    return modules
+
+
+def run_once(name: str, workdir: str) -> dict:
+    """Runs one scenario in a fresh interpreter and returns its timings and imported modules."""
+    args, expected_exit = scenario_args(name, workdir)
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", REPORT_SCRIPT] + args,
+        cwd=workdir, capture_output=True, text=True,
+    )
+    wall_ms = (time.perf_counter() - started) * 1000
+    if result.returncode != expected_exit:
+        raise RuntimeError(f"{name}: exit code {result.returncode}, expected {expected_exit}:\n{result.stderr[-2000:]}")
+    modules = parse_importtime(result.stderr)
+    top_level = min((indent for _, indent in modules.values()), default=0)
+    import_us = sum(cumulative for cumulative, indent in modules.values() if indent == top_level)
+    return {
+        "wall_ms": wall_ms,
+        "import_ms": import_us / 1000,
+        "modules": {module: cumulative / 1000 for module, (cumulative, indent) in modules.items() if indent == top_level},
+        # Every module loaded, however deep: a forbidden one is usually pulled in by a ps*.py module.
+        "imported": set(modules),
+    }
+
+
+def check_scenario(name: str, runs: int, workdir: str) -> dict:
+    """Median wall/import time over `runs` fresh processes, the slowest top-level imports and any forbidden imports."""
+    samples = [run_once(name, workdir) for _ in range(runs)]
+    imported = set().union(*(sample["imported"] for sample in samples))
+    forbidden = sorted(
+        module for module in imported
+        if any(module == prefix or module.startswith(prefix + ".") for prefix in FORBIDDEN_MODULES[name])
+    )
+    slowest = sorted(samples[-1]["modules"].items(), key=lambda item: item[1], reverse=True)
+    return {
+        "scenario": name,
+        "runs": runs,
+        "wall_ms": statistics.median(sample["wall_ms"] for sample in samples),
+        "import_ms": statistics.median(sample["import_ms"] for sample in samples),
+        "forbidden_imports": forbidden,
+        "slowest_imports": slowest,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that the pstore CLI's fast paths stay within their startup budget.")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh processes per scenario; the median is compared to the budget (default: 5).")
+    parser.add_argument("--import_budget_ms", type=float, default=150.0, help="Maximum median -X importtime total per scenario, in ms (default: 150).")
+    parser.add_argument("--wall_budget_ms", type=float, default=400.0, help="Maximum median wall time per scenario, in ms (default: 400).")
+    parser.add_argument("--scenarios", type=lambda value: value.split(","), default=list(FORBIDDEN_MODULES), help=f"Comma-separated scenarios (default: {','.join(FORBIDDEN_MODULES)}).")
+    parser.add_argument("--top", type=int, default=10, help="How many of the slowest top-level imports to list per scenario (default: 10).")
+    parser.add_argument("--output", type=str, default=None, help="Also write the results as JSON to this file.")
+    args = parser.parse_args()
+
+    failures = []
+    results = []
+    with tempfile.TemporaryDirectory(prefix="pstore_startup_") as workdir:
+        for name in args.scenarios:
+            result = check_scenario(name, args.runs, workdir)
+            results.append(result)
+            print(f"{name}: median wall {result['wall_ms']:.0f} ms, imports {result['import_ms']:.0f} ms over {result['runs']} run(s)")
+            for module, ms in result["slowest_imports"][:args.top]:
+                print(f"    {ms:8.1f} ms  {module}")
+            if result["forbidden_imports"]:
+                failures.append(f"{name} imports {', '.join(result['forbidden_imports'])}")
+            if result["import_ms"] > args.import_budget_ms:
+                failures.append(f"{name} import time {result['import_ms']:.0f} ms > budget {args.import_budget_ms:.0f} ms")
+            if result["wall_ms"] > args.wall_budget_ms:
+                failures.append(f"{name} wall time {result['wall_ms']:.0f} ms > budget {args.wall_budget_ms:.0f} ms")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if failures:
+        sys.exit(1)
+    print("Startup budget OK.")
@@ -0,0 +1,250 @@
+import json
+import math
+import re
+import threading
+import zlib
+
+from google.cloud import monitoring_v3
+
+
+def _filter_metric_types(filter_str: str) -> list[str]:
+    """Metric types named by a request filter, either metric.type="..." or metric.type = one_of("...", ...)."""
+    if "one_of(" in filter_str:
+        type_list = filter_str.split("one_of(", 1)[1].split(")", 1)[0]
+        return [item.strip().strip('"') for item in type_list.split(",")]
+    return [filter_str.split('metric.type="', 1)[1].split('"', 1)[0]]
+
+
+class _StubPager:
+    """Minimal stand-in for ListTimeSeriesPager: exposes .pages and iterates series like the real pager."""
+
+    def __init__(self, pages):
+        self.pages = pages
+
+    def __iter__(self):
+        for page in self.pages:
+            yield from page.time_series
+
+
+class StubMetricServiceClient:
+    """
+    Offline MetricServiceClient for exercising pstore without network or credentials.
+    list_time_series() synthesizes one 60-second ALIGN_RATE point per minute of the requested interval
+    for each instance (a deterministic daily wave per metric/instance, with idle days), split into pages
+    of points_per_page points. A longer alignment period returns the mean rate of the minutes in each
+    period (idle minutes count as zero, as for a delta counter). Requests without an instance filter return every instance in instance_ids,
+    as the grouped fleet query does.
+
+    Install it with psclient.configure(client_factory=StubMetricServiceClient).
+    Every request is kept in .requests so callers can check how much API traffic a run caused.
+    """
+
+    instance_ids = ("alphafoldnfs", "tpu-home-test", "pvc-d13842ae")
+    points_per_page = 1440
+
+    def __init__(self, *args, **kwargs):
+        self.requests = []
+        self.points_served = 0
+
+    @staticmethod
+    def rate_at(metric_type: str, instance_id: str, ts: int) -> float | None:
+        """
+        The synthetic rate for one minute, or None when the instance is idle that day (every 7th day).
+        """
+        seed = zlib.crc32(f"{metric_type}/{instance_id}".encode())
+        day = ts // 86400
+        if (day + seed) % 7 == 0:
+            return None
+        scale = 1000.0 + seed % 50000
+        return scale * (1.0 + math.sin(2 * math.pi * (ts % 86400) / 86400 + seed % 360))
+
+    def list_time_series(self, request=None, **kwargs):
+        self.requests.append(request)
+        metric_types = _filter_metric_types(request.filter)
+        if 'resource.label.instance_id="' in request.filter:
+            instance_ids = [request.filter.split('resource.label.instance_id="', 1)[1].split('"', 1)[0]]
+        else:
+            instance_ids = list(self.instance_ids)
+        start_ts = int(request.interval.start_time.timestamp())
+        end_ts = int(request.interval.end_time.timestamp())
+        first_point = start_ts - start_ts % 60 + 60
+        period = int(request.aggregation.alignment_period.total_seconds()) or 60
+
+        pages = []
+        for metric_type in metric_types:
+            for instance_id in instance_ids:
+                points = []
+                # The API returns points newest first.
+                for ts in range(end_ts - end_ts % 60, first_point - 1, -period):
+                    minute_rates = [
+                        self.rate_at(metric_type, instance_id, minute)
+                        for minute in range(ts, max(ts - period, first_point - 60), -60)
+                    ]
+                    minute_rates = [rate for rate in minute_rates if rate is not None]
+                    if minute_rates:
+                        rate = sum(minute_rates) / (period // 60)
+                        points.append({"interval": {"end_time": {"seconds": ts}}, "value": {"double_value": rate}})
+                self.points_served += len(points)
+                for chunk_start in range(0, len(points), self.points_per_page):
+                    series = monitoring_v3.types.TimeSeries(
+                        metric={"type": metric_type},
+                        resource={"type": "parallelstore.googleapis.com/Instance", "labels": {"instance_id": instance_id}},
+                        points=points[chunk_start:chunk_start + self.points_per_page]
+                    )
+                    pages.append(monitoring_v3.types.ListTimeSeriesResponse(time_series=[series]))
+        return _StubPager(pages)
+
+
+class _StubResponse:
+    """The parts of a requests.Response that psbackend.PromQLRollupBackend reads."""
+
+    def __init__(self, body: dict):
+        self.content = json.dumps(body).encode()
+        self._body = body
+
+    def raise_for_status(self) -> None:
+        pass
+
+    def json(self) -> dict:
+        return self._body
+
+
+class StubPrometheusSession:
+    """
+    Offline stand-in for Cloud Monitoring's PromQL query_range API that evaluates the query
+    psbackend.PromQLRollupBackend builds over the same synthetic data as StubMetricServiceClient.
+    Each active minute is one counter sample, stamped at the minute's end and grown by that minute's
+    rate; as in Prometheus, rate() over a range with fewer than two samples has no value (extrapolation
+    to the range edges is left out). Install it with psclient.configure(session_factory=StubPrometheusSession).
+    """
+
+    _QUERY = re.compile(r'max_over_time\(max\(rate\(([\w:]+)\{[^}]*instance_id="([^"]*)"\}\[(\d+)([sm])\]\)\)\[(\d+)s:1m\]\)')
+
+    def __init__(self, *args, **kwargs):
+        self.requests = []
+
+    @staticmethod
+    def _metric_type(promql_name: str) -> str:
+        import psbackend
+        import psregistry
+
+        for spec in psregistry.METRICS.values():
+            if psbackend.PromQLRollupBackend.promql_metric_name(spec.metric_type) == promql_name:
+                return spec.metric_type
+        raise ValueError(f"Unknown PromQL metric: {promql_name}")
+
+    def post(self, url: str, data: dict | None = None, **kwargs) -> _StubResponse:
+        self.requests.append(data)
+        match = self._QUERY.fullmatch(data["query"])
+        if match is None:
+            return _StubResponse({"status": "error", "errorType": "bad_data", "error": f"Unsupported stub query: {data['query']}"})
+        promql_name, instance_id, range_value, range_unit, subquery_seconds = match.groups()
+        metric_type = self._metric_type(promql_name)
+        range_seconds = int(range_value) * (60 if range_unit == "m" else 1)
+        step = int(data["step"].rstrip("s"))
+        rates = {}
+
+        def _rate(ts: int) -> float | None:
+            # Samples in (ts - range, ts]; the increase after the first one over the time they span.
+            samples = [minute for minute in range(ts, ts - range_seconds, -60) if StubMetricServiceClient.rate_at(metric_type, instance_id, minute) is not None]
+            if len(samples) < 2:
+                return None
+            increase = sum(StubMetricServiceClient.rate_at(metric_type, instance_id, minute) * 60 for minute in samples[:-1])
+            return increase / (samples[0] - samples[-1])
+
+        values = []
+        for evaluated_at in range(int(data["start"]), int(data["end"]) + 1, step):
+            # Subquery steps at whole minutes in (evaluated_at - subquery, evaluated_at].
+            last_step = evaluated_at - evaluated_at % 60
+            step_rates = []
+            for ts in range(last_step, evaluated_at - int(subquery_seconds), -60):
+                if ts not in rates:
+                    rates[ts] = _rate(ts)
+                if rates[ts] is not None:
+                    step_rates.append(rates[ts])
+            if step_rates:
+                values.append([evaluated_at, repr(max(step_rates))])
+        result = [{"metric": {"instance_id": instance_id}, "values": values}] if values else []
+        return _StubResponse({"status": "success", "data": {"resultType": "matrix", "result": result}})
+
+
+class ReplayMetricServiceClient:
+    """
+    Replays pre-serialized ListTimeSeries pages (one page per instance per day) for benchmarking.
+    Pages are built once, up front, from StubMetricServiceClient.rate_at and kept as wire-format bytes;
+    each request deserializes the pages it covers, so proto decoding is paid at fetch time just as with
+    the real gRPC client. Point values do not depend on the metric requested; each page is labelled with
+    the requested metric type(s) after decoding, so batched one_of requests return one series per type.
+    Pages on the edges of the request's (start, end] interval are trimmed to it, so time shards of one
+    request (psshard) together return each point once; .points_served counts the points handed out.
+    """
+
+    def __init__(self, instance_ids: list[str], first_day_ts: int, days: int):
+        self.instance_ids = list(instance_ids)
+        self.first_day_ts = first_day_ts - first_day_ts % 86400
+        self.days = days
+        self.requests = []
+        self.points_served = 0
+        self._lock = threading.Lock()
+        self._pages = {}
+        self._page_points = {}
+        series_pb = monitoring_v3.types.TimeSeries.pb()
+        response_pb = monitoring_v3.types.ListTimeSeriesResponse.pb()
+        for instance_id in self.instance_ids:
+            for day in range(days):
+                day_ts = self.first_day_ts + day * 86400
+                series = series_pb()
+                series.metric.type = "parallelstore.googleapis.com/instance/read_ops_count"
+                series.resource.type = "parallelstore.googleapis.com/Instance"
+                series.resource.labels["instance_id"] = instance_id
+                # Minute ends within [day 00:00:00, day 23:59:59], newest first like the API.
+                for ts in range(day_ts + 86340, day_ts - 1, -60):
+                    rate = StubMetricServiceClient.rate_at(series.metric.type, instance_id, ts)
+                    if rate is not None:
+                        point = series.points.add()
+                        point.interval.end_time.seconds = ts
+                        point.value.double_value = rate
+                response = response_pb()
+                response.time_series.append(series)
+                self._pages[(instance_id, day)] = response.SerializeToString()
+                self._page_points[(instance_id, day)] = len(series.points)
+
+    def point_count(self, instance_ids: list[str] | None = None) -> int:
+        instance_ids = self.instance_ids if instance_ids is None else instance_ids
+        return sum(points for (instance_id, _), points in self._page_points.items() if instance_id in instance_ids)
+
+    def list_time_series(self, request=None, **kwargs):
+        self.requests.append(request)
+        if 'resource.label.instance_id="' in request.filter:
+            instance_ids = [request.filter.split('resource.label.instance_id="', 1)[1].split('"', 1)[0]]
+        else:
+            instance_ids = self.instance_ids
+        start_ts = int(request.interval.start_time.timestamp())
+        end_ts = int(request.interval.end_time.timestamp())
+        first_day = max(0, (start_ts - self.first_day_ts) // 86400)
+        last_day = min(self.days - 1, (end_ts - self.first_day_ts) // 86400)
+        keys = [(instance_id, day) for instance_id in instance_ids for day in range(first_day, last_day + 1) if (instance_id, day) in self._pages]
+        metric_types = _filter_metric_types(request.filter)
+        # A generator, so pages are decoded one at a time as the caller walks them.
+        return _StubPager(self._decode_page(key, metric_type, start_ts, end_ts) for metric_type in metric_types for key in keys)
+
+    def _decode_page(self, key: tuple[str, int], metric_type: str, start_ts: int, end_ts: int) -> monitoring_v3.types.ListTimeSeriesResponse:
+        response = monitoring_v3.types.ListTimeSeriesResponse.pb()()
+        response.ParseFromString(self._pages[key])
+        series = response.time_series[0]
+        series.metric.type = metric_type
+        day_ts = self.first_day_ts + key[1] * 86400
+        if day_ts <= start_ts or day_ts + 86340 > end_ts:
+            # Points run newest first: drop the ones after end_ts from the front and those at or before start_ts from the back.
+            points = series.points
+            newest = 0
+            while newest < len(points) and points[newest].interval.end_time.seconds > end_ts:
+                newest += 1
+            oldest = len(points)
+            while oldest > newest and points[oldest - 1].interval.end_time.seconds <= start_ts:
+                oldest -= 1
+            del points[oldest:]
+            del points[:newest]
+        with self._lock:
+            self.points_served += len(series.points)
+        return monitoring_v3.types.ListTimeSeriesResponse.wrap(response)
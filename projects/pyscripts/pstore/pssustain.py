@@ -0,0 +1,153 @@
+from datetime import datetime, timezone
+
+import numpy as np
+
+ALIGNMENT_PERIOD_SECONDS = 60
+
+
+class SustainedStats:
+    """
+    How a 60-second rate series behaves against a threshold: the longest unbroken run of minutes at
+    or above it, the fraction of minutes with data that meet it, and the best N-minute rolling mean.
+    Timestamps are the end times of the first alignment period in each run/window.
+    """
+    __slots__ = (
+        "threshold", "window_minutes", "minutes_with_data", "minutes_meeting",
+        "longest_run_minutes", "longest_run_start", "best_window_mean", "best_window_start",
+    )
+
+    def __init__(self, threshold: float, window_minutes: int):
+        self.threshold = threshold
+        self.window_minutes = window_minutes
+        self.minutes_with_data = 0
+        self.minutes_meeting = 0
+        self.longest_run_minutes = 0
+        self.longest_run_start = None
+        self.best_window_mean = None
+        self.best_window_start = None
+
+    @property
+    def fraction_meeting(self) -> float | None:
+        return self.minutes_meeting / self.minutes_with_data if self.minutes_with_data else None
+
+    @property
+    def sustained(self) -> bool:
+        """True when the best full N-minute window averages at or above the threshold."""
+        return self.best_window_mean is not None and self.best_window_mean >= self.threshold
+
+    def as_dict(self) -> dict:
+        return {
+            "threshold": self.threshold,
+            "window_minutes": self.window_minutes,
+            "minutes_with_data": self.minutes_with_data,
+            "minutes_meeting": self.minutes_meeting,
+            "fraction_meeting": self.fraction_meeting,
+            "longest_run_minutes": self.longest_run_minutes,
+            "longest_run_start": self.longest_run_start.isoformat() if self.longest_run_start else None,
+            "best_window_mean": self.best_window_mean,
+            "best_window_start": self.best_window_start.isoformat() if self.best_window_start else None,
+            "sustained": self.sustained,
+        }
+
+    def __repr__(self):
+        return f"SustainedStats({self.as_dict()})"
+
+
+def to_minute_grid(timestamps: np.ndarray, values: np.ndarray, first_timestamp: int | None = None, slots: int | None = None) -> tuple[int | None, np.ndarray]:
+    """
+    Places points on a dense grid of alignment periods (NaN where a minute has no point, max where
+    a minute has several). Returns (timestamp of slot 0, grid). first_timestamp/slots pin the grid
+    so several series can share it.
+    """
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    if first_timestamp is None:
+        if timestamps.size == 0:
+            return None, np.empty(0, dtype=np.float64)
+        first_timestamp = int(timestamps.min())
+    index = (timestamps - first_timestamp) // ALIGNMENT_PERIOD_SECONDS
+    if slots is None:
+        slots = int(index.max()) + 1 if index.size else 0
+    grid = np.full(slots, np.nan)
+    inside = (index >= 0) & (index < slots)
+    np.fmax.at(grid, index[inside], values[inside])
+    return first_timestamp, grid
+
+
+def sum_minute_grids(series: list[tuple[np.ndarray, np.ndarray]]) -> tuple[int | None, np.ndarray]:
+    """
+    Adds several (timestamps, values) series minute by minute on a common grid, e.g. read + write rates.
+    A minute is NaN only when none of the series has a point for it.
+    """
+    non_empty = [(np.asarray(ts, dtype=np.int64), vals) for ts, vals in series if len(ts)]
+    if not non_empty:
+        return None, np.empty(0, dtype=np.float64)
+    first_timestamp = min(int(ts.min()) for ts, _ in non_empty)
+    last_timestamp = max(int(ts.max()) for ts, _ in non_empty)
+    slots = (last_timestamp - first_timestamp) // ALIGNMENT_PERIOD_SECONDS + 1
+    grids = [to_minute_grid(ts, vals, first_timestamp, slots)[1] for ts, vals in non_empty]
+    stacked = np.vstack(grids)
+    total = np.nansum(stacked, axis=0)
+    total[np.isnan(stacked).all(axis=0)] = np.nan
+    return first_timestamp, total
+
+
+def longest_run(mask: np.ndarray) -> tuple[int, int | None]:
+    """Length and start index of the longest run of True values (0, None when there is none)."""
+    if not mask.any():
+        return 0, None
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    lengths = np.flatnonzero(edges == -1) - starts
+    best = int(lengths.argmax())
+    return int(lengths[best]), int(starts[best])
+
+
+def best_rolling_mean(grid: np.ndarray, window: int) -> tuple[float | None, int | None]:
+    """
+    Highest mean over any `window` consecutive minutes that all have data, via prefix sums.
+    Returns (mean, start index), or (None, None) when no complete window exists.
+    """
+    if window < 1 or grid.size < window:
+        return None, None
+    present = ~np.isnan(grid)
+    sums = np.concatenate(([0.0], np.cumsum(np.where(present, grid, 0.0))))
+    counts = np.concatenate(([0], np.cumsum(present)))
+    window_sums = sums[window:] - sums[:-window]
+    complete = (counts[window:] - counts[:-window]) == window
+    if not complete.any():
+        return None, None
+    means = np.where(complete, window_sums / window, -np.inf)
+    best = int(means.argmax())
+    return float(means[best]), best
+
+
+def sustained_stats_from_grid(first_timestamp: int | None, grid: np.ndarray, threshold: float, window_minutes: int) -> SustainedStats:
+    stats = SustainedStats(threshold, window_minutes)
+    if first_timestamp is None or grid.size == 0:
+        return stats
+
+    def _slot_time(slot: int) -> datetime:
+        return datetime.fromtimestamp(first_timestamp + slot * ALIGNMENT_PERIOD_SECONDS, tz=timezone.utc)
+
+    present = ~np.isnan(grid)
+    # NaN >= threshold is False, so gaps break runs and never count as meeting the threshold.
+    with np.errstate(invalid="ignore"):
+        meeting = grid >= threshold
+    stats.minutes_with_data = int(present.sum())
+    stats.minutes_meeting = int(meeting.sum())
+    run_length, run_start = longest_run(meeting)
+    stats.longest_run_minutes = run_length
+    stats.longest_run_start = None if run_start is None else _slot_time(run_start)
+    best_mean, best_start = best_rolling_mean(grid, window_minutes)
+    stats.best_window_mean = best_mean
+    stats.best_window_start = None if best_start is None else _slot_time(best_start)
+    return stats
+
+
+def sustained_stats(timestamps: np.ndarray, values: np.ndarray, threshold: float, window_minutes: int) -> SustainedStats:
+    """
+    Sustained-threshold statistics for one 60-second rate series (as returned by psseries.fetch_metric_series).
+    """
+    first_timestamp, grid = to_minute_grid(timestamps, values)
+    return sustained_stats_from_grid(first_timestamp, grid, threshold, window_minutes)
@@ -1,9 +1,12 @@
 import time
 import logging
-from datetime import datetime, timezone, timedelta
+from datetime import datetime, timezone
 from google.cloud import monitoring_v3
 from google.cloud.monitoring_v3.services.metric_service import pagers
 import argparse
+import psclient
+import psregistry
+import psseries
 
 # --- Configuration Section ---
 # Removed hardcoded project_id and instance_id
@@ -37,7 +40,7 @@ def fetch_metric(
     It calculates the rate of the metric over 60-second intervals and returns the maximum
     rate observed within the specified query_start_time and query_end_time.
     """
-    client = monitoring_v3.MetricServiceClient()
+    client = psclient.get_metric_client(project_id_str)
     project_name = f"projects/{project_id_str}"
     start_time_seconds = int(query_start_time.timestamp())
     end_time_seconds = int(query_end_time.timestamp())
@@ -79,12 +82,14 @@ def fetch_metric(
         logger.error(f"Error fetching metric {metric_type} for {instance_id_str} over window {query_start_time.isoformat()} to {query_end_time.isoformat()}: {e}", exc_info=True)
         raise
 
-def log_daily_performance_over_period(start_date_overall: datetime, end_date_overall: datetime, project_id: str, instance_id: str):
+def log_daily_performance_over_period(start_date_overall: datetime, end_date_overall: datetime, project_id: str, instance_id: str, whole_period: bool = False, granularity: str = "day"):
     """
     Fetches and logs daily peak performance metrics (Read IOPS and Throughput)
     for the configured Parallelstore instance over a specified date range.
     It iterates day by day, queries metrics for each day, and logs the results.
     If no significant metrics are found for a day, detailed printing is skipped.
+    With whole_period=True each metric is fetched once for the entire range and bucketed
+    locally by `granularity` (hour, day or week) instead of issuing one query per day.
     """
     # Retrieve project and instance ID from the arguments.
     # project_id = CONFIG["parallelstore"]["project_id"] # Removed
@@ -93,8 +98,8 @@ def log_daily_performance_over_period(start_date_overall: datetime, end_date_ove
     EXPECTED_IOPS_PER_SECOND = 30000
     EXPECTED_THROUGHPUT_MBPS = 1150
 
-    read_iops_metric = "parallelstore.googleapis.com/instance/read_ops_count"
-    throughput_metric = "parallelstore.googleapis.com/instance/transferred_byte_count"
+    read_iops_metric = psregistry.METRICS["read_ops"].metric_type
+    throughput_metric = psregistry.METRICS["transferred_bytes"].metric_type
 
     logger.info(f"===================================================================================")
     logger.info(f"Fetching Daily Peak Performance for Parallelstore Instance: {instance_id}")
@@ -104,12 +109,24 @@ def log_daily_performance_over_period(start_date_overall: datetime, end_date_ove
 
     all_daily_results_summary = []
 
-    current_day_iterator = start_date_overall
-    while current_day_iterator <= end_date_overall:
-        day_start_time = datetime(current_day_iterator.year, current_day_iterator.month, current_day_iterator.day, 0, 0, 0, tzinfo=timezone.utc)
-        day_end_time = datetime(current_day_iterator.year, current_day_iterator.month, current_day_iterator.day, 23, 59, 59, tzinfo=timezone.utc)
+    windows = psseries.bucket_windows(start_date_overall, end_date_overall, granularity)
+    prefetched_read_iops = None
+    prefetched_throughput_bytes_sec = None
+    if whole_period:
+        try:
+            # Both metrics come back from one one_of request.
+            prefetched = psseries.fetch_bucketed_peaks_for_metrics([read_iops_metric, throughput_metric], project_id, instance_id, windows, granularity)
+            prefetched_read_iops = prefetched[read_iops_metric]
+            prefetched_throughput_bytes_sec = prefetched[throughput_metric]
+        except Exception as e:
+            logger.error(f"Error retrieving whole-period metrics for {start_date_overall.strftime('%Y-%m-%d')} to {end_date_overall.strftime('%Y-%m-%d')}: {e}", exc_info=True)
+            prefetched_read_iops = [None] * len(windows)
+            prefetched_throughput_bytes_sec = [None] * len(windows)
 
-        logger.info(f"--- Querying data for: {current_day_iterator.strftime('%Y-%m-%d')} ---")
+    for window_index, (day_start_time, day_end_time) in enumerate(windows):
+        window_label = psseries.bucket_label(day_start_time, granularity)
+
+        logger.info(f"--- Querying data for: {window_label} ---")
 
         daily_peak_read_iops = None
         daily_peak_throughput_mbps = None
@@ -118,19 +135,23 @@ def log_daily_performance_over_period(start_date_overall: datetime, end_date_ove
         day_met_throughput_benchmark = None
 
         try:
-            daily_peak_read_iops = fetch_metric(
-                read_iops_metric, project_id, instance_id, day_start_time, day_end_time
-            )
-            daily_throughput_bytes_sec = fetch_metric(
-                throughput_metric, project_id, instance_id, day_start_time, day_end_time
-            )
+            if whole_period:
+                daily_peak_read_iops = prefetched_read_iops[window_index]
+                daily_throughput_bytes_sec = prefetched_throughput_bytes_sec[window_index]
+            else:
+                daily_peak_read_iops = fetch_metric(
+                    read_iops_metric, project_id, instance_id, day_start_time, day_end_time
+                )
+                daily_throughput_bytes_sec = fetch_metric(
+                    throughput_metric, project_id, instance_id, day_start_time, day_end_time
+                )
             if daily_throughput_bytes_sec is not None:
                 daily_peak_throughput_mbps = daily_throughput_bytes_sec / (1000**2)
 
             if daily_peak_read_iops is None and daily_peak_throughput_mbps is None:
-                logger.info(f"No significant performance metrics (IOPS or Throughput) found for {current_day_iterator.strftime('%Y-%m-%d')}.")
+                logger.info(f"No significant performance metrics (IOPS or Throughput) found for {window_label}.")
             else:
-                logger.info(f"Results for {current_day_iterator.strftime('%Y-%m-%d')}:")
+                logger.info(f"Results for {window_label}:")
                 if daily_peak_read_iops is not None:
                     logger.info(f"  Peak Read IOPS (rate): {daily_peak_read_iops:.2f} ops/sec")
                     day_met_iops_benchmark = daily_peak_read_iops >= EXPECTED_IOPS_PER_SECOND
@@ -140,7 +161,7 @@ def log_daily_performance_over_period(start_date_overall: datetime, end_date_ove
                         logger.warning(f"    IOPS Benchmark (Expected >= {EXPECTED_IOPS_PER_SECOND} ops/sec): FAILED or BELOW THRESHOLD")
                 else:
                     logger.info(f"  Peak Read IOPS (rate): No data")
-                    logger.warning(f"    IOPS Benchmark: NO DATA for {current_day_iterator.strftime('%Y-%m-%d')}")
+                    logger.warning(f"    IOPS Benchmark: NO DATA for {window_label}")
 
                 if daily_peak_throughput_mbps is not None:
                     logger.info(f"  Peak Throughput (rate): {daily_peak_throughput_mbps:.2f} MBps")
@@ -151,20 +172,19 @@ def log_daily_performance_over_period(start_date_overall: datetime, end_date_ove
                         logger.warning(f"    Throughput Benchmark (Expected >= {EXPECTED_THROUGHPUT_MBPS} MBps): FAILED or BELOW THRESHOLD")
                 else:
                     logger.info(f"  Peak Throughput (rate): No data")
-                    logger.warning(f"    Throughput Benchmark: NO DATA for {current_day_iterator.strftime('%Y-%m-%d')}")
+                    logger.warning(f"    Throughput Benchmark: NO DATA for {window_label}")
 
         except Exception as e:
-            logger.error(f"Error retrieving or processing metrics for {current_day_iterator.strftime('%Y-%m-%d')}: {e}", exc_info=True)
+            logger.error(f"Error retrieving or processing metrics for {window_label}: {e}", exc_info=True)
         
         all_daily_results_summary.append({
-            "date": current_day_iterator.strftime('%Y-%m-%d'),
+            "date": window_label,
             "peak_read_iops_ops_sec": daily_peak_read_iops,
             "peak_throughput_mbps": daily_peak_throughput_mbps,
             "met_iops_benchmark": day_met_iops_benchmark,
             "met_throughput_benchmark": day_met_throughput_benchmark
         })
 
-        current_day_iterator += timedelta(days=1)
         logger.info("-----------------------------------------------------------------------------------")
 
     logger.info("===================================================================================")
@@ -226,7 +246,20 @@ if __name__ == "__main__":
         default=None,
         help="End date for the report (YYYY-MM-DD). If not provided, it will default to today's date in UTC.",
     )
+    parser.add_argument(
+        "--whole_period",
+        action="store_true",
+        help="Fetch each metric with one query for the whole date range and bucket the points locally instead of querying day by day.",
+    )
+    parser.add_argument(
+        "--granularity",
+        choices=sorted(psseries.GRANULARITY_SECONDS),
+        default="day",
+        help="Bucket size for --whole_period reports (default: day).",
+    )
     args = parser.parse_args()
+    if args.granularity != "day" and not args.whole_period:
+        parser.error("--granularity requires --whole_period.")
 
     try:
         period_start_date = datetime.strptime(args.start_date, "%Y-%m-%d").replace(tzinfo=timezone.utc)
@@ -246,7 +279,7 @@ if __name__ == "__main__":
         logger.error(f"Error: The specified start date ({period_start_date.strftime('%Y-%m-%d')}) is after the end date ({period_end_date.strftime('%Y-%m-%d')}). Please correct the dates. Use --start_date and --end_date arguments. Also check the project_id and instance_id arguments.")
         exit(1)
     try:
-        log_daily_performance_over_period(period_start_date, period_end_date, args.project_id, args.instance_id)
+        log_daily_performance_over_period(period_start_date, period_end_date, args.project_id, args.instance_id, args.whole_period, args.granularity)
     except Exception as e:
         logger.critical(f"An unhandled critical error occurred during the script execution: {e}", exc_info=True)
         logger.critical("Please check authentication, permissions, API enablement, and instance identifiers in the command line arguments.")